@@ -3,22 +3,27 @@
 Recognise audio files with Shazam, optionally rename or copy them,
 and update metadata (tags, cover art).
 
-OGG files are converted to WAV via soundfile/libsndfile (no ffmpeg),
-but if conversion or recognition on WAV fails, we fall back to the
-original OGG for recognition—so tests with DummyShazam still work.
+Only a short window of each file is decoded (see auto_tag.sampling) and
+sent to Shazam as in-memory WAV bytes via soundfile/libsndfile (no
+ffmpeg, no temp file). The original file is only sent when that window
+cannot be decoded.
 """
 
 from __future__ import annotations
 
 import asyncio
 import base64
+import functools
 import os
 import shutil
-import tempfile
-from urllib.request import urlopen
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import BrokenExecutor, Executor
+from typing import Iterable
 
 import eyed3
-import soundfile as sf
+import eyed3.id3.tag
 from mutagen import File
 from mutagen.flac import Picture
 from mutagen.oggopus import OggOpus
@@ -26,7 +31,32 @@ from mutagen.oggvorbis import OggVorbis
 from shazamio import Shazam
 from tqdm.asyncio import tqdm
 
-from auto_tag.utils import find_deepest_metadata_key, sanitize
+from auto_tag import metrics
+from auto_tag.cache import RecognitionCache, default_cache_dir
+from auto_tag.covers import fetch_cover, set_cover_cache_dir
+from auto_tag.destinations import DestinationIndex, first_free
+from auto_tag.discovery import AudioFileWalker
+from auto_tag.duplicates import DEFAULT_DUPLICATE_MODE, DuplicateGroups
+from auto_tag.journal import (JournalState, OperationJournal, journal_path,
+                              rotate_journals)
+from auto_tag.manifest import ScanManifest
+from auto_tag.pipeline import (DEFAULT_DECODE_WORKERS, DEFAULT_TAG_WORKERS,
+                               BoundedShazam, TagStage, decode_executor,
+                               run_timed)
+from auto_tag.plan import PlanWriter, read_plan
+from auto_tag.rate_limit import (DEFAULT_RATE, AdaptiveRateLimiter,
+                                 RateLimitedShazam)
+from auto_tag.retry import PendingRetry, RetryQueue, backoff_delay
+from auto_tag.sampling import SAMPLE_SECONDS, read_sample
+from auto_tag.signatures import (DEFAULT_ENGINE, LocalSignature,
+                                 generate_signature, signature_window)
+from auto_tag.utils import audio_hash, find_deepest_metadata_key, sanitize
+
+# Padding reserved whenever a tag no longer fits and the file has to be
+# rewritten, so that later retags (cover art included) are done in place.
+TAG_PADDING = 32 * 1024
+# eyed3 only reads this module constant when it has to rewrite a file.
+eyed3.id3.tag.DEFAULT_PADDING = TAG_PADDING
 
 
 async def find_and_recognize_audio_files(
@@ -40,46 +70,654 @@ async def find_and_recognize_audio_files(
     output_dir: str | None = None,
     plex_structure: bool = False,
     copy_to: str | None = None,
-) -> None:
+    concurrency: int = 1,
+    use_cache: bool = True,
+    refresh_cache: bool = False,
+    sample_offset: float | None = None,
+    sample_seconds: float = SAMPLE_SECONDS,
+    rate: float = DEFAULT_RATE,
+    full_scan: bool = False,
+    decode_workers: int = DEFAULT_DECODE_WORKERS,
+    tag_workers: int = DEFAULT_TAG_WORKERS,
+    engine: str = DEFAULT_ENGINE,
+    duplicates: str = DEFAULT_DUPLICATE_MODE,
+    resume: bool = False,
+    plan: str | None = None,
+    files: Iterable[str] | None = None,
+    destinations: DestinationIndex | None = None,
+    worker: int | None = None,
+    session: RunSession | None = None,
+) -> dict:
     """
     Walk folder_path, recognise each file, then move or copy/tag it.
+    Files are streamed from the walk as they are found, so recognition
+    starts before a large tree has been fully listed.
     copy_to, if given, is the base dir to copy files into (instead of moving).
+    concurrency is the number of Shazam recognitions allowed in flight at
+    once. Results are still renamed in discovery order, so name collisions
+    resolve the same way whatever order the recognitions finish in.
+    use_cache answers files already recognised on a previous run from the
+    on-disk RecognitionCache; refresh_cache ignores its entries but stores
+    the new answers. use_cache also keeps downloaded covers on disk.
+    sample_offset/sample_seconds choose the window of each file that is
+    decoded and sent to Shazam (see recognize_audio).
+    rate caps Shazam calls per second; the limiter backs off on its own
+    when errors or throttling spike (rate <= 0 disables it).
+    Files recorded as processed in the library's ScanManifest and left
+    unchanged since are skipped, unless full_scan is set.
+    Decoding and hashing run in a pool of decode_workers processes (0
+    keeps them on threads) and moves/tag writes on tag_workers threads,
+    so neither stalls the recognitions in flight.
+    engine picks how files are sent to Shazam (see recognize_audio).
+    Copies of the same audio are recognised once: with duplicates
+    "share" the answer is applied to every copy, "report" does the same
+    and lists the copies at the end, "skip" leaves the copies untouched
+    and lists them.
+    When modifying, every answer and file operation is written ahead to
+    the library's journal. resume continues an interrupted run from it:
+    journaled answers replace Shazam calls, operations cut short are
+    finished first and files already placed are skipped.
+    plan, a path, makes this a dry run that writes each result and its
+    destination to that file, for apply_plan() to carry out later.
+    files, destinations and worker are set by run_workers() for one shard
+    of a --workers run: the shard's paths (instead of walking folder_path),
+    the destination index shared by every worker, and the worker's
+    index, which places its progress bar and leaves the summary to the
+    parent. The summary is returned as a dict (see print_summary).
+    session, a RunSession opened by the caller, is used instead of opening
+    one for this run (and then it is the caller that prints the summary
+    and closes the session); the concurrency, rate, decode_workers,
+    use_cache, refresh_cache and resume options went into opening it.
     """
     exts = {e.lower().lstrip(".") for e in extensions}
-    audio_files: list[str] = []
+    walker = AudioFileWalker(folder_path, exts, paths=files)
+    planner = None
+    if plan is not None:
+        modify = False
+        planner = PlanWriter(plan, folder_path)
+    owned = session is None
+    if owned:
+        session = await RunSession.open(
+            folder_path,
+            modify=modify,
+            trace=trace,
+            concurrency=concurrency,
+            rate=rate,
+            decode_workers=decode_workers,
+            use_cache=use_cache,
+            refresh_cache=refresh_cache,
+            resume=resume,
+            worker=worker,
+        )
+    shazam, limiter = session.shazam, session.limiter
+    decoder, cache = session.decoder, session.cache
+    manifest, journal, state = session.manifest, session.journal, session.state
+    # reported by the first run of a session only
+    resumed, session.resumed = session.resumed, 0
+    # Files this session has written (or an interrupted run placed); a
+    # walk still in progress may reach the folders they were moved into
+    # and must not process them again.
+    produced = session.produced
+    skipped = 0
 
-    for root, _, files in os.walk(folder_path):
-        if "test" in os.path.basename(root).lower():
-            continue
-        for fn in files:
-            if os.path.splitext(fn)[1].lower().lstrip(".") in exts:
-                audio_files.append(os.path.join(root, fn))
+    concurrency = max(1, concurrency)
+    ok = rewrites = skipped_copies = 0
+    copies = DuplicateGroups()
+    if destinations is None:
+        destinations = DestinationIndex()
 
-    if not audio_files:
-        print(f"No files with extensions {exts} found in {folder_path}.")
-        return
+    retries = RetryQueue(delay=delay, nbr_retry=nbr_retry)
 
-    shazam = Shazam()
-    ok = 0
+    async def recognise(path: str) -> dict | None:
+        if state is not None:
+            out = state.answer(path)
+            if out is not None:
+                return out
+        key = await _audio_key(path, cache, trace, decoder)
+        if key is not None:
+            answer = copies.claim(key, path)
+            if answer is not None:
+                if duplicates == "skip":
+                    return {"duplicate_of": copies.groups[key][0]}
+                out = await answer
+                return dict(out) if out else out
+        out = None
+        try:
+            out = await recognize_audio(
+                path,
+                shazam=shazam,
+                delay=delay,
+                nbr_retry=1,  # failures go to the retry queue instead
+                trace=trace,
+                cache=cache,
+                sample_offset=sample_offset,
+                sample_seconds=sample_seconds,
+                executor=decoder,
+                engine=engine,
+                known_hash=key,
+            )
+            if journal is not None and out and "track" in out:
+                journal.recognized(path, out)
+            return out
+        finally:
+            if key is not None:
+                copies.resolve(key, out)
+
+    async def retry(item: PendingRetry) -> dict | None:
+        metrics.count("retries")
+        with metrics.timed("retry_wait", item.path):
+            await retries.wait(item)
+        return await recognise(item.path)
 
-    for path in tqdm(audio_files, desc="Recognising and renaming"):
-        res = await recognize_and_rename_file(
+    async def finish(
+        seq: int, path: str, out: dict | None, attempts: int
+    ) -> None:
+        nonlocal skipped_copies
+        if out is not None and "duplicate_of" in out:
+            if trace:
+                print(f"[{os.path.basename(path)}] duplicate, left as is")
+            skipped_copies += 1
+            started.pop(path, None)
+            bar.update(1)
+            return
+        if out is None and retries.defer(seq, path, attempts):
+            if trace:
+                print(f"[{os.path.basename(path)}] deferred for retry")
+            return
+        # Names are picked here, in discovery order; the write itself
+        # goes to the tag stage.
+        res = plan_rename(
             file_path=path,
-            shazam=shazam,
-            modify=modify,
-            delay=delay,
-            nbr_retry=nbr_retry,
+            out=out,
             trace=trace,
             output_dir=output_dir,
             plex_structure=plex_structure,
             copy_to=copy_to,
+            destinations=destinations,
         )
+        if "error" in res or not modify:
+            record(res)
+            return
+        produced.add(os.path.abspath(res["new_file_path"]))
+        await tags.put(res)
+
+    def written(planned: dict, res: dict) -> None:
+        if "error" not in res and not copy_to:
+            moved_from = planned["file_path"]
+            if moved_from != planned["new_file_path"]:
+                destinations.release(moved_from)
+        record(res)
+
+    def record(res: dict) -> None:
+        nonlocal ok, rewrites
+        path = res["file_path"]
+        if path in started:
+            since = started.pop(path)
+            metrics.observe("total", time.perf_counter() - since, path)
+        metrics.count("files_failed" if "error" in res else "files_ok")
         if "error" in res and trace:
-            print(f"[{os.path.basename(path)}] {res['error']}")
+            print(f"[{os.path.basename(res['file_path'])}] {res['error']}")
         if "error" not in res:
             ok += 1
+            rewrites += res.get("tag_rewrite", False)
+            if cache is not None and modify and res.get("audio_hash"):
+                # tags do not change the audio hash, so the new file is
+                # known to the cache without reading it again
+                cache.remember_hash(res["new_file_path"], res["audio_hash"])
+            if manifest is not None and modify:
+                manifest.record_result(res, copied=bool(copy_to))
+            if planner is not None:
+                planner.write(res, copied=bool(copy_to))
+        if limiter is not None:
+            bar.set_postfix_str(f"rate {limiter}", refresh=False)
+        bar.update(1)
+
+    # Recognitions run ahead in a bounded window, but are consumed from
+    # its head so renaming always happens in discovery order. Entries are
+    # (discovery index, path, attempt number, task).
+    pending: deque[tuple[int, str, int, asyncio.Task]] = deque()
+    window = 2 * (concurrency + max(1, decode_workers))
+    tags = TagStage(
+        functools.partial(
+            apply_rename, copied=bool(copy_to), trace=trace, journal=journal
+        ),
+        written,
+        workers=tag_workers,
+    )
+
+    if worker is None:
+        bar = tqdm(total=0, desc="Recognising and renaming")
+    else:
+        bar = tqdm(total=0, desc=f"Worker {worker + 1}", position=worker)
+    seq = 0  # files handed to recognition so far
+    started: dict[str, float] = {}  # path -> when recognition began
+
+    def grow_total() -> None:
+        # the total follows discovery until the walk is over
+        total = walker.found - skipped
+        if total != bar.total:
+            bar.total = total
+            bar.refresh()
+
+    async def finish_next() -> None:
+        seq, path, attempt, task = pending.popleft()
+        await finish(seq, path, await task, attempt)
+        grow_total()
+
+    paths = walker.stream()
+    tags.start()
+    try:
+        async for path in paths:
+            if os.path.abspath(path) in produced or (
+                manifest is not None
+                and not full_scan
+                and manifest.is_unchanged(path)
+            ):
+                skipped += 1
+                continue
+            grow_total()
+            started[path] = time.perf_counter()
+            task = asyncio.ensure_future(recognise(path))
+            pending.append((seq, path, 1, task))
+            seq += 1
+            if len(pending) >= window:
+                await finish_next()
+        while pending:
+            await finish_next()
+
+        # Drain deferred retries round by round; each file waits for its
+        # own backoff, and a round is renamed in discovery order. The
+        # window bounds a round too, so a whole failed batch is not
+        # decoded and held in memory at once.
+        while retries:
+            for item in retries.take():
+                if len(pending) >= window:
+                    await finish_next()
+                task = asyncio.ensure_future(retry(item))
+                pending.append((item.seq, item.path, item.attempts + 1, task))
+            while pending:
+                await finish_next()
+        await tags.join()
+        if journal is not None:
+            # a session stopped between two runs has nothing to resume
+            journal.finish()
+    finally:
+        await paths.aclose()
+        for *_, task in pending:
+            task.cancel()
+        await tags.close()
+        bar.close()
+        if owned:
+            session.close()
+        if planner is not None:
+            planner.close()
 
-    print(f"Succeeded {ok}/{len(audio_files)}.")
+    summary = {
+        "processed": seq - skipped_copies,
+        "succeeded": ok,
+        "duplicates": copies.count,
+        "resumed": resumed,
+        "rewrites": rewrites,
+        "skipped": skipped,
+        "cache_hits": cache.hits if cache is not None else None,
+        "cache_misses": cache.misses if cache is not None else None,
+    }
+    if worker is None and owned:
+        print_summary(
+            summary, modify=modify, folder_path=folder_path, extensions=exts
+        )
+    if duplicates != "share" and copies.count:
+        print("Duplicate audio (first file = copies):")
+        print(copies.report())
+    if limiter is not None and trace:
+        print("Rate limiter:", limiter.state())
+    if planner is not None and worker is None:
+        print(f"Planned {planner.entries} operation(s) in {plan}.")
+    return summary
+
+
+class RunSession:
+    """
+    What a run keeps open from start to end: the Shazam client (behind
+    the rate limiter and the concurrency slots), the decode pool, the
+    recognition cache, the library manifest and, when modifying, the
+    journal. find_and_recognize_audio_files() opens one per call; a
+    --watch run opens one for all its batches, so the limiter's backoff,
+    the decode processes and the journal outlive a batch.
+    """
+
+    def __init__(
+        self,
+        *,
+        shazam,
+        limiter: AdaptiveRateLimiter | None,
+        decoder: Executor | None,
+        cache: RecognitionCache | None,
+        manifest: ScanManifest | None,
+        journal: OperationJournal | None,
+        state: JournalState | None,
+        resumed: int = 0,
+    ) -> None:
+        self.shazam = shazam
+        self.limiter = limiter
+        self.decoder = decoder
+        self.cache = cache
+        self.manifest = manifest
+        self.journal = journal
+        self.state = state
+        # operations of an interrupted run finished when opening
+        self.resumed = resumed
+        # files the session wrote (or an interrupted run placed)
+        self.produced: set[str] = set()
+        if state is not None:
+            for src, dest in state.completed.items():
+                self.produced.update((src, dest))
+
+    @classmethod
+    async def open(
+        cls,
+        folder_path: str,
+        *,
+        modify: bool = True,
+        trace: bool = False,
+        concurrency: int = 1,
+        rate: float = DEFAULT_RATE,
+        decode_workers: int = DEFAULT_DECODE_WORKERS,
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+        resume: bool = False,
+        worker: int | None = None,
+    ) -> RunSession:
+        """
+        Open the session of a run over folder_path (see
+        find_and_recognize_audio_files for the options). When modifying,
+        the previous journal is set aside, or resumed from: its
+        interrupted operations are finished here.
+        """
+        # a run that changes nothing only reads the manifest
+        manifest = _open_manifest(folder_path, trace, readonly=not modify)
+        journal = state = None
+        if modify:
+            journal, state = _start_journal(
+                folder_path, worker=worker, resume=resume, trace=trace
+            )
+        resumed = 0
+        if state is not None and worker is None:
+            resumed = await _finish_interrupted(
+                state, journal, manifest, trace
+            )
+
+        concurrency = max(1, concurrency)
+        shazam = Shazam()
+        limiter = None
+        if rate > 0:
+            limiter = AdaptiveRateLimiter(rate, burst=concurrency)
+            shazam = RateLimitedShazam(shazam, limiter)
+        # the slots only cover the network call; decoding has its own pool
+        shazam = BoundedShazam(shazam, concurrency)
+        cache = None
+        if use_cache:
+            cache = RecognitionCache(refresh=refresh_cache)
+            set_cover_cache_dir(os.path.join(default_cache_dir(), "covers"))
+        return cls(
+            shazam=shazam,
+            limiter=limiter,
+            decoder=decode_executor(decode_workers),
+            cache=cache,
+            manifest=manifest,
+            journal=journal,
+            state=state,
+            resumed=resumed,
+        )
+
+    def close(self) -> None:
+        if self.decoder is not None:
+            self.decoder.shutdown(cancel_futures=True)
+        if self.cache is not None:
+            self.cache.close()
+        if self.manifest is not None:
+            self.manifest.close()
+        if self.journal is not None:
+            self.journal.close()
+
+
+async def apply_plan(
+    plan: str,
+    *,
+    trace: bool = False,
+    tag_workers: int = DEFAULT_TAG_WORKERS,
+) -> dict:
+    """
+    Carry out a plan written by find_and_recognize_audio_files(plan=...):
+    move or copy every file and write its tags, without calling Shazam.
+    A destination taken since the plan was made gets a " (n)" suffix;
+    files that are gone are skipped. Operations are journaled and the
+    library manifest updated, as in a modifying run.
+    """
+    header, entries = read_plan(plan)
+    library = header["library"]
+    manifest = _open_manifest(library, trace)
+    journal, _ = _start_journal(
+        library, worker=None, resume=False, trace=trace
+    )
+    destinations = DestinationIndex()
+    ok = rewrites = missing = 0
+
+    def written(planned: tuple[dict, bool], res: dict) -> None:
+        nonlocal ok, rewrites
+        if "error" in res:
+            if trace:
+                print(f"[{os.path.basename(res['file_path'])}] {res['error']}")
+        else:
+            ok += 1
+            rewrites += res.get("tag_rewrite", False)
+            if manifest is not None:
+                manifest.record_result(res, copied=planned[1])
+        bar.update(1)
+
+    tags = TagStage(
+        lambda item: apply_rename(
+            item[0], copied=item[1], trace=trace, journal=journal
+        ),
+        written,
+        workers=tag_workers,
+    )
+    bar = tqdm(total=len(entries), desc="Applying plan")
+    tags.start()
+    try:
+        for entry in entries:
+            copied = entry.pop("copy", False)
+            src = entry["file_path"]
+            if not os.path.exists(src):
+                missing += 1
+                bar.update(1)
+                continue
+            dest = entry["new_file_path"]
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            res = dict(
+                entry, new_file_path=destinations.allocate(dest, source=src)
+            )
+            await tags.put((res, copied))
+        await tags.join()
+        if journal is not None:
+            journal.finish()
+    finally:
+        await tags.close()
+        bar.close()
+        if manifest is not None:
+            manifest.close()
+        if journal is not None:
+            journal.close()
+
+    print(
+        f"Applied {ok}/{len(entries)} planned operation(s)."
+        f" Full rewrites: {rewrites}/{ok}."
+    )
+    if missing:
+        print(f"Skipped {missing} file(s) no longer at their planned source.")
+    return {
+        "processed": len(entries),
+        "succeeded": ok,
+        "rewrites": rewrites,
+        "missing": missing,
+    }
+
+
+def print_summary(
+    summary: dict,
+    *,
+    modify: bool,
+    folder_path: str,
+    extensions: Iterable[str],
+) -> None:
+    """Print a run summary, as returned by find_and_recognize_audio_files."""
+    if summary.get("resumed"):
+        print(f"Finished {summary['resumed']} interrupted operation(s).")
+    if summary["skipped"]:
+        print(
+            f"Skipped {summary['skipped']} unchanged file(s);"
+            " use --full to process them again."
+        )
+    if not summary["processed"]:
+        print(
+            f"No new files with extensions {set(extensions)} found in"
+            f" {folder_path}."
+        )
+        return
+
+    ok = summary["succeeded"]
+    line = f"Succeeded {ok}/{summary['processed']}."
+    if modify:
+        line += f" Full rewrites: {summary['rewrites']}/{ok}."
+    if summary.get("duplicates"):
+        line += f" Duplicates: {summary['duplicates']}."
+    if summary["cache_hits"] is not None:
+        line += (
+            f" Cache: {summary['cache_hits']} hits,"
+            f" {summary['cache_misses']} misses."
+        )
+    print(line)
+
+
+def _start_journal(
+    folder_path: str, *, worker: int | None, resume: bool, trace: bool
+) -> tuple[OperationJournal | None, JournalState | None]:
+    """
+    Open the run's journal, with the state of the previous run when
+    resuming; otherwise the previous journal is set aside (by the parent
+    process in a --workers run). A read-only library has no journal.
+    """
+    try:
+        state = None
+        if resume:
+            state = JournalState.load(folder_path)
+        elif worker is None and rotate_journals(folder_path):
+            print(
+                "The previous run did not finish; its journal was set aside"
+                " (next time, use --resume to continue such a run)."
+            )
+        return OperationJournal(journal_path(folder_path, worker)), state
+    except OSError as exc:
+        if trace:
+            print(f"No journal for {folder_path}: {exc}")
+        return None, None
+
+
+async def prepare_journal(
+    folder_path: str, *, resume: bool, trace: bool = False
+) -> int:
+    """
+    Parent side of a --workers run: set the previous run's journal aside
+    or, when resuming, finish its interrupted operations before the
+    workers start. Returns how many operations were finished.
+    """
+    journal, state = _start_journal(
+        folder_path, worker=None, resume=resume, trace=trace
+    )
+    if journal is None:
+        return 0
+    manifest = _open_manifest(folder_path, trace) if state else None
+    try:
+        if state is None:
+            return 0
+        return await _finish_interrupted(state, journal, manifest, trace)
+    finally:
+        journal.finish()
+        journal.close()
+        if manifest is not None:
+            manifest.close()
+
+
+async def _finish_interrupted(
+    state: JournalState,
+    journal: OperationJournal | None,
+    manifest: ScanManifest | None,
+    trace: bool,
+) -> int:
+    """
+    Complete the moves/copies and tag writes an interrupted run announced
+    but did not finish, and return how many were completed.
+    """
+    done = await asyncio.to_thread(
+        finish_interrupted, state, journal=journal, trace=trace
+    )
+    for res, copied in done:
+        if manifest is not None:
+            manifest.record_result(res, copied=copied)
+    return len(done)
+
+
+def finish_interrupted(
+    state: JournalState,
+    *,
+    journal: OperationJournal | None = None,
+    trace: bool = False,
+) -> list[tuple[dict, bool]]:
+    """
+    Redo the pending operations of a journal: a copy is made again, a
+    move is made if it did not happen, and the tags of a moved file are
+    written again. An operation that can no longer be made (its source
+    is gone) is dropped; a source still in place is left to the normal
+    pass when its destination is taken. Completed operations are added
+    to state.completed; returns their (result, copied) pairs.
+    """
+    done = []
+    for src, entry in list(state.pending.items()):
+        res, copied = entry["res"], entry["copy"]
+        dest = res["new_file_path"]
+        if copied or not os.path.exists(dest):
+            if not os.path.exists(src):
+                continue
+            out = apply_rename(
+                res, copied=copied, trace=trace, journal=journal
+            )
+        elif not os.path.exists(src):
+            out = apply_rename(res, trace=trace, journal=journal, moved=True)
+        else:
+            continue
+        if "error" in out:
+            if trace:
+                print(f"[{os.path.basename(src)}] {out['error']}")
+            continue
+        del state.pending[src]
+        state.completed[src] = dest
+        done.append((out, copied))
+    return done
+
+
+def _open_manifest(
+    folder_path: str, trace: bool, *, readonly: bool = False
+) -> ScanManifest | None:
+    """
+    Open the library's manifest; a read-only library simply has none, and
+    neither has one never processed when readonly is set.
+    """
+    try:
+        return ScanManifest(folder_path, readonly=readonly)
+    except (OSError, sqlite3.Error) as exc:
+        if trace:
+            print(f"No scan manifest for {folder_path}: {exc}")
+        return None
 
 
 async def recognize_and_rename_file(
@@ -93,66 +731,284 @@ async def recognize_and_rename_file(
     output_dir: str | None,
     plex_structure: bool,
     copy_to: str | None = None,
+    cache: RecognitionCache | None = None,
+    destinations: DestinationIndex | None = None,
 ) -> dict:
     """
     Recognise file_path with Shazam, then move or copy & tag it.
     - If copy_to is set, the file is **copied** to that directory (with or
       without Plex subfolders) and the original remains untouched.
     - Otherwise it is **moved** (renamed) in place or under the output_dir.
+    - If cache is given, a cached answer replaces the Shazam call.
+    - Callers handling many files pass one destinations index for all
+      of them (see plan_rename).
     """
-    ext = os.path.splitext(file_path)[1].lower()
-    tmp_wav: str | None = None
+    out = await recognize_audio(
+        file_path,
+        shazam=shazam,
+        delay=delay,
+        nbr_retry=nbr_retry,
+        trace=trace,
+        cache=cache,
+    )
+    return rename_recognized_file(
+        file_path=file_path,
+        out=out,
+        modify=modify,
+        trace=trace,
+        output_dir=output_dir,
+        plex_structure=plex_structure,
+        copy_to=copy_to,
+        destinations=destinations,
+    )
+
+
+async def recognize_audio(
+    file_path: str,
+    *,
+    shazam: Shazam,
+    delay: int,
+    nbr_retry: int,
+    trace: bool,
+    cache: RecognitionCache | None = None,
+    sample_offset: float | None = None,
+    sample_seconds: float = SAMPLE_SECONDS,
+    executor: Executor | None = None,
+    engine: str = DEFAULT_ENGINE,
+    known_hash: str | None = None,
+) -> dict | None:
+    """
+    Run Shazam on file_path and return its raw answer, or None if every
+    attempt failed. Up to nbr_retry attempts are made, sleeping an
+    exponential, jittered backoff based on delay in between; the batch
+    driver passes nbr_retry=1 and defers failures to a RetryQueue.
+    Shazam is given a sample_seconds window starting sample_offset seconds
+    in (centred when None); sample_seconds <= 0 sends the whole file.
+    With a cache, the answer is looked up by audio hash first and stored
+    after a successful recognition; the hash is kept under "audio_hash".
+    Decoding and hashing run on executor (the loop's default thread pool
+    when None); the batch driver passes its decode process pool.
+    engine "signature" computes the window's signature on executor and
+    sends only that; signatures are cached too, so a retry or a later
+    run does not decode the file again.
+    known_hash is the audio hash of file_path when the caller has it.
+    """
+    key = known_hash
+    if cache is not None:
+        if key is None:
+            key = await _audio_key(file_path, cache, trace, executor)
+        track = cache.get(key) if key else None
+        if track is not None:
+            return {"track": track, "audio_hash": key}
 
-    # 1) For OGG, try to convert to WAV first
-    input_path = file_path
-    if ext == ".ogg":
-        fd, tmp_wav = tempfile.mkstemp(suffix=".wav")
-        os.close(fd)
+    # 1) Decode a short mono window to in-memory WAV bytes, or sign it
+    data: str | bytes | LocalSignature = file_path
+    once = _recognize_once
+    if engine == "signature":
+        data = await _signature(
+            file_path,
+            cache=cache,
+            key=key,
+            executor=executor,
+            offset=sample_offset,
+            seconds=sample_seconds,
+            trace=trace,
+        )
+        if data is None:
+            return None
+        once = _send_signature
+    elif sample_seconds > 0:
         try:
-            data, sr = sf.read(file_path, dtype="int16")
-            sf.write(tmp_wav, data, sr, subtype="PCM_16")
-            input_path = tmp_wav
+            data = await run_timed(
+                executor,
+                "decode",
+                file_path,
+                read_sample,
+                file_path,
+                offset=sample_offset,
+                seconds=sample_seconds,
+            )
         except Exception as exc:
             if trace:
-                print(f"[{os.path.basename(file_path)}] OGG→WAV failed: {exc}")
-            input_path = file_path  # fallback
+                print(
+                    f"[{os.path.basename(file_path)}] sampling failed: {exc}"
+                )
+            data = file_path  # fallback
 
-    # 2) Recognise with retries
+    # 2) Recognise; standalone callers may retry inline with backoff
     out = None
     for attempt in range(1, nbr_retry + 1):
+        out = await once(shazam, data, file_path, attempt, trace)
+        if out:
+            break
+        if attempt < nbr_retry:
+            metrics.count("retries")
+            with metrics.timed("retry_wait", file_path):
+                await asyncio.sleep(backoff_delay(attempt, delay))
+
+    if key and out and "track" in out:
+        if cache is not None:
+            cache.put(key, out["track"])
+        out["audio_hash"] = key
+    return out
+
+
+async def _recognize_once(
+    shazam: Shazam,
+    data: str | bytes,
+    file_path: str,
+    attempt: int,
+    trace: bool,
+) -> dict | None:
+    """
+    One recognition attempt sending data: the decoded sample, or the
+    whole file when no sample could be made.
+    """
+    try:
+        with metrics.for_file(file_path), _shazam_timer():
+            return await shazam.recognize(data) or None
+    except Exception as exc:
+        if trace:
+            kind = "file" if data is file_path else "sample"
+            print(
+                f"[{os.path.basename(file_path)}] attempt {attempt}"
+                f" ({kind}): {exc}"
+            )
+    return None
+
+
+def _shazam_timer():
+    # The waits for a concurrency slot and a rate limiter token inside
+    # the call are stages of their own, not Shazam's time.
+    return metrics.timed("shazam", exclude=("shazam_queue", "rate_wait"))
+
+
+async def _send_signature(
+    shazam: Shazam,
+    sig: LocalSignature,
+    file_path: str,
+    attempt: int,
+    trace: bool,
+) -> dict | None:
+    """One recognition attempt sending only a local signature."""
+    try:
+        with metrics.for_file(file_path), _shazam_timer():
+            return await shazam.send_recognize_request_v2(sig) or None
+    except Exception as exc:
+        if trace:
+            print(
+                f"[{os.path.basename(file_path)}] attempt {attempt}"
+                f" (signature): {exc}"
+            )
+    return None
+
+
+async def _signature(
+    file_path: str,
+    *,
+    cache: RecognitionCache | None,
+    key: str | None,
+    executor: Executor | None,
+    offset: float | None,
+    seconds: float,
+    trace: bool,
+) -> LocalSignature | None:
+    """Return the cached signature of file_path, or compute and store it."""
+    window = signature_window(offset, seconds)
+    if cache is not None and key:
+        row = cache.get_signature(key, window)
+        if row is not None:
+            return LocalSignature(*row)
+    try:
+        sig = await run_timed(
+            executor,
+            "decode",
+            file_path,
+            generate_signature,
+            file_path,
+            offset=offset,
+            seconds=seconds,
+        )
+    except Exception as exc:
+        if trace:
+            print(f"[{os.path.basename(file_path)}] signature failed: {exc}")
+        return None
+    if cache is not None and key:
+        cache.put_signature(key, window, sig.uri, sig.samples)
+    return sig
+
+
+async def _audio_key(
+    file_path: str,
+    cache: RecognitionCache | None,
+    trace: bool,
+    executor: Executor | None = None,
+) -> str | None:
+    """
+    Return the audio hash of file_path, hashing it off the event loop
+    unless the cache knows it already.
+    """
+    key = cache.known_hash(file_path) if cache is not None else None
+    if key is None:
         try:
-            candidate = await shazam.recognize(input_path)
-            if candidate:
-                out = candidate
-                break
-        except Exception as exc:
+            key = await run_timed(
+                executor, "hash", file_path, audio_hash, file_path
+            )
+        except (OSError, BrokenExecutor) as exc:
             if trace:
-                print(
-                    f"[{os.path.basename(file_path)}] attempt {attempt}: {exc}"
-                )
-        if attempt < nbr_retry:
-            await asyncio.sleep(delay)
-
-    # Fallback for OGG if WAV recognition failed
-    if ext == ".ogg" and out is None and input_path != file_path:
-        for attempt in range(1, nbr_retry + 1):
-            try:
-                candidate = await shazam.recognize(file_path)
-                if candidate:
-                    out = candidate
-                    break
-            except Exception as exc:
-                if trace:
-                    print(
-                        f"[{os.path.basename(file_path)}] OGG fallback"
-                        f" attempt {attempt}: {exc}"
-                    )
-            if attempt < nbr_retry:
-                await asyncio.sleep(delay)
-
-    # cleanup
-    if tmp_wav and os.path.exists(tmp_wav):
-        os.remove(tmp_wav)
+                print(f"[{os.path.basename(file_path)}] hash failed: {exc}")
+            return None
+        if cache is not None:
+            cache.remember_hash(file_path, key)
+    return key
+
+
+def rename_recognized_file(
+    *,
+    file_path: str,
+    out: dict | None,
+    modify: bool,
+    trace: bool,
+    output_dir: str | None,
+    plex_structure: bool,
+    copy_to: str | None = None,
+    destinations: DestinationIndex | None = None,
+) -> dict:
+    """
+    Turn a Shazam answer for file_path into its new name, then move or
+    copy & tag the file when modify is set.
+    """
+    res = plan_rename(
+        file_path=file_path,
+        out=out,
+        trace=trace,
+        output_dir=output_dir,
+        plex_structure=plex_structure,
+        copy_to=copy_to,
+        destinations=destinations,
+    )
+    if modify and "error" not in res:
+        res = apply_rename(res, copied=bool(copy_to), trace=trace)
+    return res
+
+
+def plan_rename(
+    *,
+    file_path: str,
+    out: dict | None,
+    trace: bool,
+    output_dir: str | None,
+    plex_structure: bool,
+    copy_to: str | None = None,
+    destinations: DestinationIndex | None = None,
+) -> dict:
+    """
+    Steps 3-6 of a rename: pick the new, unique path of file_path without
+    touching the file. The name is allocated from destinations, so names
+    can be handed out ahead of writes still in flight without probing
+    the disk for every candidate; without one, the candidates are probed.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
 
     if not out or "track" not in out:
         if trace:
@@ -184,33 +1040,12 @@ async def recognize_and_rename_file(
 
     # 6) Ensure uniqueness
     new_path = os.path.join(root_dir, new_name)
-    count = 1
-    while os.path.exists(new_path) and new_path != file_path:
-        stem, e2 = os.path.splitext(new_path)
-        new_path = f"{stem} ({count}){e2}"
-        count += 1
-
-    # 7) Move or copy & tag
-    if modify:
-        try:
-            if copy_to:
-                shutil.copy2(file_path, new_path)
-            else:
-                os.rename(file_path, new_path)
-
-            if ext == ".mp3":
-                update_mp3_tags(new_path, s_title, s_artist, s_album)
-                if cover:
-                    update_mp3_cover_art(new_path, cover, trace)
-            else:  # .ogg
-                update_ogg_tags(
-                    new_path, s_title, s_artist, s_album, cover, trace
-                )
-
-        except Exception as exc:
-            return {"file_path": file_path, "error": f"Tag error: {exc}"}
+    if destinations is None:
+        new_path = first_free(new_path, source=file_path)
+    else:
+        new_path = destinations.allocate(new_path, source=file_path)
 
-    return {
+    res = {
         "file_path": file_path,
         "new_file_path": new_path,
         "title": s_title,
@@ -218,33 +1053,118 @@ async def recognize_and_rename_file(
         "album": s_album,
         "cover_link": cover,
     }
+    if out.get("audio_hash"):
+        res["audio_hash"] = out["audio_hash"]
+    return res
 
 
-def update_mp3_cover_art(file_path: str, cover_url: str, trace: bool) -> None:
-    if not cover_url:
-        if trace:
-            print("No cover art:", file_path)
-        return
-    audio = eyed3.load(file_path)
-    if audio.tag is None:
-        audio.initTag()
-    img = urlopen(cover_url).read()
-    audio.tag.images.set(3, img, "image/jpeg", "cover")
-    audio.tag.save()
+def apply_rename(
+    res: dict,
+    *,
+    copied: bool = False,
+    trace: bool = False,
+    journal: OperationJournal | None = None,
+    moved: bool = False,
+) -> dict:
+    """
+    Step 7 of a rename: move (or copy, when copied) the file planned by
+    plan_rename() and write its tags; with moved, the file is already in
+    place and only the tags are written. Each step is recorded in
+    journal, the move announced (and synced) before it is made. Blocking;
+    the batch driver runs it on its tag thread pool.
+    """
+    file_path, new_path = res["file_path"], res["new_file_path"]
+    with metrics.for_file(file_path):
+        try:
+            if not moved:
+                if journal is not None:
+                    journal.planned(res, copied=copied)
+                with metrics.timed("move"):
+                    if copied:
+                        shutil.copy2(file_path, new_path)
+                    else:
+                        os.rename(file_path, new_path)
+                if journal is not None:
+                    journal.moved(res)
+
+            with metrics.timed("tag_write", exclude=("cover",)):
+                rewritten = write_tags(
+                    new_path,
+                    res["title"],
+                    res["author"],
+                    res["album"],
+                    res["cover_link"],
+                    trace,
+                )
+
+        except Exception as exc:
+            return {"file_path": file_path, "error": f"Tag error: {exc}"}
+    res = dict(res, tag_rewrite=rewritten)
+    if journal is not None:
+        journal.tagged(res)
+    return res
+
+
+def write_tags(
+    file_path: str,
+    title: str,
+    artist: str,
+    album: str,
+    cover_url: str,
+    trace: bool,
+) -> bool:
+    """
+    Write title, artist, album and cover of file_path in a single parse
+    and a single save, whatever its format.
+    Tags are updated in place when they fit in the existing padding;
+    returns True if the whole file had to be rewritten instead.
+    """
+    if os.path.splitext(file_path)[1].lower() == ".mp3":
+        writer = update_mp3_tags
+    else:  # .ogg
+        writer = update_ogg_tags
+    rewritten = bool(
+        writer(file_path, title, artist, album, cover_url, trace)
+    )
+    if rewritten and trace:
+        print("Tags did not fit, file rewritten:", file_path)
+    return rewritten
 
 
 def update_mp3_tags(
-    file_path: str, title: str, artist: str, album: str
-) -> None:
+    file_path: str,
+    title: str,
+    artist: str,
+    album: str,
+    cover_url: str = "",
+    trace: bool = False,
+) -> bool:
+    """Returns True if the tag outgrew its padding (file rewritten)."""
     audio = eyed3.load(file_path)
     if not audio:
-        return
+        return False
     if audio.tag is None:
         audio.initTag()
+    old_size = audio.tag.file_info.tag_size
     audio.tag.title = title
     audio.tag.artist = artist
     audio.tag.album = album
+
+    # Cover goes into the same save, so the file is rewritten only once
+    if cover_url:
+        try:
+            with metrics.timed("cover"):
+                img = fetch_cover(cover_url)
+            audio.tag.images.set(3, img, "image/jpeg", "cover")
+        except Exception as exc:
+            if trace:
+                print("Cover art error:", exc)
+    elif trace:
+        print("No cover art:", file_path)
+
     audio.tag.save()
+    # an in-place update keeps the tag (plus padding) at the same size
+    return audio.tag.file_info.tag_size != old_size
 
 
 def update_ogg_tags(
@@ -254,7 +1174,8 @@ def update_ogg_tags(
     album: str,
     cover_url: str,
     trace: bool,
-) -> None:
+) -> bool:
+    """Returns True if the comments outgrew their padding (file rewritten)."""
     # Try Vorbis, then Opus, then generic
     try:
         audio = OggVorbis(file_path)
@@ -273,7 +1194,8 @@ def update_ogg_tags(
 
     if cover_url:
         try:
-            img = urlopen(cover_url).read()
+            with metrics.timed("cover"):
+                img = fetch_cover(cover_url)
             pic = Picture()
             pic.data = img
             pic.type = 3
@@ -287,4 +1209,16 @@ def update_ogg_tags(
     elif trace:
         print("No cover art for OGG:", file_path)
 
-    audio.save()
\ No newline at end of file
+    rewritten = False
+
+    def padding(info) -> int:
+        # Keep whatever padding is left (mutagen would shrink "excess"
+        # padding, which moves all audio data); reserve more on overflow.
+        nonlocal rewritten
+        if info.padding >= 0:
+            return info.padding
+        rewritten = True
+        return TAG_PADDING
+
+    audio.save(padding=padding)
+    return rewritten
\ No newline at end of file
@@ -0,0 +1,236 @@
+# auto_tag/cache.py
+"""
+Persistent Shazam recognition cache.
+
+Raw `track` payloads are stored in SQLite, keyed by a hash of the audio
+payload (see utils.audio_hash), so a file that was recognised on an
+earlier run - even if it has since been renamed or retagged - does not
+cost another network call. Locally computed signatures (see
+auto_tag.signatures) are kept the same way, so a file that still has to
+be sent to Shazam need not be decoded again.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import sys
+import time
+
+DEFAULT_TTL_DAYS = 90
+DEFAULT_MAX_ENTRIES = 200_000
+
+
+def default_cache_dir() -> str:
+    """Return the per-user cache directory of the application."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(
+            "~/.cache"
+        )
+    return os.path.join(base, "mp3ShazamAutoTag")
+
+
+class RecognitionCache:
+    """
+    SQLite store of Shazam answers keyed by audio hash.
+
+    Entries older than ttl_days are dropped when the cache is opened, and
+    the least recently used ones are evicted once max_entries is exceeded;
+    the file hashes remembered for that audio are dropped with them.
+    With refresh=True lookups always miss but answers are still stored,
+    which rebuilds the cache from fresh recognitions.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        *,
+        ttl_days: float = DEFAULT_TTL_DAYS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        refresh: bool = False,
+    ) -> None:
+        if path is None:
+            path = os.path.join(default_cache_dir(), "recognitions.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS recognitions (
+                audio_hash TEXT PRIMARY KEY,
+                track      TEXT NOT NULL,
+                stored_at  REAL NOT NULL,
+                used_at    REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS recognitions_used_at
+                ON recognitions (used_at);
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path       TEXT PRIMARY KEY,
+                size       INTEGER NOT NULL,
+                mtime_ns   INTEGER NOT NULL,
+                audio_hash TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS file_hashes_audio_hash
+                ON file_hashes (audio_hash);
+            CREATE TABLE IF NOT EXISTS signatures (
+                audio_hash TEXT NOT NULL,
+                window     TEXT NOT NULL,
+                uri        TEXT NOT NULL,
+                samples    INTEGER NOT NULL,
+                stored_at  REAL NOT NULL,
+                PRIMARY KEY (audio_hash, window)
+            );
+            """
+        )
+        for table in ("recognitions", "signatures"):
+            self._db.execute(
+                f"DELETE FROM {table} WHERE stored_at < ?",
+                (time.time() - self.ttl,),
+            )
+        self._drop_stale_hashes()
+        self._db.commit()
+        (self._count,) = self._db.execute(
+            "SELECT COUNT(*) FROM recognitions"
+        ).fetchone()
+        (self._signature_count,) = self._db.execute(
+            "SELECT COUNT(*) FROM signatures"
+        ).fetchone()
+
+    # -- audio hashes ---------------------------------------------------
+    def known_hash(self, file_path: str) -> str | None:
+        """Return the remembered hash of file_path if it is unchanged."""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        row = self._db.execute(
+            "SELECT audio_hash FROM file_hashes"
+            " WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (os.path.abspath(file_path), st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        return row[0] if row else None
+
+    def remember_hash(self, file_path: str, audio_hash: str) -> None:
+        """Remember audio_hash for the current size/mtime of file_path."""
+        st = os.stat(file_path)
+        self._db.execute(
+            "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+            (
+                os.path.abspath(file_path),
+                st.st_size,
+                st.st_mtime_ns,
+                audio_hash,
+            ),
+        )
+        self._db.commit()
+
+    # -- recognitions ---------------------------------------------------
+    def get(self, audio_hash: str) -> dict | None:
+        """Return the cached `track` payload for audio_hash, if any."""
+        row = None
+        if not self.refresh:
+            row = self._db.execute(
+                "SELECT track, stored_at FROM recognitions"
+                " WHERE audio_hash = ?",
+                (audio_hash,),
+            ).fetchone()
+        now = time.time()
+        if row is None or row[1] < now - self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._db.execute(
+            "UPDATE recognitions SET used_at = ? WHERE audio_hash = ?",
+            (now, audio_hash),
+        )
+        self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, audio_hash: str, track: dict) -> None:
+        """Store the `track` payload Shazam returned for audio_hash."""
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO recognitions VALUES (?, ?, ?, ?)",
+            (audio_hash, json.dumps(track), now, now),
+        )
+        self._count += 1  # upper bound, made exact by _evict
+        if self._count > self.max_entries:
+            self._evict()
+        self._db.commit()
+
+    def _evict(self) -> None:
+        (self._count,) = self._db.execute(
+            "SELECT COUNT(*) FROM recognitions"
+        ).fetchone()
+        if self._count <= self.max_entries:
+            return
+        # Trim to 90% so eviction does not run again on the next insert.
+        keep = int(self.max_entries * 0.9)
+        self._db.execute(
+            "DELETE FROM recognitions WHERE audio_hash IN ("
+            " SELECT audio_hash FROM recognitions"
+            " ORDER BY used_at, rowid LIMIT ?)",
+            (self._count - keep,),
+        )
+        self._count = keep
+        self._drop_stale_hashes()
+
+    def _drop_stale_hashes(self) -> None:
+        # A path's hash is only worth keeping while a recognition or a
+        # signature of that audio is; the rest would pile up forever.
+        self._db.execute(
+            "DELETE FROM file_hashes WHERE audio_hash NOT IN"
+            " (SELECT audio_hash FROM recognitions)"
+            " AND audio_hash NOT IN (SELECT audio_hash FROM signatures)"
+        )
+
+    # -- signatures -----------------------------------------------------
+    def get_signature(
+        self, audio_hash: str, window: str
+    ) -> tuple[str, int] | None:
+        """Return the (uri, samples) signature stored for this window."""
+        return self._db.execute(
+            "SELECT uri, samples FROM signatures"
+            " WHERE audio_hash = ? AND window = ?",
+            (audio_hash, window),
+        ).fetchone()
+
+    def put_signature(
+        self, audio_hash: str, window: str, uri: str, samples: int
+    ) -> None:
+        """Store the signature computed for a sample window of the audio."""
+        self._db.execute(
+            "INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?, ?)",
+            (audio_hash, window, uri, samples, time.time()),
+        )
+        self._signature_count += 1
+        if self._signature_count > self.max_entries:
+            (self._signature_count,) = self._db.execute(
+                "SELECT COUNT(*) FROM signatures"
+            ).fetchone()
+            if self._signature_count > self.max_entries:
+                keep = int(self.max_entries * 0.9)
+                # oldest first; a signature is only needed until the
+                # recognition itself is cached
+                self._db.execute(
+                    "DELETE FROM signatures WHERE rowid IN ("
+                    " SELECT rowid FROM signatures"
+                    " ORDER BY stored_at LIMIT ?)",
+                    (self._signature_count - keep,),
+                )
+                self._signature_count = keep
+                self._drop_stale_hashes()
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,186 @@
+# auto_tag/covers.py
+"""
+Cover-art downloads, fetched once per library.
+
+Every track of an album points at the same cover URL, so CoverFetcher
+keeps recent covers in an in-memory LRU (optionally backed by a
+directory on disk), reuses keep-alive HTTP connections per host and
+lets concurrent requests for one URL share a single download.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import http.client
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urljoin, urlsplit
+
+MAX_REDIRECTS = 5
+
+
+class CoverFetcher:
+    """Thread-safe, caching downloader for cover images."""
+
+    def __init__(
+        self,
+        *,
+        max_items: int = 256,
+        cache_dir: str | None = None,
+        timeout: float = 30,
+    ) -> None:
+        self.max_items = max_items
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.downloads = 0  # network fetches actually made
+        self._lru: OrderedDict[str, bytes] = OrderedDict()
+        self._inflight: dict[str, Future] = {}
+        self._idle: dict[tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, url: str) -> bytes:
+        """Return the bytes behind url, downloading them at most once."""
+        with self._lock:
+            if url in self._lru:
+                self._lru.move_to_end(url)
+                return self._lru[url]
+            future = self._inflight.get(url)
+            owner = future is None
+            if owner:
+                future = self._inflight[url] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            data = self._read_disk(url)
+            if data is None:
+                data = self._download(url)
+                self._write_disk(url, data)
+        except BaseException as exc:
+            with self._lock:
+                del self._inflight[url]
+            future.set_exception(exc)
+            raise
+        with self._lock:
+            del self._inflight[url]
+            self._lru[url] = data
+            while len(self._lru) > self.max_items:
+                self._lru.popitem(last=False)
+        future.set_result(data)
+        return data
+
+    # -- disk store -----------------------------------------------------
+    def _disk_path(self, url: str) -> str:
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, name[:2], name)
+
+    def _read_disk(self, url: str) -> bytes | None:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(url), "rb") as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, url: str, data: bytes) -> None:
+        if not self.cache_dir:
+            return
+        path = self._disk_path(url)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # the disk store is only an optimisation
+
+    # -- network --------------------------------------------------------
+    def _download(self, url: str) -> bytes:
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            status, location, body = self._request(
+                parts.scheme, parts.netloc, path
+            )
+            if status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+            if status != 200:
+                raise OSError(f"HTTP {status} fetching {url}")
+            with self._lock:
+                self.downloads += 1
+            return body
+        raise OSError(f"Too many redirects fetching {url}")
+
+    def _request(
+        self, scheme: str, netloc: str, path: str
+    ) -> tuple[int, str | None, bytes]:
+        key = (scheme, netloc)
+        # A pooled connection may have been closed by the server while
+        # idle; retry once on a fresh one in that case.
+        for reused in (True, False):
+            conn = self._checkout(key) if reused else None
+            if conn is None:
+                reused = False
+                conn = self._connect(scheme, netloc)
+            try:
+                conn.request(
+                    "GET", path, headers={"Connection": "keep-alive"}
+                )
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+            return resp.status, resp.getheader("Location"), body
+        raise OSError(f"Could not reach {netloc}")
+
+    def _connect(self, scheme: str, netloc: str):
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        if scheme == "http":
+            return http.client.HTTPConnection(netloc, timeout=self.timeout)
+        raise ValueError(f"Unsupported cover URL scheme: {scheme!r}")
+
+    def _checkout(self, key: tuple[str, str]):
+        with self._lock:
+            idle = self._idle.get(key)
+            return idle.pop() if idle else None
+
+    def _checkin(self, key: tuple[str, str], conn) -> None:
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+        with self._lock:
+            pools, self._idle = self._idle, {}
+        for conns in pools.values():
+            for conn in conns:
+                conn.close()
+
+
+_fetcher = CoverFetcher()
+
+
+def fetch_cover(url: str) -> bytes:
+    """Fetch url through the process-wide CoverFetcher."""
+    return _fetcher.fetch(url)
+
+
+def set_cover_cache_dir(cache_dir: str | None) -> None:
+    """Back the process-wide CoverFetcher with cache_dir on disk."""
+    _fetcher.cache_dir = cache_dir
@@ -0,0 +1,99 @@
+# auto_tag/destinations.py
+"""
+In-memory index of destination names.
+
+Picking a unique name used to probe os.path.exists() for "Title.mp3",
+"Title (1).mp3", "Title (2).mp3"... for every file: one stat per
+candidate, slow on network shares and racy once files are written in
+parallel. DestinationIndex lists each destination folder once, then
+hands out names from memory, remembering the next free suffix of every
+base name so an allocation costs O(1). A run creates one index and uses
+it for every file; first_free() serves the odd one-off name, where
+listing the whole folder would cost more than a few probes.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+
+
+def _key(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+def first_free(path: str, source: str | None = None) -> str:
+    """
+    Return path, or path with the first " (n)" suffix not taken on disk,
+    probing each candidate. A file already at its destination (path ==
+    source) keeps its name.
+    """
+    if source is not None and _key(path) == _key(source):
+        return path
+    stem, ext = os.path.splitext(path)
+    candidate, count = path, 1
+    while os.path.exists(candidate):
+        candidate = f"{stem} ({count}){ext}"
+        count += 1
+    return candidate
+
+
+class DestinationIndex:
+    """
+    Names taken in each destination folder: those listed when the folder
+    was first used plus those allocated since. Thread-safe; a --workers
+    run shares one instance hosted by a multiprocessing manager.
+    """
+
+    def __init__(self) -> None:
+        self._taken: dict[str, set[str]] = {}
+        self._next: dict[tuple[str, str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, path: str, source: str | None = None) -> str:
+        """
+        Return path, or path with the first free " (n)" suffix, and mark
+        it as taken. A file already at its destination (path == source)
+        keeps its name.
+        """
+        folder, name = os.path.split(path)
+        with self._lock:
+            taken = self._folder(folder)
+            if source is not None and _key(path) == _key(source):
+                taken.add(os.path.normcase(name))
+                return path
+            if os.path.normcase(name) not in taken:
+                taken.add(os.path.normcase(name))
+                return path
+
+            stem, ext = os.path.splitext(name)
+            slot = (_key(folder), os.path.normcase(stem), ext.lower())
+            count = self._next.get(slot, 1)
+            while True:
+                candidate = f"{stem} ({count}){ext}"
+                count += 1
+                if os.path.normcase(candidate) not in taken:
+                    break
+            self._next[slot] = count
+            taken.add(os.path.normcase(candidate))
+            return os.path.join(folder, candidate)
+
+    def release(self, path: str) -> None:
+        """Forget path, e.g. once the file there has been moved away."""
+        folder, name = os.path.split(path)
+        with self._lock:
+            taken = self._taken.get(_key(folder))
+            if taken is not None:
+                taken.discard(os.path.normcase(name))
+
+    def _folder(self, folder: str) -> set[str]:
+        key = _key(folder)
+        taken = self._taken.get(key)
+        if taken is None:
+            try:
+                with os.scandir(folder or ".") as entries:
+                    taken = {os.path.normcase(e.name) for e in entries}
+            except FileNotFoundError:
+                taken = set()
+            self._taken[key] = taken
+        return taken
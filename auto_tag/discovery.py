@@ -0,0 +1,123 @@
+# auto_tag/discovery.py
+"""
+Streaming discovery of audio files.
+
+Listing a large library (on a NAS, say) can take minutes, so instead
+of building the whole file list up front, AudioFileWalker walks the
+tree in a worker thread and hands paths to the event loop through a
+bounded queue as soon as they are found. Recognition can start on the
+first file while discovery carries on.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from typing import AsyncIterator, Iterable, Iterator
+
+from auto_tag import metrics
+
+_DONE = object()
+
+
+def iter_audio_files(
+    folder_path: str, extensions: Iterable[str]
+) -> Iterator[str]:
+    """
+    Yield the files under folder_path with one of the given extensions,
+    directory by directory in sorted order. Files directly inside a
+    folder whose name contains "test" are skipped.
+    """
+    exts = {e.lower().lstrip(".") for e in extensions}
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        if "test" in os.path.basename(root).lower():
+            continue
+        for fn in sorted(files):
+            if os.path.splitext(fn)[1].lower().lstrip(".") in exts:
+                yield os.path.join(root, fn)
+
+
+def is_audio_file(path: str, extensions: Iterable[str]) -> bool:
+    """Whether iter_audio_files() would yield path (a watched event)."""
+    exts = {e.lower().lstrip(".") for e in extensions}
+    folder, name = os.path.split(path)
+    return (
+        os.path.splitext(name)[1].lower().lstrip(".") in exts
+        and "test" not in os.path.basename(folder).lower()
+    )
+
+
+class AudioFileWalker:
+    """
+    Stream iter_audio_files() from a worker thread, or the given paths
+    when a caller already knows them (a --workers shard).
+    `found` counts the files discovered so far (including those still
+    queued) and `finished` tells whether the walk is over, so progress
+    totals can follow discovery.
+    """
+
+    def __init__(
+        self,
+        folder_path: str,
+        extensions: Iterable[str],
+        *,
+        maxsize: int = 1024,
+        paths: Iterable[str] | None = None,
+    ) -> None:
+        self.folder_path = folder_path
+        self.extensions = tuple(extensions)
+        self.maxsize = maxsize
+        self.paths = paths
+        self.found = 0
+        self.finished = False
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Yield discovered paths; close the generator to stop the walk."""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(self.maxsize)
+        stop = threading.Event()
+
+        def put(item) -> None:
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def walk() -> None:
+            paths = self.paths
+            if paths is None:
+                paths = iter_audio_files(self.folder_path, self.extensions)
+            try:
+                # discovery time excludes waiting on a full queue
+                last = time.perf_counter()
+                for path in paths:
+                    if stop.is_set():
+                        return
+                    self.found += 1
+                    metrics.observe(
+                        "discovery", time.perf_counter() - last, path
+                    )
+                    put(path)
+                    last = time.perf_counter()
+            except BaseException as exc:
+                put(exc)
+            finally:
+                self.finished = True
+                put(_DONE)
+
+        worker = loop.run_in_executor(None, walk)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Unblock a walker waiting on a full queue, then let it end.
+            stop.set()
+            while not worker.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.sleep(0.01)
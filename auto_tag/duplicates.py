@@ -0,0 +1,68 @@
+# auto_tag/duplicates.py
+"""
+Duplicate audio within one run.
+
+Files are grouped by their audio hash (tags excluded, see
+utils.audio_hash) as they are discovered. The first file of a group is
+its representative and the only one sent to Shazam; the other copies
+wait for its answer instead of costing a recognition of their own.
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+DUPLICATE_MODES = ("share", "report", "skip")
+DEFAULT_DUPLICATE_MODE = "share"
+
+
+class DuplicateGroups:
+    """
+    The files of a run grouped by audio hash, in discovery order. A group
+    whose representative failed to be recognised gets a new one the next
+    time one of its files is tried (typically on retry).
+    """
+
+    def __init__(self) -> None:
+        self.groups: dict[str, list[str]] = {}
+        self._answers: dict[str, asyncio.Future] = {}
+
+    def claim(self, key: str, path: str) -> asyncio.Future | None:
+        """
+        Add path to the group of audio hash key. Return the pending (or
+        known) answer of the group's representative when there is one,
+        or None when path has become the representative and must be
+        recognised, then passed to resolve().
+        """
+        members = self.groups.setdefault(key, [])
+        if path not in members:
+            members.append(path)
+        answer = self._answers.get(key)
+        if answer is not None and not (
+            answer.done() and answer.result() is None
+        ):
+            return answer
+        self._answers[key] = asyncio.get_running_loop().create_future()
+        return None
+
+    def resolve(self, key: str, out: dict | None) -> None:
+        """Share the representative's answer with the rest of its group."""
+        answer = self._answers[key]
+        if not answer.done():
+            answer.set_result(out)
+
+    def duplicates(self) -> dict[str, list[str]]:
+        """Groups with more than one file, keyed by audio hash."""
+        return {k: m for k, m in self.groups.items() if len(m) > 1}
+
+    @property
+    def count(self) -> int:
+        """Number of files that duplicate an earlier one."""
+        return sum(len(m) - 1 for m in self.groups.values())
+
+    def report(self) -> str:
+        lines = []
+        for first, *copies in self.duplicates().values():
+            lines.append(first)
+            lines.extend(f"  = {path}" for path in copies)
+        return "\n".join(lines)
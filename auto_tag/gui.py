@@ -1,4 +1,10 @@
 # auto_tag/gui.py
+"""
+Tkinter front end. Recognition and tagging modules (shazamio, eyed3,
+soundfile...) are only imported once the user starts a scan or applies
+changes, so the window opens without loading them.
+"""
+
 from __future__ import annotations
 
 import asyncio
@@ -8,16 +14,24 @@ import sys
 import threading
 import time
 import tkinter as tk
+from concurrent.futures import (FIRST_COMPLETED, Future, ThreadPoolExecutor,
+                                wait)
 from tkinter import filedialog, messagebox, ttk
+from typing import TYPE_CHECKING, Callable, NamedTuple
 
-from shazamio import Shazam
+from auto_tag.cache import RecognitionCache, default_cache_dir
+from auto_tag.covers import set_cover_cache_dir
+from auto_tag.destinations import DestinationIndex
+from auto_tag.discovery import AudioFileWalker
+from auto_tag.manifest import ScanManifest
+from auto_tag.pipeline import DEFAULT_TAG_WORKERS
+from auto_tag.results import ResultsModel
 
-from auto_tag.audio_recognize import (recognize_and_rename_file,
-                                      update_mp3_cover_art, update_mp3_tags,
-                                      update_ogg_tags)
+if TYPE_CHECKING:
+    from auto_tag.rate_limit import AdaptiveRateLimiter
 
-# shared results list between worker thread and main thread
-RESULTS: list[dict] = []
+# Treeview row height, also used to work out how many rows fit on screen
+ROW_HEIGHT = 30
 
 
 def _base_dir() -> str:
@@ -32,14 +46,28 @@ class MP3RenamerGUI:
     def __init__(self, root: tk.Tk) -> None:
         self.root = root
         self.root.title("MP3 Shazam Auto Tag")
-        self.data: list[dict] = []
+        # Every result; the tree only holds the rows currently on screen,
+        # from row self.first on.
+        self.results = ResultsModel()
+        self.first = 0
+        self.visible = 20
+        self.scanning = False
         self.editing_entry: tk.Entry | None = None
+        self.editing_row = 0
         self.total_files = 0
         self.start_time: float | None = None
+        self.limiter: AdaptiveRateLimiter | None = None
 
         # Copy-to controls
         self.copy_enabled = tk.BooleanVar(value=False)
         self.copy_dir = tk.StringVar(value="")
+        # Re-process files the library manifest records as unchanged
+        self.full_scan = tk.BooleanVar(value=False)
+        # Set by the Cancel button to stop an apply in progress
+        self.cancel_apply = threading.Event()
+
+        # covers are shared by every track of an album: download them once
+        set_cover_cache_dir(os.path.join(default_cache_dir(), "covers"))
 
         self._build_layout()
 
@@ -70,6 +98,11 @@ class MP3RenamerGUI:
         ttk.Button(top, text="Browse", command=self._browse_copy).pack(
             side=tk.LEFT, padx=5
         )
+        ttk.Checkbutton(
+            top,
+            text="Full rescan",
+            variable=self.full_scan,
+        ).pack(side=tk.LEFT, padx=(20, 0))
 
         # Progress bar
         pf = ttk.Frame(self.root, padding=10)
@@ -78,10 +111,17 @@ class MP3RenamerGUI:
         self.progress.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
         self.progress_info = ttk.Label(pf, text="0/0, Remaining 0 s")
         self.progress_info.pack(side=tk.LEFT)
+        self.cancel_button = ttk.Button(
+            pf,
+            text="Cancel",
+            command=self.cancel_apply.set,
+            state=tk.DISABLED,
+        )
+        self.cancel_button.pack(side=tk.LEFT, padx=(10, 0))
 
         # Results tree
         style = ttk.Style()
-        style.configure("Custom.Treeview", rowheight=30, padding=5)
+        style.configure("Custom.Treeview", rowheight=ROW_HEIGHT, padding=5)
         style.configure("Custom.Treeview.Heading", padding=5)
 
         tree_wrap = ttk.Frame(self.root, padding=10)
@@ -98,17 +138,18 @@ class MP3RenamerGUI:
             ("old", "Old Name"),
             ("new", "New Name"),
         ]:
-            self.tree.heading(col, text=text)
+            self.tree.heading(
+                col, text=text, command=lambda c=col: self._sort(c)
+            )
         self.tree.column("apply", width=80, anchor="center")
         self.tree.column("old", width=300, anchor="w")
         self.tree.column("new", width=300, anchor="w")
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        vscroll = ttk.Scrollbar(
-            tree_wrap, orient="vertical", command=self.tree.yview
+        self.vscroll = ttk.Scrollbar(
+            tree_wrap, orient="vertical", command=self._on_scroll
         )
-        vscroll.pack(side=tk.RIGHT, fill=tk.Y)
-        self.tree.configure(yscrollcommand=vscroll.set)
+        self.vscroll.pack(side=tk.RIGHT, fill=tk.Y)
 
         self.tree.tag_configure("Yes", foreground="#5a7849")
         self.tree.tag_configure("No", foreground="#DB504A")
@@ -117,19 +158,27 @@ class MP3RenamerGUI:
         self.tree.bind("<Button-1>", self._on_click)
         self.tree.bind("<Return>", self._on_enter)
         self.tree.bind("<Double-1>", self._on_double_click)
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", self._on_wheel)
+        self.tree.bind("<Button-5>", self._on_wheel)
 
         # Bottom buttons
         bottom = ttk.Frame(self.root, padding=10)
         bottom.pack(side=tk.BOTTOM, fill=tk.X)
 
-        ttk.Button(
-            bottom, text="Apply", command=lambda: self._apply(False)
-        ).pack(side=tk.RIGHT, padx=5)
-        ttk.Button(
-            bottom,
-            text="Apply with Plex Convention",
-            command=lambda: self._apply(True),
-        ).pack(side=tk.RIGHT, padx=5)
+        self.apply_buttons = [
+            ttk.Button(
+                bottom, text="Apply", command=lambda: self._apply(False)
+            ),
+            ttk.Button(
+                bottom,
+                text="Apply with Plex Convention",
+                command=lambda: self._apply(True),
+            ),
+        ]
+        for button in self.apply_buttons:
+            button.pack(side=tk.RIGHT, padx=5)
         ttk.Button(bottom, text="Uncheck All", command=self._uncheck_all).pack(
             side=tk.RIGHT, padx=5
         )
@@ -149,103 +198,175 @@ class MP3RenamerGUI:
             self.copy_dir.set(directory)
 
     def _start_recognition(self, directory: str) -> None:
-        for iid in self.tree.get_children():
-            self.tree.delete(iid)
-        self.data.clear()
-        RESULTS.clear()
+        self.results.clear()
+        self.first = 0
+        self._render()
         self.progress.config(value=0)
         self.progress_info.config(text="0/0, Remaining 0 s")
 
+        self.scanning = True
         threading.Thread(
             target=self._recognise_thread,
             args=(directory,),
             daemon=True,
         ).start()
+        self._drain_results()
 
     def _recognise_thread(self, directory: str) -> None:
-        asyncio.run(self._process_files(directory))
-        self.root.after(0, self._populate_tree)
+        try:
+            asyncio.run(self._process_files(directory))
+        finally:
+            self.scanning = False
+
+    def _drain_results(self) -> None:
+        # Results are shown as they arrive, a batch every 200 ms.
+        scanning = self.scanning
+        if self.results.drain():
+            self._render()
+        if scanning:
+            self.root.after(200, self._drain_results)
+        elif not len(self.results):
+            messagebox.showinfo("Info", "No files were processed.")
 
     async def _process_files(self, directory: str) -> None:
-        audio_files: list[str] = []
-        for rootdir, _, names in os.walk(directory):
-            if "test" in os.path.basename(rootdir).lower():
-                continue
-            for n in names:
-                if n.lower().endswith((".mp3", ".ogg")):
-                    audio_files.append(os.path.join(rootdir, n))
-
-        self.total_files = len(audio_files)
-        if not audio_files:
-            self.root.after(
-                0, lambda: messagebox.showinfo("Info", "No audio files found.")
-            )
-            return
-        self.root.after(
-            0, lambda: self.progress.config(maximum=self.total_files)
-        )
+        from shazamio import Shazam
 
-        self.start_time = time.time()
-        shazam = Shazam()
+        from auto_tag.audio_recognize import recognize_and_rename_file
+        from auto_tag.rate_limit import AdaptiveRateLimiter, RateLimitedShazam
 
-        for idx, path in enumerate(audio_files, 1):
-            try:
-                res = await recognize_and_rename_file(
-                    file_path=path,
-                    shazam=shazam,
-                    modify=False,  # preview only
-                    delay=10,
-                    nbr_retry=3,
-                    trace=False,
-                    output_dir=None,
-                    plex_structure=False,
-                    copy_to=(
-                        self.copy_dir.get()
-                        if self.copy_enabled.get()
-                        else None
-                    ),
+        # Files are recognised as the walk finds them; the progress bar
+        # maximum grows with discovery.
+        walker = AudioFileWalker(directory, ("mp3", "ogg"))
+        manifest = _open_manifest(directory, readonly=True)
+        full_scan = self.full_scan.get()
+        self.total_files = 0
+        self.start_time = time.time()
+        self.limiter = AdaptiveRateLimiter()
+        shazam = RateLimitedShazam(Shazam(), self.limiter)
+        cache = RecognitionCache()
+        # one index for the whole preview: each folder is listed once
+        destinations = DestinationIndex()
+        skipped = idx = 0
+
+        paths = walker.stream()
+        try:
+            async for path in paths:
+                if (
+                    manifest is not None
+                    and not full_scan
+                    and manifest.is_unchanged(path)
+                ):
+                    skipped += 1
+                    continue
+                idx += 1
+                try:
+                    res = await recognize_and_rename_file(
+                        file_path=path,
+                        shazam=shazam,
+                        modify=False,  # preview only
+                        delay=10,
+                        nbr_retry=3,
+                        trace=False,
+                        output_dir=None,
+                        plex_structure=False,
+                        copy_to=(
+                            self.copy_dir.get()
+                            if self.copy_enabled.get()
+                            else None
+                        ),
+                        cache=cache,
+                        destinations=destinations,
+                    )
+                    res["apply"] = "error" not in res
+                except Exception as exc:
+                    res = {
+                        "file_path": path,
+                        "new_file_path": str(exc),
+                        "apply": False,
+                    }
+                self.results.append(res)
+
+                self.total_files = walker.found - skipped
+                elapsed = time.time() - self.start_time
+                remaining = int(elapsed / idx * (self.total_files - idx))
+                self.root.after(
+                    0, lambda d=idx, r=remaining: self._update_progress(d, r)
                 )
-                res["apply"] = "error" not in res
-            except Exception as exc:
-                res = {
-                    "file_path": path,
-                    "new_file_path": str(exc),
-                    "apply": False,
-                }
-            RESULTS.append(res)
+        finally:
+            await paths.aclose()
+            cache.close()
+            if manifest is not None:
+                manifest.close()
 
-            elapsed = time.time() - self.start_time
-            remaining = int(elapsed / idx * (self.total_files - idx))
+        if not idx:
             self.root.after(
-                0, lambda d=idx, r=remaining: self._update_progress(d, r)
+                0,
+                lambda: messagebox.showinfo(
+                    "Info", "No new or changed audio files found."
+                ),
             )
 
     def _update_progress(self, done: int, remaining: int) -> None:
-        self.progress.config(value=done)
-        self.progress_info.config(
-            text=f"{done}/{self.total_files}, Remaining {remaining} s"
+        self.progress.config(maximum=self.total_files, value=done)
+        text = f"{done}/{self.total_files}, Remaining {remaining} s"
+        if self.limiter is not None:
+            text += f", Rate {self.limiter}"
+        self.progress_info.config(text=text)
+
+    def _render(self) -> None:
+        """Show the rows from self.first on in the tree's item slots."""
+        self.first = max(0, min(self.first, len(self.results) - self.visible))
+        rows = self.results.window(self.first, self.visible)
+        slots = self.tree.get_children()
+        for slot, res in enumerate(rows):
+            values = ResultsModel.values(res)
+            if slot < len(slots):
+                self.tree.item(slots[slot], values=values, tags=(values[0],))
+            else:
+                self.tree.insert(
+                    "", "end", values=values, tags=(values[0],)
+                )
+        if len(slots) > len(rows):
+            self.tree.delete(*slots[len(rows) :])
+
+        total = max(1, len(self.results))
+        self.vscroll.set(
+            self.first / total, min(1.0, (self.first + len(rows)) / total)
         )
 
-    def _populate_tree(self) -> None:
-        for res in RESULTS:
-            self.data.append(res)
-            tag = "Yes" if res.get("apply") else "No"
-            self.tree.insert(
-                "",
-                "end",
-                values=(
-                    tag,
-                    os.path.basename(res.get("file_path", "")),
-                    os.path.basename(res.get("new_file_path", "")),
-                ),
-                tags=(tag,),
-            )
-        if not self.data:
-            messagebox.showinfo("Info", "No files were processed.")
+    def _scroll_to(self, first: int) -> None:
+        if self.editing_entry is not None:
+            self._finish_edit(self.editing_row)
+        self.first = first
+        self._render()
+
+    def _on_scroll(self, action: str, amount: str, unit: str = "") -> None:
+        if action == "moveto":
+            self._scroll_to(int(float(amount) * len(self.results)))
+        else:
+            step = self.visible if unit == "pages" else 1
+            self._scroll_to(self.first + int(amount) * step)
+
+    def _on_wheel(self, event) -> str:
+        if event.num == 4 or event.delta > 0:
+            self._scroll_to(self.first - 3)
+        else:
+            self._scroll_to(self.first + 3)
+        return "break"
+
+    def _on_resize(self, event) -> None:
+        # the heading takes about one row
+        visible = max(1, event.height // ROW_HEIGHT - 1)
+        if visible != self.visible:
+            self.visible = visible
+            self._render()
+
+    def _row(self, iid) -> int:
+        """Index in self.results of the row shown in item iid."""
+        return self.first + self.tree.index(iid)
 
     def _toggle(self, idx: int, iid) -> None:
-        self.data[idx]["apply"] = not self.data[idx].get("apply", True)
-        tag = "Yes" if self.data[idx]["apply"] else "No"
+        tag = "Yes" if self.results.toggle(idx) else "No"
         self.tree.set(iid, "apply", tag)
         self.tree.item(iid, tags=(tag,))
 
@@ -257,12 +378,12 @@ class MP3RenamerGUI:
             self.tree.identify_row(event.y),
         )
         if iid and col == "#1":
-            self._toggle(self.tree.index(iid), iid)
+            self._toggle(self._row(iid), iid)
 
     def _on_enter(self, _) -> None:
         iid = self.tree.focus()
         if iid:
-            self._toggle(self.tree.index(iid), iid)
+            self._toggle(self._row(iid), iid)
 
     def _on_double_click(self, event) -> None:
         if self.tree.identify("region", event.x, event.y) != "cell":
@@ -273,143 +394,236 @@ class MP3RenamerGUI:
         )
         if not iid:
             return
-        idx = self.tree.index(iid)
+        idx = self._row(iid)
         if col in ("#1", "#2"):
             self._toggle(idx, iid)
         elif col == "#3":
             x, y, w, h = self.tree.bbox(iid, col)
             current = self.tree.set(iid, "new")
             self.editing_entry = tk.Entry(self.tree)
+            self.editing_row = idx
             self.editing_entry.place(x=x, y=y, width=w, height=h)
             self.editing_entry.insert(0, current)
             self.editing_entry.focus()
             self.editing_entry.bind(
-                "<Return>", lambda _: self._finish_edit(iid)
+                "<Return>", lambda _: self._finish_edit(idx)
             )
             self.editing_entry.bind(
-                "<FocusOut>", lambda _: self._finish_edit(iid)
+                "<FocusOut>", lambda _: self._finish_edit(idx)
             )
 
-    def _finish_edit(self, iid) -> None:
+    def _finish_edit(self, idx: int) -> None:
         if not self.editing_entry:
             return
-        new_val = self.editing_entry.get()
-        self.tree.set(iid, "new", new_val)
-        idx = self.tree.index(iid)
-        old_new = self.data[idx].get("new_file_path", "")
-        dirpath = os.path.dirname(old_new) if old_new else ""
-        self.data[idx]["new_file_path"] = (
-            os.path.join(dirpath, new_val) if dirpath else new_val
-        )
+        self.results.rename(idx, self.editing_entry.get())
         self.editing_entry.destroy()
         self.editing_entry = None
+        self._render()
 
     def _sort(self, key: str) -> None:
-        if key == "old":
-            self.data.sort(
-                key=lambda d: os.path.basename(d.get("file_path", "")).lower()
-            )
-        else:
-            self.data.sort(
-                key=lambda d: os.path.basename(
-                    d.get("new_file_path", "")
-                ).lower()
-            )
-        for iid in self.tree.get_children():
-            self.tree.delete(iid)
-        for res in self.data:
-            tag = "Yes" if res.get("apply") else "No"
-            self.tree.insert(
-                "",
-                "end",
-                values=(
-                    tag,
-                    os.path.basename(res.get("file_path", "")),
-                    os.path.basename(res.get("new_file_path", "")),
-                ),
-                tags=(tag,),
-            )
+        self.results.sort(key)
+        self._render()
 
     def _check_all(self) -> None:
-        for idx, res in enumerate(self.data):
-            res["apply"] = True
-            iid = self.tree.get_children()[idx]
-            self.tree.set(iid, "apply", "Yes")
-            self.tree.item(iid, tags=("Yes",))
+        self.results.set_all(True)
+        self._render()
 
     def _uncheck_all(self) -> None:
-        for idx, res in enumerate(self.data):
-            res["apply"] = False
-            iid = self.tree.get_children()[idx]
-            self.tree.set(iid, "apply", "No")
-            self.tree.item(iid, tags=("No",))
+        self.results.set_all(False)
+        self._render()
 
     def _apply(self, plex: bool) -> None:
-        errors: list[str] = []
+        # Files are moved and tagged on a worker pool; the Tk thread only
+        # gets progress updates and the final report, via root.after.
+        rows = self.results.checked()
+        if not rows:
+            messagebox.showinfo("Info", "No files are checked.")
+            return
         copy_to = self.copy_dir.get() if self.copy_enabled.get() else None
+        directory = self.dir_var.get()
+        self.cancel_apply.clear()
+        self._set_applying(True)
+        self.total_files = len(rows)
+        self.start_time = time.time()
+        self.limiter = None
+        self._update_progress(0, 0)
 
-        for res in self.data:
-            if not res.get("apply"):
-                continue
-            src = res.get("file_path")
-            if not src or not os.path.exists(src):
-                continue
-
-            title = res.get("title", "Unknown Title")
-            artist = res.get("author", "Unknown Artist")
-            album = res.get("album", "Unknown Album")
-            ext = os.path.splitext(src)[1].lower()
+        def progress(done: int) -> None:
+            elapsed = time.time() - self.start_time
+            remaining = int(elapsed / done * (len(rows) - done))
+            self.root.after(
+                0, lambda d=done, r=remaining: self._update_progress(d, r)
+            )
 
-            if plex:
-                base_dir = os.path.join(os.path.dirname(src), artist, album)
-            else:
-                base_dir = os.path.dirname(src)
-            if copy_to:
-                base_dir = copy_to
-                if plex:
-                    base_dir = os.path.join(base_dir, artist, album)
-            os.makedirs(base_dir, exist_ok=True)
-
-            if plex:
-                dest = os.path.join(base_dir, f"{title}{ext}")
-            else:
-                dest = res.get("new_file_path") or os.path.join(
-                    base_dir, f"{title}{ext}"
+        def run() -> None:
+            try:
+                report = apply_results(
+                    rows,
+                    plex=plex,
+                    copy_to=copy_to,
+                    directory=directory,
+                    cancel=self.cancel_apply,
+                    progress=progress,
                 )
+            except Exception as exc:
+                report = ApplyReport(errors=(str(exc),))
+            self.root.after(0, lambda: self._apply_finished(report))
+
+        threading.Thread(target=run, daemon=True).start()
 
-            counter, unique = 1, dest
-            while os.path.exists(unique):
-                root, ext2 = os.path.splitext(dest)
-                unique = f"{root} ({counter}){ext2}"
-                counter += 1
+    def _set_applying(self, running: bool) -> None:
+        state = tk.DISABLED if running else tk.NORMAL
+        for button in self.apply_buttons:
+            button.config(state=state)
+        self.cancel_button.config(state=tk.NORMAL if running else tk.DISABLED)
 
+    def _apply_finished(self, report: ApplyReport) -> None:
+        self._set_applying(False)
+        if report.cancelled:
+            summary = f"Cancelled after {report.done} file(s)."
+        else:
+            summary = "Changes applied successfully."
+        summary += f" {report.rewrites} file(s) had to be rewritten in full."
+        if report.errors:
+            messagebox.showerror(
+                "Errors Occurred", "\n".join([summary, "", *report.errors])
+            )
+        else:
+            messagebox.showinfo("Success", summary)
+
+
+class ApplyReport(NamedTuple):
+    """Outcome of apply_results()."""
+
+    done: int = 0
+    rewrites: int = 0
+    errors: tuple[str, ...] = ()
+    cancelled: bool = False
+
+
+def apply_results(
+    rows: list[dict],
+    *,
+    plex: bool,
+    copy_to: str | None,
+    directory: str,
+    cancel: threading.Event,
+    progress: Callable[[int], None] | None = None,
+    workers: int = DEFAULT_TAG_WORKERS,
+) -> ApplyReport:
+    """
+    Move (or copy to copy_to) and tag the files of rows on a pool of
+    workers threads, calling progress with the number of files done so
+    far. Destinations are allocated in row order as the work is handed
+    out; once cancel is set, no further file is started. A failing file
+    is reported in errors and does not stop the others.
+    """
+    from auto_tag.audio_recognize import write_tags
+
+    def work(res: dict, src: str, unique: str) -> bool:
+        if copy_to:
+            shutil.copy2(src, unique)
+        elif unique != src:
+            os.rename(src, unique)
+            destinations.release(src)
+        return write_tags(
+            unique,
+            res.get("title", "Unknown Title"),
+            res.get("author", "Unknown Artist"),
+            res.get("album", "Unknown Album"),
+            res.get("cover_link", ""),
+            trace=False,
+        )
+
+    manifest = _open_manifest(directory)
+    destinations = DestinationIndex()
+    errors: list[str] = []
+    done = rewrites = 0
+
+    def step() -> None:
+        nonlocal done
+        done += 1
+        if progress is not None:
+            progress(done)
+
+    def collect(finished: set[Future]) -> None:
+        nonlocal rewrites
+        for job in finished:
+            res, unique = jobs.pop(job)
             try:
-                if copy_to:
-                    shutil.copy2(src, unique)
-                else:
-                    os.rename(src, unique)
-
-                if ext == ".mp3":
-                    update_mp3_tags(unique, title, artist, album)
-                    update_mp3_cover_art(
-                        unique, res.get("cover_link", ""), trace=False
-                    )
-                else:
-                    update_ogg_tags(
-                        unique,
-                        title,
-                        artist,
-                        album,
-                        res.get("cover_link", ""),
-                        trace=False,
+                rewrites += job.result()
+                if manifest is not None:
+                    manifest.record_result(
+                        dict(res, new_file_path=unique), copied=bool(copy_to)
                     )
             except Exception as exc:
-                errors.append(f"{src}: {exc}")
+                errors.append(f"{res['file_path']}: {exc}")
+            step()
 
-        if errors:
-            messagebox.showerror("Errors Occurred", "\n".join(errors))
-        else:
-            messagebox.showinfo("Success", "Changes applied successfully.")
+    # at most `window` files are handed out ahead, so that a cancel
+    # leaves the rest untouched
+    window = 2 * max(1, workers)
+    jobs: dict[Future, tuple[dict, str]] = {}
+    try:
+        with ThreadPoolExecutor(max(1, workers)) as pool:
+            for res in rows:
+                while len(jobs) >= window:
+                    collect(wait(jobs, return_when=FIRST_COMPLETED).done)
+                if cancel.is_set():
+                    break
+                src = res.get("file_path")
+                if not src or not os.path.exists(src):
+                    step()
+                    continue
+                try:
+                    dest = _destination(res, src, plex=plex, copy_to=copy_to)
+                    unique = destinations.allocate(dest, source=src)
+                except OSError as exc:
+                    errors.append(f"{src}: {exc}")
+                    step()
+                    continue
+                jobs[pool.submit(work, res, src, unique)] = (res, unique)
+            collect(wait(jobs).done)
+    finally:
+        if manifest is not None:
+            manifest.close()
+    return ApplyReport(done, rewrites, tuple(errors), cancel.is_set())
+
+
+def _destination(
+    res: dict, src: str, *, plex: bool, copy_to: str | None
+) -> str:
+    """Where the Apply buttons put src; its folder is created."""
+    title = res.get("title", "Unknown Title")
+    artist = res.get("author", "Unknown Artist")
+    album = res.get("album", "Unknown Album")
+    ext = os.path.splitext(src)[1].lower()
+
+    if plex:
+        base_dir = os.path.join(os.path.dirname(src), artist, album)
+    else:
+        base_dir = os.path.dirname(src)
+    if copy_to:
+        base_dir = copy_to
+        if plex:
+            base_dir = os.path.join(base_dir, artist, album)
+    os.makedirs(base_dir, exist_ok=True)
+
+    if plex:
+        return os.path.join(base_dir, f"{title}{ext}")
+    return res.get("new_file_path") or os.path.join(base_dir, f"{title}{ext}")
+
+
+def _open_manifest(
+    directory: str, *, readonly: bool = False
+) -> ScanManifest | None:
+    """Open the manifest of the library at directory, if it can be."""
+    if not directory:
+        return None
+    try:
+        return ScanManifest(directory, readonly=readonly)
+    except Exception:
+        return None
 
 
 def launch_gui() -> None:
@@ -0,0 +1,455 @@
+# auto_tag/job_queue.py
+"""
+Shared job queue for several hosts working through one library.
+
+`--queue jobs.sqlite` turns main.py into one worker among many: the
+files of the library are loaded into a SQLite queue on the shared
+volume, and each worker leases a file, recognises it, moves and tags
+it, then commits the result dict of the rename. A lease is kept alive
+by a heartbeat while the file is worked on; the lease of a crashed
+worker expires after lease_seconds and another worker takes the file
+over. Before moving a file a worker checks that it still holds its
+lease, and destination names are reserved in the queue, so each file
+is moved once and two hosts never pick the same name.
+
+Paths are stored relative to the library root, so hosts may mount the
+shared volume at different places.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+from shazamio import Shazam
+
+from auto_tag.audio_recognize import (apply_rename, plan_rename,
+                                      recognize_audio)
+from auto_tag.cache import RecognitionCache, default_cache_dir
+from auto_tag.covers import set_cover_cache_dir
+from auto_tag.destinations import DestinationIndex
+from auto_tag.discovery import iter_audio_files
+from auto_tag.manifest import ScanManifest
+from auto_tag.rate_limit import (DEFAULT_RATE, AdaptiveRateLimiter,
+                                 RateLimitedShazam)
+from auto_tag.retry import backoff_delay
+from auto_tag.sampling import SAMPLE_SECONDS
+from auto_tag.signatures import DEFAULT_ENGINE
+
+# Seconds a lease lasts without a heartbeat
+DEFAULT_LEASE = 120.0
+# Attempts before a file that keeps failing is given up
+MAX_ATTEMPTS = 3
+
+
+def default_owner() -> str:
+    """Worker name recorded on its leases: host and process id."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    Jobs are library files (relative paths) in one of the states
+    "pending", "leased", "done" or "failed". A leased job whose lease has
+    expired is pending again as far as lease() is concerned. A job given
+    back by fail() is not leased again before its backoff (see
+    retry.backoff_delay, from retry_delay) has passed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        library_dir: str,
+        *,
+        lease_seconds: float = DEFAULT_LEASE,
+        retry_delay: float = 0.0,
+    ) -> None:
+        self.path = path
+        self.library_dir = os.path.abspath(library_dir)
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        # no WAL: its shared memory does not work over network filesystems
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                path        TEXT PRIMARY KEY,
+                state       TEXT NOT NULL DEFAULT 'pending',
+                owner       TEXT,
+                lease_until REAL,
+                attempts    INTEGER NOT NULL DEFAULT 0,
+                result      TEXT,
+                updated_at  REAL,
+                not_before  REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+            CREATE TABLE IF NOT EXISTS names (
+                path  TEXT PRIMARY KEY,
+                owner TEXT
+            );
+            """
+        )
+        columns = {
+            row[1] for row in self._db.execute("PRAGMA table_info(jobs)")
+        }
+        if "not_before" not in columns:
+            # queue created before failed jobs were backed off
+            try:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN not_before REAL")
+            except sqlite3.OperationalError:
+                pass  # another worker added it first
+
+    def close(self) -> None:
+        self._db.close()
+
+    def key(self, file_path: str) -> str:
+        """The queue's name for file_path: relative to the library."""
+        rel = os.path.relpath(os.path.abspath(file_path), self.library_dir)
+        return os.path.normcase(rel).replace(os.sep, "/")
+
+    def file_path(self, key: str) -> str:
+        return os.path.join(self.library_dir, *key.split("/"))
+
+    def enqueue(self, paths: Iterable[str]) -> int:
+        """
+        Add paths not queued yet and return how many were added. Paths
+        reserved as destinations, i.e. files some worker produced, are
+        not work to do.
+        """
+        rows = [(self.key(p),) * 2 for p in paths]
+        with self._transaction():
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO jobs (path)"
+                " SELECT ? WHERE NOT EXISTS"
+                " (SELECT 1 FROM names WHERE path = ?)",
+                rows,
+            )
+            return self._db.total_changes - before
+
+    def lease(self, owner: str, limit: int = 1) -> list[str]:
+        """Lease up to limit pending (or expired) jobs; return their paths."""
+        now = time.time()
+        with self._transaction():
+            keys = [
+                row[0]
+                for row in self._db.execute(
+                    "SELECT path FROM jobs WHERE (state = 'pending'"
+                    " AND (not_before IS NULL OR not_before <= ?))"
+                    " OR (state = 'leased' AND lease_until < ?)"
+                    " ORDER BY path LIMIT ?",
+                    (now, now, limit),
+                )
+            ]
+            self._db.executemany(
+                "UPDATE jobs SET state = 'leased', owner = ?,"
+                " lease_until = ?, attempts = attempts + 1, updated_at = ?"
+                " WHERE path = ?",
+                [(owner, now + self.lease_seconds, now, k) for k in keys],
+            )
+        return [self.file_path(k) for k in keys]
+
+    def heartbeat(self, owner: str) -> int:
+        """Extend the live leases of owner; return how many there are."""
+        now = time.time()
+        with self._transaction():
+            return self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE state = 'leased'"
+                " AND owner = ? AND lease_until >= ?",
+                (now + self.lease_seconds, owner, now),
+            ).rowcount
+
+    def renew(self, owner: str, file_path: str) -> bool:
+        """Extend the lease of file_path; False if owner no longer has it."""
+        now = time.time()
+        with self._transaction():
+            return (
+                self._db.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE path = ?"
+                    " AND state = 'leased' AND owner = ? AND lease_until >= ?",
+                    (
+                        now + self.lease_seconds,
+                        self.key(file_path),
+                        owner,
+                        now,
+                    ),
+                ).rowcount
+                > 0
+            )
+
+    def complete(self, owner: str, file_path: str, res: dict) -> bool:
+        """Commit the result of a leased job; False if the lease was lost."""
+        return self._finish(owner, file_path, "done", res)
+
+    def fail(self, owner: str, file_path: str, res: dict) -> str | None:
+        """
+        Give a leased job back after a failure: pending again once its
+        backoff has passed, or failed for good after MAX_ATTEMPTS
+        attempts. Return the job's new state, or None if the lease was
+        lost.
+        """
+        row = self._db.execute(
+            "SELECT attempts FROM jobs WHERE path = ?", (self.key(file_path),)
+        ).fetchone()
+        attempts = row[0] if row else 1
+        state = "failed" if attempts >= MAX_ATTEMPTS else "pending"
+        not_before = time.time() + backoff_delay(attempts, self.retry_delay)
+        if self._finish(owner, file_path, state, res, not_before=not_before):
+            return state
+        return None
+
+    def reserve(self, owner: str, file_path: str) -> bool:
+        """Reserve a destination name; False if another worker has it."""
+        with self._transaction():
+            return (
+                self._db.execute(
+                    "INSERT OR IGNORE INTO names VALUES (?, ?)",
+                    (self.key(file_path), owner),
+                ).rowcount
+                > 0
+            )
+
+    def unreserve(self, owner: str, file_path: str) -> None:
+        """Give back a destination name owner reserved but did not use."""
+        with self._transaction():
+            self._db.execute(
+                "DELETE FROM names WHERE path = ? AND owner = ?",
+                (self.key(file_path), owner),
+            )
+
+    def counts(self) -> dict[str, int]:
+        """Number of jobs in each state."""
+        return dict(
+            self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+        )
+
+    def results(self) -> dict[str, dict]:
+        """Committed results by library-relative path."""
+        return {
+            key: json.loads(result)
+            for key, result in self._db.execute(
+                "SELECT path, result FROM jobs WHERE state = 'done'"
+            )
+        }
+
+    def _finish(
+        self,
+        owner: str,
+        file_path: str,
+        state: str,
+        res: dict,
+        *,
+        not_before: float | None = None,
+    ) -> bool:
+        with self._transaction():
+            return (
+                self._db.execute(
+                    "UPDATE jobs SET state = ?, owner = NULL,"
+                    " lease_until = NULL, result = ?, updated_at = ?,"
+                    " not_before = ?"
+                    " WHERE path = ? AND state = 'leased' AND owner = ?",
+                    (
+                        state,
+                        json.dumps(res),
+                        time.time(),
+                        not_before,
+                        self.key(file_path),
+                        owner,
+                    ),
+                ).rowcount
+                > 0
+            )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers
+        # cannot both read a job as pending and lease it
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+
+class QueueDestinations:
+    """
+    DestinationIndex whose names are also reserved in the queue, so that
+    workers on other hosts never allocate the same one.
+    """
+
+    def __init__(self, queue: JobQueue, owner: str) -> None:
+        self.queue = queue
+        self.owner = owner
+        self._index = DestinationIndex()
+
+    def allocate(self, path: str, source: str | None = None) -> str:
+        while True:
+            candidate = self._index.allocate(path, source=source)
+            if self.queue.reserve(self.owner, candidate) or (
+                candidate == source
+            ):
+                return candidate
+
+    def release(self, path: str) -> None:
+        self._index.release(path)
+        self.queue.unreserve(self.owner, path)
+
+
+async def run_queue_worker(
+    folder_path: str,
+    queue_path: str,
+    *,
+    owner: str | None = None,
+    lease_seconds: float = DEFAULT_LEASE,
+    delay: int = 10,
+    nbr_retry: int = 3,
+    trace: bool = False,
+    extensions: Iterable[str] = ("mp3", "ogg"),
+    output_dir: str | None = None,
+    plex_structure: bool = False,
+    copy_to: str | None = None,
+    use_cache: bool = True,
+    refresh_cache: bool = False,
+    sample_offset: float | None = None,
+    sample_seconds: float = SAMPLE_SECONDS,
+    rate: float = DEFAULT_RATE,
+    engine: str = DEFAULT_ENGINE,
+    full_scan: bool = False,
+) -> dict:
+    """
+    Work through the shared queue at queue_path until no job is pending
+    or leased. The library's files are queued first (files the manifest
+    records as unchanged are left out unless full_scan); every worker
+    does this, and files already queued are ignored. A worker always
+    moves and tags its files: a job is only done once that happened, so
+    there is no dry run over a queue. Returns the numbers
+    of files this worker completed and failed, and of the leases it lost
+    (its lease expired before it could commit the file).
+    """
+    owner = owner or default_owner()
+    queue = JobQueue(
+        queue_path,
+        folder_path,
+        lease_seconds=lease_seconds,
+        retry_delay=delay,
+    )
+    manifest = None
+    try:
+        manifest = ScanManifest(folder_path)
+    except (OSError, sqlite3.Error):
+        pass
+    files = iter_audio_files(folder_path, extensions)
+    if manifest is not None and not full_scan:
+        files = (p for p in files if not manifest.is_unchanged(p))
+    added = queue.enqueue(files)
+    if trace:
+        print(f"[{owner}] queued {added} new file(s)")
+
+    shazam = Shazam()
+    if rate > 0:
+        shazam = RateLimitedShazam(shazam, AdaptiveRateLimiter(rate))
+    cache = None
+    if use_cache:
+        cache = RecognitionCache(refresh=refresh_cache)
+        set_cover_cache_dir(os.path.join(default_cache_dir(), "covers"))
+    destinations = QueueDestinations(queue, owner)
+    loop = asyncio.get_running_loop()
+    done = failed = lost = 0
+
+    def lease_lost(file_path: str) -> None:
+        nonlocal lost
+        lost += 1
+        print(f"[{owner}] lost the lease of {file_path}")
+
+    async def heartbeat() -> None:
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            queue.heartbeat(owner)
+
+    beating = asyncio.create_task(heartbeat())
+    try:
+        while True:
+            leased = queue.lease(owner)
+            if not leased:
+                counts = queue.counts()
+                if not counts.get("pending") and not counts.get("leased"):
+                    break
+                # other workers hold the rest, or failed jobs are backing
+                # off; wait for them or for a lease to expire
+                await asyncio.sleep(min(5.0, lease_seconds / 4))
+                continue
+            file_path = leased[0]
+            if not os.path.exists(file_path):
+                res = {"file_path": file_path, "error": "File not found"}
+                failed += queue.fail(owner, file_path, res) == "failed"
+                continue
+
+            out = await recognize_audio(
+                file_path,
+                shazam=shazam,
+                delay=delay,
+                nbr_retry=nbr_retry,
+                trace=trace,
+                cache=cache,
+                sample_offset=sample_offset,
+                sample_seconds=sample_seconds,
+                engine=engine,
+            )
+            # a lease lost while recognising belongs to someone else now
+            if not queue.renew(owner, file_path):
+                lease_lost(file_path)
+                continue
+            res = plan_rename(
+                file_path=file_path,
+                out=out,
+                trace=trace,
+                output_dir=output_dir,
+                plex_structure=plex_structure,
+                copy_to=copy_to,
+                destinations=destinations,
+            )
+            if "error" not in res:
+                planned = res["new_file_path"]
+                res = await loop.run_in_executor(
+                    None,
+                    lambda r=res: apply_rename(
+                        r, copied=bool(copy_to), trace=trace
+                    ),
+                )
+                # a name reserved for a file that never got there is
+                # free again, here and on every other host
+                if "error" in res and not os.path.exists(planned):
+                    destinations.release(planned)
+            if "error" in res:
+                failed += queue.fail(owner, file_path, res) == "failed"
+                continue
+            # the file is in place whoever holds the job now
+            if cache is not None and res.get("audio_hash"):
+                cache.remember_hash(res["new_file_path"], res["audio_hash"])
+            if manifest is not None:
+                manifest.record_result(res, copied=bool(copy_to))
+            if queue.complete(owner, file_path, res):
+                done += 1
+            else:
+                lease_lost(file_path)
+    finally:
+        beating.cancel()
+        if cache is not None:
+            cache.close()
+        if manifest is not None:
+            manifest.close()
+        queue.close()
+
+    line = f"[{owner}] completed {done} file(s), {failed} failed."
+    if lost:
+        line += f" Lost {lost} lease(s) to other workers."
+    print(line)
+    return {"completed": done, "failed": failed, "lost": lost}
@@ -0,0 +1,189 @@
+# auto_tag/journal.py
+"""
+Write-ahead journal of a modifying run.
+
+Every recognition answer, and every move/copy before it happens, is
+appended to a JSON-lines journal at the root of the library, followed by
+records of the move and of the tag write once they are done. When a run
+dies halfway, `--resume` reads the journal back: answers are reused
+instead of calling Shazam again, operations cut short are finished, and
+files already placed are left alone. `--rollback` uses the same records
+to move files back where they came from.
+"""
+
+from __future__ import annotations
+
+import glob
+import json
+import os
+import threading
+
+from auto_tag.manifest import ScanManifest
+
+JOURNAL_NAME = ".auto_tag_journal"
+
+
+def journal_path(library_dir: str, worker: int | None = None) -> str:
+    """Journal of the run (or of one --workers process) in library_dir."""
+    suffix = "" if worker is None else f"-{worker + 1}"
+    return os.path.join(library_dir, f"{JOURNAL_NAME}{suffix}.jsonl")
+
+
+def journal_files(library_dir: str) -> list[str]:
+    """Journals of the latest run in library_dir."""
+    pattern = os.path.join(glob.escape(library_dir), f"{JOURNAL_NAME}*")
+    return sorted(
+        p
+        for p in glob.glob(pattern)
+        if p.endswith(".jsonl") and not p.endswith(".prev.jsonl")
+    )
+
+
+def rotate_journals(library_dir: str) -> bool:
+    """
+    Move the journals of the previous run aside (as *.prev.jsonl) before a
+    new run starts. Return True if that run had not finished.
+    """
+    unfinished = not JournalState.load(library_dir).finished
+    _set_aside(library_dir)
+    return unfinished
+
+
+class OperationJournal:
+    """
+    Append-only journal file. Records announcing a filesystem change are
+    synced to disk before the change is made; the others are only
+    flushed. Thread-safe, as moves and tag writes run on a thread pool.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._fh = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def log(self, op: str, *, sync: bool = False, **fields) -> None:
+        line = json.dumps({"op": op, **fields}, ensure_ascii=False)
+        with self._lock:
+            self._fh.write(line + "\n")
+            self._fh.flush()
+            if sync:
+                os.fsync(self._fh.fileno())
+
+    def recognized(self, file_path: str, out: dict) -> None:
+        self.log("recognized", path=os.path.abspath(file_path), out=out)
+
+    def planned(self, res: dict, *, copied: bool) -> None:
+        """Announce the move (or copy) and tagging of a planned result."""
+        self.log("planned", sync=True, res=_absolute(res), copy=copied)
+
+    def moved(self, res: dict) -> None:
+        self.log("moved", sync=True, **_paths(res))
+
+    def tagged(self, res: dict) -> None:
+        rewrite = bool(res.get("tag_rewrite"))
+        self.log("tagged", rewrite=rewrite, **_paths(res))
+
+    def finish(self) -> None:
+        """Mark the run as complete: nothing is left to resume."""
+        self.log("end", sync=True)
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class JournalState:
+    """
+    What the journals of the latest run say: recognition answers by
+    source path, operations announced but never completed, and the
+    operations that did complete (source path -> destination path).
+    """
+
+    def __init__(self) -> None:
+        self.recognized: dict[str, dict] = {}
+        self.pending: dict[str, dict] = {}
+        self.completed: dict[str, str] = {}
+        self.moves: list[tuple[str, str]] = []
+        self.finished = True
+
+    @classmethod
+    def load(cls, library_dir: str) -> JournalState:
+        state = cls()
+        for path in journal_files(library_dir):
+            state._read(path)
+        return state
+
+    def _read(self, path: str) -> None:
+        finished = False
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # a record torn by the crash ends the journal
+                op = entry.get("op")
+                if op == "recognized":
+                    self.recognized[entry["path"]] = entry["out"]
+                elif op == "planned":
+                    res = entry["res"]
+                    self.pending[res["file_path"]] = entry
+                    if not entry["copy"]:
+                        self.moves.append(
+                            (res["file_path"], res["new_file_path"])
+                        )
+                elif op == "tagged":
+                    self.pending.pop(entry["src"], None)
+                    self.completed[entry["src"]] = entry["dest"]
+                finished = op == "end"
+        self.finished = self.finished and finished
+
+    def answer(self, file_path: str) -> dict | None:
+        """The recognition answer journaled for file_path, if any."""
+        out = self.recognized.get(os.path.abspath(file_path))
+        return dict(out) if out is not None else None
+
+
+def rollback(
+    library_dir: str, manifest: ScanManifest | None = None
+) -> tuple[int, list[str]]:
+    """
+    Move the files the latest run moved back to their original paths,
+    newest first, then set its journals aside. A file is only moved back
+    when its original path is free; the others are returned, untouched.
+    Copies are left in place, and tags are not restored. Files moved
+    back are dropped from manifest, so the next run processes them.
+    """
+    state = JournalState.load(library_dir)
+    restored, kept = 0, []
+    for src, dest in reversed(state.moves):
+        if not os.path.exists(dest) or os.path.exists(src):
+            if os.path.exists(dest) and dest != src:
+                kept.append(dest)
+            continue
+        os.makedirs(os.path.dirname(src), exist_ok=True)
+        os.rename(dest, src)
+        restored += 1
+        if manifest is not None:
+            manifest.forget(dest)
+            manifest.forget(src)
+    _set_aside(library_dir)
+    return restored, kept
+
+
+def _set_aside(library_dir: str) -> None:
+    for path in journal_files(library_dir):
+        os.replace(path, path[: -len(".jsonl")] + ".prev.jsonl")
+
+
+def _absolute(res: dict) -> dict:
+    return dict(
+        res,
+        file_path=os.path.abspath(res["file_path"]),
+        new_file_path=os.path.abspath(res["new_file_path"]),
+    )
+
+
+def _paths(res: dict) -> dict:
+    return {
+        "src": os.path.abspath(res["file_path"]),
+        "dest": os.path.abspath(res["new_file_path"]),
+    }
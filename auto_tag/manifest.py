@@ -0,0 +1,112 @@
+# auto_tag/manifest.py
+"""
+Per-library scan manifest.
+
+A small SQLite file at the root of a library records, for every file
+that was processed, its path, size, mtime, audio hash and the result of
+its last recognition. Later runs only process files that are new or
+whose size/mtime changed since, which keeps nightly runs over a growing
+library proportional to what was added.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import sqlite3
+import time
+
+from auto_tag.utils import audio_hash
+
+MANIFEST_NAME = ".auto_tag_manifest.sqlite"
+
+
+class ScanManifest:
+    """
+    Record of the files already processed under one library root. A
+    readonly manifest only answers is_unchanged() and is never created:
+    opening one that does not exist raises sqlite3.OperationalError.
+    """
+
+    def __init__(
+        self,
+        library_dir: str,
+        path: str | None = None,
+        *,
+        readonly: bool = False,
+    ) -> None:
+        self.path = path or os.path.join(library_dir, MANIFEST_NAME)
+        if readonly:
+            uri = pathlib.Path(os.path.abspath(self.path)).as_uri()
+            self._db = sqlite3.connect(f"{uri}?mode=ro", timeout=30, uri=True)
+            return
+        self._db = sqlite3.connect(self.path, timeout=30)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path         TEXT PRIMARY KEY,
+                size         INTEGER NOT NULL,
+                mtime_ns     INTEGER NOT NULL,
+                audio_hash   TEXT,
+                result       TEXT NOT NULL,
+                processed_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.commit()
+
+    def is_unchanged(self, file_path: str) -> bool:
+        """Whether file_path was processed and has not changed since."""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return False
+        row = self._db.execute(
+            "SELECT 1 FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (os.path.abspath(file_path), st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        return row is not None
+
+    def record(
+        self, file_path: str, result: dict, audio_hash: str | None = None
+    ) -> None:
+        """
+        Record file_path (the file as it now is on disk, i.e. after any
+        move and tagging) together with the result that produced it.
+        """
+        st = os.stat(file_path)
+        self._db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                os.path.abspath(file_path),
+                st.st_size,
+                st.st_mtime_ns,
+                audio_hash or result.get("audio_hash"),
+                json.dumps(result),
+                time.time(),
+            ),
+        )
+        self._db.commit()
+
+    def record_result(self, res: dict, *, copied: bool) -> None:
+        """
+        Record the file a successful result left in the library: the
+        untouched original when copying, the renamed file otherwise.
+        """
+        if copied:
+            path = res["file_path"]
+        else:
+            path = res["new_file_path"]
+            if path != res["file_path"]:
+                self.forget(res["file_path"])
+        self.record(path, res, res.get("audio_hash") or audio_hash(path))
+
+    def forget(self, file_path: str) -> None:
+        self._db.execute(
+            "DELETE FROM files WHERE path = ?", (os.path.abspath(file_path),)
+        )
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,288 @@
+# auto_tag/metrics.py
+"""
+Per-file, per-stage timings.
+
+While a Metrics instance is active (set_metrics), the pipeline reports
+how long each file spends in every stage: discovery, hash, decode,
+shazam, retry_wait, cover, tag_write, move and total (first seen to
+recorded). Waits are stages of their own, so that queueing is not
+mistaken for work: decode_queue (for a free decode process),
+shazam_queue (for a concurrency slot) and rate_wait (for a rate limiter
+token). Timings are aggregated into fixed-bucket histograms and
+exported as a JSON summary and/or a Prometheus text file (for the node
+exporter's textfile collector), which shows which stage limits the
+throughput of a host. With no active instance, timing is a no-op.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Iterator
+
+STAGES = (
+    "discovery",
+    "hash",
+    "decode_queue",
+    "decode",
+    "shazam_queue",
+    "rate_wait",
+    "shazam",
+    "retry_wait",
+    "cover",
+    "tag_write",
+    "move",
+    "total",
+)
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    math.inf,
+)
+
+
+class Histogram:
+    """Count, sum, max and bucket counts of a stage's observations."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (max if +Inf)."""
+        rank, seen = q * self.count, 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return self.max if math.isinf(bound) else bound
+        return 0.0
+
+    def to_dict(self) -> dict:
+        cumulative, seen = {}, 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            seen += n
+            cumulative["+Inf" if math.isinf(bound) else f"{bound:g}"] = seen
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": round(self.max, 6),
+            "buckets": cumulative,
+        }
+
+
+class Metrics:
+    """
+    Thread-safe collector: stages are timed on the event loop, in the
+    tag threads and in the discovery thread alike. json_path and
+    prom_path are where export() writes; per-file timings are kept for
+    the JSON summary.
+    """
+
+    def __init__(
+        self,
+        *,
+        json_path: str | None = None,
+        prom_path: str | None = None,
+    ) -> None:
+        self.json_path = json_path
+        self.prom_path = prom_path
+        self.started = time.time()
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.counters: dict[str, int] = {}
+        self.files: dict[str, dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(
+        self, stage: str, seconds: float, file_path: str | None = None
+    ) -> None:
+        with self._lock:
+            self.stages.setdefault(stage, Histogram()).observe(seconds)
+            if file_path is not None:
+                timings = self.files.setdefault(file_path, {})
+                timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def spent(self, file_path: str | None, stages: Iterable[str]) -> float:
+        """Time recorded so far for file_path in the given stages."""
+        if file_path is None:
+            return 0.0
+        with self._lock:
+            timings = self.files.get(file_path, {})
+            return sum(timings.get(stage, 0.0) for stage in stages)
+
+    def summary(self) -> dict:
+        with self._lock:
+            elapsed = time.time() - self.started
+            done = self.counters.get("files_ok", 0)
+            return {
+                "started_at": self.started,
+                "elapsed": round(elapsed, 3),
+                "files_per_second": round(done / elapsed, 3)
+                if elapsed > 0
+                else 0.0,
+                "counters": dict(self.counters),
+                "stages": {
+                    stage: hist.to_dict()
+                    for stage, hist in self.stages.items()
+                    if hist.count
+                },
+                "files": [
+                    {
+                        "path": path,
+                        "stages": {
+                            k: round(v, 6) for k, v in timings.items()
+                        },
+                    }
+                    for path, timings in self.files.items()
+                ],
+            }
+
+    def prometheus(self) -> str:
+        """The histograms and counters in Prometheus text format."""
+        lines = [
+            "# HELP auto_tag_stage_seconds Time files spent in each stage.",
+            "# TYPE auto_tag_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, hist in self.stages.items():
+                if not hist.count:
+                    continue
+                seen = 0
+                for bound, n in zip(BUCKETS, hist.buckets):
+                    seen += n
+                    le = "+Inf" if math.isinf(bound) else f"{bound:g}"
+                    lines.append(
+                        f'auto_tag_stage_seconds_bucket{{stage="{stage}",'
+                        f'le="{le}"}} {seen}'
+                    )
+                lines.append(
+                    f'auto_tag_stage_seconds_sum{{stage="{stage}"}}'
+                    f" {hist.sum:.6f}"
+                )
+                lines.append(
+                    f'auto_tag_stage_seconds_count{{stage="{stage}"}}'
+                    f" {hist.count}"
+                )
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE auto_tag_{name}_total counter")
+                lines.append(f"auto_tag_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self) -> None:
+        """Write the configured JSON and Prometheus files."""
+        if self.json_path:
+            _write(self.json_path, json.dumps(self.summary(), indent=2))
+        if self.prom_path:
+            _write(self.prom_path, self.prometheus())
+
+
+def _write(path: str, text: str) -> None:
+    # replaced in one step, so a scraper never reads half a file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(text)
+    os.replace(tmp, path)
+
+
+_active: Metrics | None = None
+# file a worker thread or an asyncio task is busy with (see for_file)
+_current: ContextVar[str | None] = ContextVar("auto_tag_file", default=None)
+
+
+def set_metrics(metrics: Metrics | None) -> None:
+    """Make metrics the collector the pipeline reports to (None: off)."""
+    global _active
+    _active = metrics
+
+
+def get_metrics() -> Metrics | None:
+    return _active
+
+
+def observe(stage: str, seconds: float, file_path: str | None = None) -> None:
+    if _active is not None:
+        _active.observe(stage, seconds, file_path)
+
+
+def count(name: str, n: int = 1) -> None:
+    if _active is not None:
+        _active.count(name, n)
+
+
+@contextmanager
+def for_file(file_path: str) -> Iterator[None]:
+    """
+    Attribute the stages this thread (or asyncio task) times in the block
+    to file_path.
+    """
+    token = _current.set(file_path)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(
+    stage: str,
+    file_path: str | None = None,
+    *,
+    exclude: Iterable[str] = (),
+) -> Iterator[None]:
+    """
+    Time the block as stage of file_path (by default, the file of the
+    enclosing for_file block). Time the same file spends in the exclude
+    stages inside the block (e.g. the cover download within tag_write)
+    is not counted twice.
+    """
+    metrics = _active
+    if metrics is None:
+        yield
+        return
+    if file_path is None:
+        file_path = _current.get()
+    exclude = tuple(exclude)
+    before = metrics.spent(file_path, exclude) if exclude else 0.0
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if exclude:
+            elapsed -= metrics.spent(file_path, exclude) - before
+        metrics.observe(stage, elapsed, file_path)
@@ -0,0 +1,179 @@
+# auto_tag/pipeline.py
+"""
+Executors and stages of the batch pipeline.
+
+A file goes through three kinds of work that should not wait on each
+other: decoding and hashing (CPU bound, run in a process pool), the
+Shazam call (network bound, on the event loop, at most `concurrency` in
+flight) and the move/copy plus tag write (blocking file I/O, run by a
+TagStage on a thread pool). Each stage has its own worker count, and
+the stages are joined by bounded queues so a slow one applies
+back-pressure instead of piling up work in memory.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import (Executor, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+from typing import Any, Callable
+
+from auto_tag import metrics
+
+DEFAULT_DECODE_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_TAG_WORKERS = 4
+
+
+def decode_executor(workers: int) -> Executor | None:
+    """
+    Return a process pool of `workers` decoders, or None (the event
+    loop's default thread pool) when workers <= 0. Platforms without
+    working process pools fall back to threads.
+    """
+    if workers <= 0:
+        return None
+    try:
+        return ProcessPoolExecutor(max_workers=workers)
+    except (ImportError, NotImplementedError, OSError):
+        return ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="auto_tag-decode"
+        )
+
+
+def _call_timed(fn: Callable, *args, **kwargs) -> tuple[Any, float, float]:
+    # runs in the pool: when the call started (wall clock, comparable
+    # across processes) and how long it took
+    started = time.time()
+    start = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, started, time.perf_counter() - start
+
+
+async def run_timed(
+    executor: Executor | None,
+    stage: str,
+    file_path: str,
+    fn: Callable,
+    *args,
+    **kwargs,
+) -> Any:
+    """
+    Run fn(*args, **kwargs) on executor and return its result. The time
+    fn ran is recorded as stage of file_path and the time it waited for a
+    free worker as decode_queue; a call that raises is recorded as stage
+    as a whole.
+    """
+    loop = asyncio.get_running_loop()
+    submitted = time.time()
+    try:
+        out, started, seconds = await loop.run_in_executor(
+            executor, functools.partial(_call_timed, fn, *args, **kwargs)
+        )
+    except BaseException:
+        metrics.observe(stage, time.time() - submitted, file_path)
+        raise
+    metrics.observe("decode_queue", max(0.0, started - submitted), file_path)
+    metrics.observe(stage, seconds, file_path)
+    return out
+
+
+class BoundedShazam:
+    """
+    A Shazam client allowing at most `limit` requests in flight. The wait
+    for a free slot is timed as shazam_queue.
+    """
+
+    def __init__(self, shazam, limit: int) -> None:
+        self.shazam = shazam
+        self.slots = asyncio.Semaphore(max(1, limit))
+
+    async def recognize(self, data, *args, **kwargs) -> dict:
+        return await self._call(self.shazam.recognize, data, *args, **kwargs)
+
+    async def send_recognize_request_v2(self, sig, *args, **kwargs) -> dict:
+        return await self._call(
+            self.shazam.send_recognize_request_v2, sig, *args, **kwargs
+        )
+
+    async def _call(self, request, *args, **kwargs) -> dict:
+        with metrics.timed("shazam_queue"):
+            await self.slots.acquire()
+        try:
+            return await request(*args, **kwargs)
+        finally:
+            self.slots.release()
+
+    def __getattr__(self, name: str):
+        return getattr(self.shazam, name)
+
+
+class TagStage:
+    """
+    Run apply(item) on a pool of `workers` threads, fed through a queue
+    holding at most `maxsize` items (2 * workers by default). done(item,
+    result) is called back on the event loop, where thread-bound state
+    such as sqlite connections can be touched. An exception raised by
+    apply or done is re-raised by join().
+    """
+
+    def __init__(
+        self,
+        apply: Callable[[Any], Any],
+        done: Callable[[Any, Any], None],
+        *,
+        workers: int = DEFAULT_TAG_WORKERS,
+        maxsize: int | None = None,
+    ) -> None:
+        self.apply = apply
+        self.done = done
+        self.workers = max(1, workers)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize or 2 * self.workers)
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="auto_tag-tag"
+        )
+        self._tasks: list[asyncio.Task] = []
+        self._error: BaseException | None = None
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.ensure_future(self._run()) for _ in range(self.workers)
+        ]
+
+    async def put(self, item) -> None:
+        """Queue item, waiting while the stage is saturated."""
+        if self._error is not None:
+            raise self._error
+        await self.queue.put(item)
+
+    async def join(self) -> None:
+        """Wait until every queued item has been applied."""
+        await self.queue.join()
+        if self._error is not None:
+            raise self._error
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        # let writes already running finish rather than cut files short
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._pool.shutdown
+        )
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            try:
+                result = await loop.run_in_executor(
+                    self._pool, self.apply, item
+                )
+                self.done(item, result)
+            except Exception as exc:
+                if self._error is None:
+                    self._error = exc
+            finally:
+                self.queue.task_done()
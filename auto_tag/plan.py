@@ -0,0 +1,61 @@
+# auto_tag/plan.py
+"""
+Two-phase runs: export a plan, apply it later.
+
+`--plan out.jsonl` recognises the library without touching it and writes
+one line per file: the result dict of recognize_and_rename_file (new
+path, title, artist, album, cover) plus whether the file is to be copied.
+`--apply-plan out.jsonl` then carries out the moves, copies and tag
+writes in bulk, with no Shazam call, e.g. during a maintenance window.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+
+PLAN_VERSION = 1
+
+
+class PlanWriter:
+    """Writes a plan file: a header line, then one line per planned file."""
+
+    def __init__(self, path: str, library_dir: str) -> None:
+        self.path = path
+        self.entries = 0
+        self._fh = open(path, "w", encoding="utf-8")
+        self._write(
+            {
+                "plan": PLAN_VERSION,
+                "library": os.path.abspath(library_dir),
+                "created_at": time.time(),
+            }
+        )
+
+    def write(self, res: dict, *, copied: bool) -> None:
+        """Add a result of plan_rename() / recognize_and_rename_file()."""
+        self._write(
+            dict(
+                res,
+                file_path=os.path.abspath(res["file_path"]),
+                new_file_path=os.path.abspath(res["new_file_path"]),
+                copy=copied,
+            )
+        )
+        self.entries += 1
+
+    def close(self) -> None:
+        self._fh.close()
+
+    def _write(self, record: dict) -> None:
+        self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def read_plan(path: str) -> tuple[dict, list[dict]]:
+    """Return the header and the entries of a plan file."""
+    with open(path, encoding="utf-8") as fh:
+        records = [json.loads(line) for line in fh if line.strip()]
+    if not records or records[0].get("plan") != PLAN_VERSION:
+        raise ValueError(f"{path} is not a plan written by --plan")
+    return records[0], records[1:]
@@ -0,0 +1,163 @@
+# auto_tag/rate_limit.py
+"""
+Client-side rate limiting of Shazam calls.
+
+AdaptiveRateLimiter is a token bucket whose refill rate follows an
+additive-increase / multiplicative-decrease rule: it halves when errors
+or throttling responses spike and creeps back up to its ceiling once
+calls succeed again. RateLimitedShazam wraps a Shazam client so every
+recognize() call goes through one shared limiter; the wait for a token
+is timed as the rate_wait stage (see auto_tag.metrics).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import deque
+
+from aiohttp import ClientError
+from shazamio.exceptions import FailedDecodeJson
+
+from auto_tag import metrics
+
+DEFAULT_RATE = 2.0  # Shazam calls per second
+
+# Errors that come from the Shazam service rather than from decoding a
+# local file; only these count against the rate.
+NETWORK_ERRORS = (ClientError, asyncio.TimeoutError, FailedDecodeJson)
+
+
+def is_throttling(exc: BaseException) -> bool:
+    """
+    Whether exc looks like Shazam refusing to answer because of load.
+    Throttled requests come back as an HTML error page, which shazamio
+    reports as FailedDecodeJson.
+    """
+    if isinstance(exc, FailedDecodeJson) or getattr(exc, "status", 0) == 429:
+        return True
+    text = str(exc).lower()
+    return "429" in text or "too many requests" in text
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket of `burst` tokens refilled at `rate` per second, where
+    rate moves between min_rate and max_rate with recent outcomes.
+    """
+
+    def __init__(
+        self,
+        max_rate: float = DEFAULT_RATE,
+        *,
+        min_rate: float = 0.05,
+        burst: float = 1.0,
+        window: int = 20,
+        error_threshold: float = 0.25,
+    ) -> None:
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.burst = max(1.0, burst)
+        self.error_threshold = error_threshold
+        self.backoffs = 0  # number of times the rate was cut
+        self._outcomes: deque[bool] = deque(maxlen=window)  # True = error
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._last_cut = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a call may be made, then consume one token."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._stamp) * self.rate
+                )
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    @property
+    def error_ratio(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(self._outcomes) / len(self._outcomes)
+
+    @property
+    def backoff_level(self) -> int:
+        """How many halvings the current rate is below max_rate."""
+        return max(0, math.ceil(math.log2(self.max_rate / self.rate) - 1e-9))
+
+    def record_success(self) -> None:
+        self._outcomes.append(False)
+        if self.error_ratio < self.error_threshold / 2:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def record_failure(self, throttled: bool = False) -> None:
+        self._outcomes.append(True)
+        spiking = len(self._outcomes) >= 4 and (
+            self.error_ratio >= self.error_threshold
+        )
+        if not (throttled or spiking):
+            return
+        now = time.monotonic()
+        # One cut per refill period, so a burst of failures from calls
+        # already in flight does not collapse the rate to its floor.
+        if now - self._last_cut >= 1 / self.rate:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.backoffs += 1
+            self._last_cut = now
+        if throttled:
+            self._tokens = min(self._tokens, 0.0)
+
+    def state(self) -> dict:
+        """Current limiter state, for logging."""
+        return {
+            "rate": round(self.rate, 3),
+            "max_rate": self.max_rate,
+            "backoff_level": self.backoff_level,
+            "backoffs": self.backoffs,
+            "error_ratio": round(self.error_ratio, 3),
+        }
+
+    def __str__(self) -> str:
+        text = f"{self.rate:.2f}/s"
+        if self.backoff_level:
+            text += f" (backoff {self.backoff_level})"
+        return text
+
+
+class RateLimitedShazam:
+    """A Shazam client whose recognition requests share one limiter."""
+
+    def __init__(self, shazam, limiter: AdaptiveRateLimiter) -> None:
+        self.shazam = shazam
+        self.limiter = limiter
+
+    async def recognize(self, data, *args, **kwargs) -> dict:
+        return await self._call(self.shazam.recognize, data, *args, **kwargs)
+
+    async def send_recognize_request_v2(self, sig, *args, **kwargs) -> dict:
+        return await self._call(
+            self.shazam.send_recognize_request_v2, sig, *args, **kwargs
+        )
+
+    async def _call(self, request, *args, **kwargs) -> dict:
+        with metrics.timed("rate_wait"):
+            await self.limiter.acquire()
+        try:
+            out = await request(*args, **kwargs)
+        except NETWORK_ERRORS as exc:
+            self.limiter.record_failure(is_throttling(exc))
+            raise
+        self.limiter.record_success()
+        return out
+
+    def __getattr__(self, name: str):
+        return getattr(self.shazam, name)
+
@@ -0,0 +1,110 @@
+# auto_tag/results.py
+"""
+Rows of the GUI's results table, kept apart from Tk.
+
+A Treeview holding one item per file takes seconds to fill, sort or
+re-check once a preview reaches tens of thousands of files. The GUI
+therefore keeps every result in a ResultsModel and only shows the slice
+of rows that fits on screen (see window()); rows stream in while the
+scan runs, and checking, unchecking or sorting everything is a single
+pass over a Python list, whatever the size of the library.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+
+COLUMNS = ("apply", "old", "new")
+
+
+def _name(res: dict, field: str) -> str:
+    return os.path.basename(res.get(field, "") or "")
+
+
+_SORT_KEYS = {
+    "apply": lambda res: not res.get("apply"),
+    "old": lambda res: _name(res, "file_path").lower(),
+    "new": lambda res: _name(res, "new_file_path").lower(),
+}
+
+
+class ResultsModel:
+    """
+    Scan results in display order. append() may be called from the scan
+    thread; everything else is meant for the Tk thread.
+    """
+
+    def __init__(self) -> None:
+        self.rows: list[dict] = []
+        self.sorted_by: str | None = None
+        self.descending = False
+        self._incoming: list[dict] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index: int) -> dict:
+        return self.rows[index]
+
+    def append(self, res: dict) -> None:
+        """Queue a result; it shows up at the next drain()."""
+        with self._lock:
+            self._incoming.append(res)
+
+    def drain(self) -> int:
+        """Move the queued results into rows; return how many arrived."""
+        with self._lock:
+            incoming, self._incoming = self._incoming, []
+        self.rows.extend(incoming)
+        return len(incoming)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._incoming.clear()
+        self.rows.clear()
+        self.sorted_by = None
+        self.descending = False
+
+    def window(self, first: int, count: int) -> list[dict]:
+        """The rows a view scrolled to row first, count rows high, shows."""
+        return self.rows[max(0, first) : max(0, first) + count]
+
+    @staticmethod
+    def values(res: dict) -> tuple[str, str, str]:
+        """Cell texts of a row, in COLUMNS order."""
+        return (
+            "Yes" if res.get("apply") else "No",
+            _name(res, "file_path"),
+            _name(res, "new_file_path"),
+        )
+
+    def toggle(self, index: int) -> bool:
+        res = self.rows[index]
+        res["apply"] = not res.get("apply", True)
+        return res["apply"]
+
+    def set_all(self, apply: bool) -> None:
+        for res in self.rows:
+            res["apply"] = apply
+
+    def sort(self, column: str) -> None:
+        """
+        Sort by column (see COLUMNS); sorting again by the same column
+        reverses the order. Stable, so ties keep their previous order.
+        """
+        if column == self.sorted_by:
+            self.descending = not self.descending
+        else:
+            self.sorted_by, self.descending = column, False
+        self.rows.sort(key=_SORT_KEYS[column], reverse=self.descending)
+
+    def rename(self, index: int, name: str) -> None:
+        """Change the file name a row is to be given, keeping its folder."""
+        res = self.rows[index]
+        folder = os.path.dirname(res.get("new_file_path", "") or "")
+        res["new_file_path"] = os.path.join(folder, name) if folder else name
+
+    def checked(self) -> list[dict]:
+        return [res for res in self.rows if res.get("apply")]
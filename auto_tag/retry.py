@@ -0,0 +1,73 @@
+# auto_tag/retry.py
+"""
+Deferred retries for failed recognitions.
+
+Rather than sleeping inline after a failure (which holds up every file
+queued behind it), the batch driver parks failed files in a RetryQueue
+and runs them again once the main pass is done, each after its own
+exponential, jittered backoff.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import NamedTuple
+
+MAX_BACKOFF = 300.0
+
+
+def backoff_delay(
+    attempt: int, base: float, cap: float = MAX_BACKOFF
+) -> float:
+    """
+    Seconds to wait after failed attempt number `attempt` (1-based).
+    The ceiling doubles with every attempt; the actual delay is drawn
+    between half the ceiling and the ceiling so that files failing
+    together do not all retry at the same instant.
+    """
+    if base <= 0:
+        return 0.0
+    ceiling = min(cap, base * 2 ** (attempt - 1))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class PendingRetry(NamedTuple):
+    seq: int  # discovery index, so retried files keep a stable order
+    path: str
+    attempts: int  # attempts made so far
+    ready_at: float  # time.monotonic() after which it may run again
+
+
+class RetryQueue:
+    """Failed files waiting for another attempt, within nbr_retry."""
+
+    def __init__(self, *, delay: float, nbr_retry: int) -> None:
+        self.delay = delay
+        self.nbr_retry = nbr_retry
+        self._items: list[PendingRetry] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def defer(self, seq: int, path: str, attempts: int) -> bool:
+        """
+        Queue path for another attempt; False once its retry budget
+        (nbr_retry attempts in total) is spent.
+        """
+        if attempts >= self.nbr_retry:
+            return False
+        ready_at = time.monotonic() + backoff_delay(attempts, self.delay)
+        self._items.append(PendingRetry(seq, path, attempts, ready_at))
+        return True
+
+    def take(self) -> list[PendingRetry]:
+        """Remove and return every queued file, in discovery order."""
+        items, self._items = sorted(self._items), []
+        return items
+
+    @staticmethod
+    async def wait(item: PendingRetry) -> None:
+        """Sleep until item's backoff has elapsed."""
+        await asyncio.sleep(max(0.0, item.ready_at - time.monotonic()))
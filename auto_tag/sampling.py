@@ -0,0 +1,88 @@
+# auto_tag/sampling.py
+"""
+Cut the short sample Shazam actually needs out of an audio file.
+
+Instead of handing a whole track to shazamio, a window of a few seconds
+is decoded with soundfile/libsndfile (MP3 and OGG alike), mixed down to
+mono, resampled to the 16 kHz Shazam fingerprints at and encoded as an
+in-memory 16-bit WAV. Decode time, memory and payload size per file are
+therefore constant, whatever the length of the track.
+"""
+
+from __future__ import annotations
+
+import io
+
+import numpy as np
+import soundfile as sf
+
+# Shazam builds its signature from 10 s of audio; keep a little margin.
+SAMPLE_SECONDS = 12.0
+SAMPLE_RATE = 16000
+# Intros quieter than this (dBFS) are skipped, up to MAX_SILENCE_SKIP s.
+SILENCE_DB = -45.0
+MAX_SILENCE_SKIP = 30.0
+
+
+def read_sample(
+    file_path: str,
+    *,
+    offset: float | None = None,
+    seconds: float = SAMPLE_SECONDS,
+    sample_rate: int = SAMPLE_RATE,
+) -> bytes:
+    """
+    Return `seconds` of file_path as mono WAV bytes at sample_rate.
+
+    The window starts `offset` seconds into the track (centred on the
+    track when offset is None) and is moved forward past any silence.
+    It is clamped so that it always fits inside the track.
+    """
+    with sf.SoundFile(file_path) as src:
+        rate = src.samplerate
+        count = min(src.frames, int(seconds * rate))
+        last_start = max(0, src.frames - count)
+        if offset is None:
+            start = last_start // 2
+        else:
+            start = min(int(max(0.0, offset) * rate), last_start)
+        if src.seekable():
+            start = _skip_silence(src, start, last_start)
+            src.seek(start)
+        pcm = src.read(count, dtype="float32", always_2d=True)
+
+    mono = pcm.mean(axis=1)
+    if rate != sample_rate:
+        mono = _resample(mono, rate, sample_rate)
+    buf = io.BytesIO()
+    sf.write(buf, mono, sample_rate, format="WAV", subtype="PCM_16")
+    return buf.getvalue()
+
+
+def _skip_silence(src: sf.SoundFile, start: int, last_start: int) -> int:
+    """
+    Advance start in 1 s steps while the audio there is silent.
+    If everything up to the skip limit is silent, start is kept.
+    """
+    step = src.samplerate
+    threshold = 10 ** (SILENCE_DB / 20)
+    limit = min(last_start, start + int(MAX_SILENCE_SKIP * step))
+    pos = start
+    while pos < limit:
+        src.seek(pos)
+        block = src.read(step, dtype="float32", always_2d=True)
+        if not len(block) or np.sqrt(np.mean(block**2)) >= threshold:
+            return pos
+        pos += step
+    return start
+
+
+def _resample(mono: np.ndarray, rate: int, target: int) -> np.ndarray:
+    """Linear resampling, box-filtered first when downsampling."""
+    if rate > target:
+        width = int(round(rate / target))
+        if width > 1:
+            mono = np.convolve(mono, np.ones(width) / width, mode="same")
+    n_out = int(len(mono) * target / rate)
+    positions = np.arange(n_out) * (rate / target)
+    return np.interp(positions, np.arange(len(mono)), mono)
@@ -0,0 +1,81 @@
+# auto_tag/signatures.py
+"""
+Local Shazam signatures.
+
+Shazam matches a compact fingerprint (the "signature") of a few seconds
+of audio. With the "signature" engine, signatures are computed by
+shazamio's Rust core in the decode process pool, cached by audio hash,
+and only the signature is sent to Shazam: retrying or re-running a file
+costs no decoding, and CPU-bound signature work scales across cores
+while the network stage stays busy.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import NamedTuple
+
+ENGINES = ("sample", "signature")
+DEFAULT_ENGINE = "sample"
+
+
+class LocalSignature(NamedTuple):
+    """
+    A signature as shazamio's send_recognize_request_v2() reads it.
+    Only the URI and sample length are kept (the Rust object cannot be
+    pickled back from a worker process); the timestamp is taken when
+    the signature is sent.
+    """
+
+    uri: str
+    samples: int  # milliseconds of audio
+
+    @property
+    def signature(self) -> LocalSignature:
+        return self
+
+    @property
+    def timestamp(self) -> int:
+        # shazamio_core stamps signatures with epoch ms wrapped to 32 bits
+        return int(time.time() * 1000) % 2**32
+
+
+def signature_window(offset: float | None, seconds: float) -> str:
+    """Cache key of the sample window a signature was computed from."""
+    start = "centre" if offset is None else f"{offset:g}"
+    return f"{start}+{seconds:g}"
+
+
+def generate_signature(
+    file_path: str,
+    *,
+    offset: float | None = None,
+    seconds: float | None = None,
+) -> LocalSignature:
+    """
+    Compute the signature of a seconds-long window of file_path (see
+    read_sample, whose SAMPLE_SECONDS is the default); seconds <= 0 lets
+    shazamio pick a segment of the file itself. Blocking and CPU
+    bound, meant for a process pool.
+    """
+    # numpy/soundfile load on first use, not when main.py reads ENGINES
+    from auto_tag.sampling import SAMPLE_SECONDS, read_sample
+
+    if seconds is None:
+        seconds = SAMPLE_SECONDS
+    data = None
+    if seconds > 0:
+        data = read_sample(file_path, offset=offset, seconds=seconds)
+    sig = asyncio.run(_sign(file_path, data, seconds))
+    return LocalSignature(sig.signature.uri, sig.signature.samples)
+
+
+async def _sign(file_path: str, data: bytes | None, seconds: float):
+    # the Rust recognizer hands its work back to a running event loop
+    from shazamio_core import Recognizer
+
+    if data is None:
+        return await Recognizer().recognize_path(value=file_path, options=None)
+    recognizer = Recognizer(segment_duration_seconds=max(1, int(seconds)))
+    return await recognizer.recognize_bytes(value=data, options=None)
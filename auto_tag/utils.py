@@ -1,5 +1,13 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import struct
+
 from unidecode import unidecode
 
+_HASH_CHUNK = 1 << 20
+
 
 def find_deepest_metadata_key(data, search_key):
     """
@@ -59,3 +67,78 @@ def sanitize(s: str, trace: bool) -> str:
             print("sanitize produced empty string for:", original)
         s = "Unknown"
     return s
+
+
+def audio_hash(file_path: str) -> str:
+    """
+    Hash the audio payload of file_path, leaving tags out.
+
+    ID3v2/ID3v1 blocks of MP3s and the Vorbis/Opus header pages of OGGs
+    are skipped, so retagging or renaming a file keeps the same hash.
+    Anything that cannot be parsed is hashed whole.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    ext = os.path.splitext(file_path)[1].lower()
+    with open(file_path, "rb") as fh:
+        if ext == ".ogg" and _hash_ogg_pages(fh, digest):
+            return digest.hexdigest()
+        fh.seek(0)
+        digest = hashlib.blake2b(digest_size=20)
+        if ext == ".mp3":
+            start, end = _mp3_audio_span(fh)
+        else:
+            start, end = 0, os.fstat(fh.fileno()).st_size
+        fh.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = fh.read(min(_HASH_CHUNK, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def _mp3_audio_span(fh) -> tuple[int, int]:
+    """Return the (start, end) byte offsets of MP3 data between ID3 tags."""
+    fh.seek(0, os.SEEK_END)
+    end = fh.tell()
+    start = 0
+    fh.seek(0)
+    header = fh.read(10)
+    if len(header) == 10 and header[:3] == b"ID3":
+        size = 0
+        for byte in header[6:10]:
+            size = (size << 7) | (byte & 0x7F)
+        start = 10 + size + (10 if header[5] & 0x10 else 0)
+    if end - start >= 128:
+        fh.seek(end - 128)
+        if fh.read(3) == b"TAG":
+            end -= 128
+    return min(start, end), end
+
+
+def _hash_ogg_pages(fh, digest) -> bool:
+    """
+    Feed the payload of every OGG audio page into digest.
+
+    The header pages carry the comments and cover art and are repaginated
+    when those are rewritten (which also renumbers the following pages and
+    changes their CRCs), so only the payloads of the pages from the first
+    positive granule position onwards are hashed.
+    """
+    seen_page, in_headers = False, True
+    while True:
+        header = fh.read(27)
+        if not header:
+            return seen_page
+        if len(header) < 27 or header[:4] != b"OggS":
+            return False
+        granule = struct.unpack("<q", header[6:14])[0]
+        lacing = fh.read(header[26])
+        payload = fh.read(sum(lacing))
+        if granule > 0:
+            in_headers = False
+        if not in_headers:
+            digest.update(payload)
+        seen_page = True
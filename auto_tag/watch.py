@@ -0,0 +1,253 @@
+# auto_tag/watch.py
+"""
+Watch-folder mode.
+
+`--watch` keeps running after the first pass over the library and
+processes files as they are dropped into it. Filesystem events come
+from watchdog (inotify, FSEvents, ReadDirectoryChangesW) when it is
+installed; otherwise the tree is polled every few seconds. A file is
+only handed to find_and_recognize_audio_files once its size and
+modification time have stopped changing for `settle` seconds, so files
+still being copied are not recognised half-written.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from typing import Iterable
+
+from auto_tag.audio_recognize import (RunSession,
+                                      find_and_recognize_audio_files,
+                                      print_summary)
+from auto_tag.discovery import is_audio_file, iter_audio_files
+from auto_tag.manifest import ScanManifest
+
+# Options of find_and_recognize_audio_files that go into the RunSession
+# shared by every batch
+SESSION_OPTIONS = (
+    "modify",
+    "concurrency",
+    "rate",
+    "decode_workers",
+    "use_cache",
+    "refresh_cache",
+    "resume",
+)
+
+# Seconds a file must stay unchanged before it is processed
+DEFAULT_SETTLE = 2.0
+# Seconds between two scans of the tree when watchdog is not installed
+POLL_INTERVAL = 2.0
+
+
+def _signature(path: str) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class Debouncer:
+    """
+    Paths seen changing, released once they have been stable (same size
+    and mtime) for settle seconds. A path that disappears is dropped.
+    """
+
+    def __init__(self, settle: float = DEFAULT_SETTLE) -> None:
+        self.settle = settle
+        self._pending: dict[str, tuple[tuple[int, int] | None, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def touch(self, path: str, now: float | None = None) -> None:
+        """Record that path changed (again): its settle time restarts."""
+        now = time.monotonic() if now is None else now
+        self._pending[path] = (_signature(path), now)
+
+    def ready(self, now: float | None = None) -> list[str]:
+        """Pop the paths that have settled, in the order they were seen."""
+        now = time.monotonic() if now is None else now
+        settled = []
+        for path, (sig, since) in list(self._pending.items()):
+            current = _signature(path)
+            if current is None:
+                del self._pending[path]
+            elif current != sig:
+                self._pending[path] = (current, now)
+            elif now - since >= self.settle:
+                del self._pending[path]
+                settled.append(path)
+        return settled
+
+
+class PollingSource:
+    """Scan the tree every interval seconds; report new or changed files."""
+
+    def __init__(
+        self,
+        folder_path: str,
+        extensions: Iterable[str],
+        interval: float = POLL_INTERVAL,
+    ) -> None:
+        self.folder_path = folder_path
+        self.extensions = tuple(extensions)
+        self.interval = interval
+        self._seen: dict[str, tuple[int, int] | None] = {}
+        self._task: asyncio.Task | None = None
+
+    def start(self, loop: asyncio.AbstractEventLoop, changed) -> None:
+        self._task = loop.create_task(self._run(changed))
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self, changed) -> None:
+        loop = asyncio.get_running_loop()
+        # the first scan only records what is already there
+        await loop.run_in_executor(None, self._scan)
+        while True:
+            await asyncio.sleep(self.interval)
+            for path in await loop.run_in_executor(None, self._scan):
+                changed(path)
+
+    def _scan(self) -> list[str]:
+        seen = {
+            path: _signature(path)
+            for path in iter_audio_files(self.folder_path, self.extensions)
+        }
+        changes = [p for p, sig in seen.items() if self._seen.get(p) != sig]
+        self._seen = seen
+        return changes
+
+
+class WatchdogSource:
+    """Report the files watchdog sees created, modified or moved in."""
+
+    def __init__(self, folder_path: str, extensions: Iterable[str]) -> None:
+        from watchdog.observers import Observer
+
+        self.folder_path = folder_path
+        self.extensions = tuple(extensions)
+        self._observer = Observer()
+
+    def start(self, loop: asyncio.AbstractEventLoop, changed) -> None:
+        from watchdog.events import FileSystemEventHandler
+
+        extensions = self.extensions
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event) -> None:
+                if event.is_directory or event.event_type == "deleted":
+                    return
+                path = getattr(event, "dest_path", "") or event.src_path
+                if is_audio_file(path, extensions):
+                    loop.call_soon_threadsafe(changed, path)
+
+        self._observer.schedule(Handler(), self.folder_path, recursive=True)
+        self._observer.start()
+
+    def stop(self) -> None:
+        self._observer.stop()
+        self._observer.join()
+
+
+def change_source(
+    folder_path: str, extensions: Iterable[str], *, poll: bool = False
+) -> PollingSource | WatchdogSource:
+    """watchdog when it is installed (and poll is not set), else polling."""
+    if not poll:
+        try:
+            return WatchdogSource(folder_path, extensions)
+        except ImportError:
+            pass
+    return PollingSource(folder_path, extensions, POLL_INTERVAL)
+
+
+async def watch_folder(
+    folder_path: str,
+    *,
+    extensions: Iterable[str] = ("mp3", "ogg"),
+    settle: float = DEFAULT_SETTLE,
+    poll: bool = False,
+    stop: asyncio.Event | None = None,
+    trace: bool = False,
+    **options,
+) -> None:
+    """
+    Process folder_path once, then every audio file that appears or
+    changes in it, until stop is set (or the task is cancelled).
+    options go to find_and_recognize_audio_files; every batch shares one
+    RunSession, so the Shazam client and its rate limiter, the decode
+    pool and the journal (which --rollback then undoes as a whole) last
+    as long as the watch. Files the library manifest records as
+    processed and unchanged, such as those the previous batch just
+    renamed, are not processed again.
+    """
+    exts = tuple(extensions)
+    stop = stop or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    debouncer = Debouncer(settle)
+    wake = asyncio.Event()
+
+    def changed(path: str) -> None:
+        debouncer.touch(path)
+        wake.set()
+
+    session = await RunSession.open(
+        folder_path,
+        trace=trace,
+        **{key: options[key] for key in SESSION_OPTIONS if key in options},
+    )
+    source = change_source(folder_path, exts, poll=poll)
+    source.start(loop, changed)
+    options.update(extensions=exts, trace=trace, session=session)
+    try:
+        summary = await find_and_recognize_audio_files(folder_path, **options)
+        print_summary(
+            summary,
+            modify=options.get("modify", True),
+            folder_path=folder_path,
+            extensions=exts,
+        )
+        if trace:
+            print(f"Watching {folder_path} for new files...")
+        while not stop.is_set():
+            # Idle: sleep until an event arrives. Files pending: check
+            # them again a few times per settle period.
+            timeout = None if not len(debouncer) else max(0.1, settle / 4)
+            wake.clear()
+            waiters = [
+                asyncio.ensure_future(wake.wait()),
+                asyncio.ensure_future(stop.wait()),
+            ]
+            await asyncio.wait(
+                waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for waiter in waiters:
+                waiter.cancel()
+            batch = _new_files(session.manifest, debouncer.ready())
+            if batch and not stop.is_set():
+                summary = await find_and_recognize_audio_files(
+                    folder_path, files=batch, **options
+                )
+                print(
+                    f"Processed {summary['processed']} new file(s),"
+                    f" {summary['succeeded']} succeeded."
+                )
+    finally:
+        source.stop()
+        session.close()
+
+
+def _new_files(
+    manifest: ScanManifest | None, paths: list[str]
+) -> list[str]:
+    """Drop the paths the library manifest records as unchanged."""
+    if manifest is None:
+        return paths
+    return [p for p in paths if not manifest.is_unchanged(p)]
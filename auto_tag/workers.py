@@ -0,0 +1,120 @@
+# auto_tag/workers.py
+"""
+Multi-process (--workers) mode of the CLI.
+
+One event loop keeps decoding, hashing and tag serialisation of a batch
+on a single core. run_workers() lists the library once, splits it into
+contiguous shards (so an album usually stays in one worker) and runs
+find_and_recognize_audio_files() on each shard in its own process, with
+its own event loop and Shazam client. Workers allocate destination
+names from one DestinationIndex hosted by a multiprocessing manager, so
+two of them never pick the same path, and their summaries are merged
+into one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.managers import SyncManager
+from typing import Iterable
+
+from auto_tag.audio_recognize import (find_and_recognize_audio_files,
+                                      prepare_journal)
+from auto_tag.discovery import iter_audio_files
+from auto_tag.destinations import DestinationIndex
+from auto_tag.pipeline import DEFAULT_DECODE_WORKERS
+from auto_tag.rate_limit import DEFAULT_RATE
+
+
+class _IndexManager(SyncManager):
+    """Hosts the DestinationIndex shared by the workers."""
+
+
+_IndexManager.register("DestinationIndex", DestinationIndex)
+
+
+def shard(files: list[str], workers: int) -> list[list[str]]:
+    """Split files into at most `workers` contiguous, non-empty shards."""
+    size = math.ceil(len(files) / max(1, workers)) or 1
+    return [files[i:i + size] for i in range(0, len(files), size)]
+
+
+def merge_summaries(summaries: Iterable[dict]) -> dict:
+    """Add up the per-worker summaries of find_and_recognize_audio_files."""
+    merged: dict = {}
+    for summary in summaries:
+        for key, value in summary.items():
+            if value is None:
+                merged.setdefault(key, None)
+            else:
+                merged[key] = (merged.get(key) or 0) + value
+    return merged
+
+
+async def run_workers(
+    folder_path: str,
+    workers: int,
+    *,
+    extensions: list[str] | tuple[str, ...] = ("mp3", "ogg"),
+    rate: float = DEFAULT_RATE,
+    decode_workers: int = DEFAULT_DECODE_WORKERS,
+    **options,
+) -> dict:
+    """
+    Process folder_path with `workers` processes and return the merged
+    summary. options are passed on to find_and_recognize_audio_files.
+    rate is shared out so the workers together stay under it, and so are
+    the decode processes (a worker left with none decodes on threads).
+    The journal of the previous run is dealt with here, once, before the
+    workers start (see prepare_journal).
+    """
+    resumed = 0
+    if options.get("modify", True):
+        resumed = await prepare_journal(
+            folder_path,
+            resume=options.get("resume", False),
+            trace=options.get("trace", False),
+        )
+    files = list(iter_audio_files(folder_path, extensions))
+    shards = shard(files, workers)
+    if not shards:
+        return {"processed": 0, "skipped": 0, "resumed": resumed}
+
+    options.update(
+        extensions=extensions,
+        rate=rate / len(shards),
+        decode_workers=decode_workers // len(shards),
+    )
+    loop = asyncio.get_running_loop()
+    with _IndexManager() as manager:
+        index = manager.DestinationIndex()
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            runs = [
+                loop.run_in_executor(
+                    pool, _run_shard, folder_path, i, paths, index, options
+                )
+                for i, paths in enumerate(shards)
+            ]
+            summaries = await asyncio.gather(*runs)
+    return merge_summaries([*summaries, {"resumed": resumed}])
+
+
+def _run_shard(
+    folder_path: str,
+    index: int,
+    paths: list[str],
+    destinations: DestinationIndex,
+    options: dict,
+) -> dict:
+    """Worker process entry point: one event loop for one shard."""
+    return asyncio.run(
+        find_and_recognize_audio_files(
+            folder_path,
+            files=paths,
+            destinations=destinations,
+            worker=index,
+            **options,
+        )
+    )
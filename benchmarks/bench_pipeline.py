@@ -0,0 +1,358 @@
+# benchmarks/bench_pipeline.py
+"""
+Throughput benchmark of find_and_recognize_audio_files.
+
+A synthetic library (see synthetic.py) is recognised against StubShazam
+(see stub.py) instead of the real service, so the numbers measure the
+pipeline itself (discovery, hashing, decoding, tag writes, moves and the
+scheduling around them) under a chosen network latency, jitter and
+failure rate. Each run reports files per second, the peak resident set
+size of the process and of its decode workers, and the time spent in
+each stage (see auto_tag.metrics), as JSON:
+
+    python -m benchmarks.bench_pipeline --files 500 --formats mp3,ogg \\
+        --lengths 30,240 --latency 0.3 --jitter 0.1 --failure-rate 0.05 \\
+        --concurrency 8 --output bench.json
+
+Pass --compare with the JSON of an earlier version to flag a throughput
+drop or a memory increase beyond --tolerance; the exit status is then 1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from auto_tag import audio_recognize, metrics
+from auto_tag.pipeline import DEFAULT_DECODE_WORKERS, DEFAULT_TAG_WORKERS
+from auto_tag.signatures import DEFAULT_ENGINE, ENGINES
+from benchmarks.stub import StubShazam
+from benchmarks.synthetic import FORMATS, generate_library
+
+RESULT_VERSION = 1
+# Relative change beyond which --compare reports a regression
+DEFAULT_TOLERANCE = 0.10
+
+
+def peak_rss() -> dict:
+    """Peak RSS in MiB of this process and of its reaped children."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return {"self_mib": None, "children_mib": None}
+    # ru_maxrss is in KiB on Linux, in bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self_mib": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1
+        ),
+        "children_mib": round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1
+        ),
+    }
+
+
+def code_version() -> dict:
+    """The package version and, in a git checkout, the commit."""
+    from importlib import metadata
+
+    try:
+        version = metadata.version("mp3ShazamAutoTag")
+    except metadata.PackageNotFoundError:
+        version = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"version": version, "commit": commit}
+
+
+async def _run_once(library: str, stub: StubShazam, options: dict) -> dict:
+    collector = metrics.Metrics()
+    metrics.set_metrics(collector)
+    original = audio_recognize.Shazam
+    audio_recognize.Shazam = lambda: stub
+    start = time.perf_counter()
+    try:
+        # the driver's own summary goes to stderr, the JSON to stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            summary = await audio_recognize.find_and_recognize_audio_files(
+                library, use_cache=False, **options
+            )
+    finally:
+        elapsed = time.perf_counter() - start
+        audio_recognize.Shazam = original
+        metrics.set_metrics(None)
+    timings = collector.summary()
+    return {
+        "elapsed": round(elapsed, 3),
+        "files_per_second": round(summary["succeeded"] / elapsed, 3)
+        if elapsed > 0
+        else 0.0,
+        "summary": summary,
+        "counters": timings["counters"],
+        "stages": timings["stages"],
+    }
+
+
+def run_benchmark(
+    *,
+    files: int = 100,
+    formats: tuple[str, ...] = ("mp3",),
+    lengths: tuple[float, ...] = (30.0,),
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    failure_rate: float = 0.0,
+    failure: str = "raise",
+    seed: int | None = 0,
+    repeat: int = 1,
+    work_dir: str | None = None,
+    **options,
+) -> dict:
+    """
+    Generate the library once, then recognise a fresh copy of it repeat
+    times; options go to find_and_recognize_audio_files (concurrency,
+    rate, delay, nbr_retry, engine, decode_workers, tag_workers...).
+    Return the machine-readable result (see RESULT_VERSION).
+    """
+    options.setdefault("rate", 0)
+    options.setdefault("delay", 0)
+    own_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="auto_tag-bench-")
+    source = os.path.join(work_dir, "library")
+    try:
+        start = time.perf_counter()
+        if not os.path.isdir(source):
+            generate_library(
+                source, files, formats=formats, lengths=lengths
+            )
+        generated = time.perf_counter() - start
+        runs = []
+        for i in range(repeat):
+            library = os.path.join(work_dir, f"run-{i}")
+            shutil.rmtree(library, ignore_errors=True)
+            shutil.copytree(source, library)
+            stub = StubShazam(
+                latency=latency,
+                jitter=jitter,
+                failure_rate=failure_rate,
+                failure=failure,
+                seed=None if seed is None else seed + i,
+            )
+            run = asyncio.run(_run_once(library, stub, options))
+            run["shazam_calls"] = stub.calls
+            run["shazam_failures"] = stub.failures
+            runs.append(run)
+            shutil.rmtree(library, ignore_errors=True)
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "result_version": RESULT_VERSION,
+        "created_at": time.time(),
+        "code": code_version(),
+        "host": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "files": files,
+            "formats": list(formats),
+            "lengths": list(lengths),
+            "latency": latency,
+            "jitter": jitter,
+            "failure_rate": failure_rate,
+            "failure": failure,
+            "seed": seed,
+            "repeat": repeat,
+            "options": options,
+        },
+        "generate_seconds": round(generated, 3),
+        "files_per_second": statistics.median(
+            run["files_per_second"] for run in runs
+        ),
+        "peak_rss": peak_rss(),
+        "runs": runs,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    The regressions of result against baseline: files per second lower,
+    or peak RSS higher, by more than tolerance (a fraction).
+    """
+    problems = []
+    old, new = baseline["files_per_second"], result["files_per_second"]
+    if old and new < old * (1 - tolerance):
+        problems.append(
+            f"files/sec dropped from {old} to {new}"
+            f" ({(new - old) / old:+.1%})"
+        )
+    for key in ("self_mib", "children_mib"):
+        old = baseline.get("peak_rss", {}).get(key)
+        new = result["peak_rss"].get(key)
+        if old and new and new > old * (1 + tolerance):
+            problems.append(
+                f"peak RSS ({key}) grew from {old} to {new} MiB"
+                f" ({(new - old) / old:+.1%})"
+            )
+    if baseline.get("config") != result["config"]:
+        problems.append("warning: the baseline was run with another config")
+    return problems
+
+
+def _csv(kind):
+    def parse(value: str) -> tuple:
+        return tuple(kind(v) for v in value.split(",") if v)
+
+    return parse
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the recognition pipeline on a synthetic"
+        " library against a Shazam stub."
+    )
+    library = parser.add_argument_group("synthetic library")
+    library.add_argument("--files", type=int, default=100)
+    library.add_argument(
+        "--formats",
+        type=_csv(str),
+        default=("mp3",),
+        help=f"Comma-separated, among {', '.join(FORMATS)} (default: mp3)",
+    )
+    library.add_argument(
+        "--lengths",
+        type=_csv(float),
+        default=(30.0,),
+        help="Comma-separated track lengths in seconds (default: 30)",
+    )
+    library.add_argument(
+        "--work-dir",
+        help="Where to generate the library; an existing library there is"
+        " reused (default: a temporary folder, removed afterwards)",
+    )
+    stub = parser.add_argument_group("Shazam stub")
+    stub.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds per call"
+    )
+    stub.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="Standard deviation of the latency, in seconds",
+    )
+    stub.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.0,
+        help="Probability that a call fails (0-1)",
+    )
+    stub.add_argument(
+        "--failure",
+        choices=("raise", "empty"),
+        default="raise",
+        help="How a call fails: an exception or an empty answer",
+    )
+    stub.add_argument("--seed", type=int, default=0)
+    pipe = parser.add_argument_group("pipeline")
+    pipe.add_argument("--concurrency", type=int, default=4)
+    pipe.add_argument(
+        "--rate",
+        type=float,
+        default=0,
+        help="Shazam calls per second; 0 disables the limiter (default)",
+    )
+    pipe.add_argument("--delay", type=float, default=0)
+    pipe.add_argument("--nbr-retry", type=int, default=3)
+    pipe.add_argument("--engine", choices=ENGINES, default=DEFAULT_ENGINE)
+    pipe.add_argument(
+        "--decode-workers", type=int, default=DEFAULT_DECODE_WORKERS
+    )
+    pipe.add_argument("--tag-workers", type=int, default=DEFAULT_TAG_WORKERS)
+    pipe.add_argument(
+        "--no-modify",
+        action="store_true",
+        help="Recognise only; do not move or tag the files",
+    )
+    out = parser.add_argument_group("results")
+    out.add_argument("--repeat", type=int, default=1)
+    out.add_argument("--output", help="Write the JSON here (default: stdout)")
+    out.add_argument(
+        "--compare", help="JSON of an earlier run to check for regressions"
+    )
+    out.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Relative change --compare accepts (default: 0.10)",
+    )
+    args = parser.parse_args(argv)
+    for fmt in args.formats:
+        if fmt not in FORMATS:
+            parser.error(f"unsupported format: {fmt}")
+
+    result = run_benchmark(
+        files=args.files,
+        formats=args.formats,
+        lengths=args.lengths,
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        failure=args.failure,
+        seed=args.seed,
+        repeat=args.repeat,
+        work_dir=args.work_dir,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        delay=args.delay,
+        nbr_retry=args.nbr_retry,
+        engine=args.engine,
+        decode_workers=args.decode_workers,
+        tag_workers=args.tag_workers,
+        modify=not args.no_modify,
+    )
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    print(
+        f"{result['files_per_second']} files/s,"
+        f" peak RSS {result['peak_rss']['self_mib']} MiB"
+        f" (+ {result['peak_rss']['children_mib']} MiB in workers)",
+        file=sys.stderr,
+    )
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        problems = compare(result, baseline, args.tolerance)
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        if any(not p.startswith("warning:") for p in problems):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+# benchmarks/stub.py
+"""
+A stand-in for shazamio.Shazam with configurable behaviour.
+
+Every call sleeps latency seconds (give or take a normally distributed
+jitter), then fails with probability failure_rate; otherwise it answers
+with a track of its own, numbered so that no two files get the same
+name. Failures are either an exception (as a throttled or dropped
+request raises) or an empty answer (as an unrecognised sample gets).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import random
+
+
+class StubShazam:
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        failure: str = "raise",
+        seed: int | None = None,
+    ) -> None:
+        if failure not in ("raise", "empty"):
+            raise ValueError(f"unknown failure mode: {failure}")
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure = failure
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._tracks = itertools.count(1)
+
+    async def recognize(self, data, *args, **kwargs) -> dict:
+        return await self._answer()
+
+    async def send_recognize_request_v2(self, sig, *args, **kwargs) -> dict:
+        return await self._answer()
+
+    async def _answer(self) -> dict:
+        self.calls += 1
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.gauss(0.0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._random.random() < self.failure_rate:
+            self.failures += 1
+            if self.failure == "raise":
+                raise RuntimeError("stub: simulated Shazam failure")
+            return {}
+        n = next(self._tracks)
+        return {
+            "track": {
+                "title": f"Track {n:06d}",
+                "subtitle": "Benchmark",
+                "images": {"coverart": ""},
+                "sections": [
+                    {"metadata": [{"title": "Album", "text": "Synthetic"}]}
+                ],
+            }
+        }
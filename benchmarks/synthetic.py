@@ -0,0 +1,140 @@
+# benchmarks/synthetic.py
+"""
+Synthetic audio libraries for the benchmarks.
+
+Encoding long tracks is slow, so one template is encoded per (format,
+length) and every file of the library is a copy of it, made unique so
+that duplicate grouping (see auto_tag.duplicates) does not collapse the
+library into a handful of recognitions: MP3 copies get a distinct
+trailer after the last frame, OGG copies a distinct last audio page
+(with its CRC recomputed, since mutagen refuses pages that do not
+check out).
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import struct
+from typing import Iterable
+
+FORMATS = {"mp3": ("MP3", "MPEG_LAYER_III"), "ogg": ("OGG", "VORBIS")}
+SAMPLE_RATE = 44100
+# Encode in blocks: writing a long track in one call crashes some
+# libsndfile builds and keeps the whole signal in memory
+BLOCK_SECONDS = 5
+
+
+def encode_template(path: str, fmt: str, seconds: float) -> None:
+    """Write a stereo tone of the given length to path, in format fmt."""
+    import numpy as np
+    import soundfile as sf
+
+    container, subtype = FORMATS[fmt]
+    total = int(seconds * SAMPLE_RATE)
+    with sf.SoundFile(
+        path,
+        "w",
+        samplerate=SAMPLE_RATE,
+        channels=2,
+        format=container,
+        subtype=subtype,
+    ) as out:
+        for start in range(0, total, BLOCK_SECONDS * SAMPLE_RATE):
+            end = min(total, start + BLOCK_SECONDS * SAMPLE_RATE)
+            t = np.arange(start, end)
+            tone = 0.3 * np.sin(2 * np.pi * 440.0 * t / SAMPLE_RATE)
+            out.write(np.column_stack((tone, tone)).astype("float32"))
+
+
+def _crc_table() -> list[int]:
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = (crc << 1) ^ 0x04C11DB7 if crc & 0x80000000 else crc << 1
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def _ogg_crc(data: bytes) -> int:
+    """The CRC-32 of an Ogg page (polynomial 0x04C11DB7, no reflection)."""
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _CRC_TABLE[(crc >> 24) ^ byte]
+    return crc
+
+
+def _mark_ogg(path: str, mark: bytes) -> None:
+    """Overwrite the end of the last page's payload with mark."""
+    with open(path, "r+b") as fh:
+        data = fh.read()
+        start = data.rindex(b"OggS")
+        segments = data[start + 26]
+        payload = start + 27 + segments
+        page = bytearray(data[start:])
+        if len(page) - (payload - start) < len(mark):
+            raise ValueError(f"{path}: last page too short to mark")
+        page[len(page) - len(mark) :] = mark
+        page[22:26] = b"\0\0\0\0"
+        page[22:26] = struct.pack("<I", _ogg_crc(bytes(page)))
+        fh.seek(start)
+        fh.write(page)
+
+
+def make_unique_copy(template: str, dest: str, index: int) -> None:
+    """Copy template to dest, changing its audio payload by index."""
+    shutil.copyfile(template, dest)
+    mark = struct.pack(">I", index)
+    if dest.lower().endswith(".ogg"):
+        _mark_ogg(dest, mark)
+    else:
+        # trailing bytes after the last frame: players skip them, the
+        # audio hash (which stops at an ID3v1 tag or the end) sees them
+        with open(dest, "ab") as fh:
+            fh.write(b"auto_tag-bench" + mark)
+
+
+def generate_library(
+    folder: str,
+    files: int,
+    *,
+    formats: Iterable[str] = ("mp3",),
+    lengths: Iterable[float] = (30.0,),
+    template_dir: str | None = None,
+) -> list[str]:
+    """
+    Fill folder with files audio files, cycling through every
+    (format, length) combination, spread over one sub-folder per 100
+    files. Templates are encoded into template_dir (a "-templates"
+    sibling of folder by default, so they are not part of the library)
+    and reused when already there. Return the paths made.
+    """
+    combos = [(fmt, float(s)) for fmt in formats for s in lengths]
+    if not combos:
+        raise ValueError("at least one format and one length are needed")
+    for fmt, _ in combos:
+        if fmt not in FORMATS:
+            raise ValueError(f"unsupported format: {fmt}")
+    template_dir = template_dir or folder.rstrip("/\\") + "-templates"
+    os.makedirs(template_dir, exist_ok=True)
+    templates = {}
+    for fmt, seconds in combos:
+        path = os.path.join(template_dir, f"tone-{seconds:g}s.{fmt}")
+        if not os.path.exists(path):
+            encode_template(path + ".part", fmt, seconds)
+            os.replace(path + ".part", path)
+        templates[fmt, seconds] = path
+
+    made = []
+    for i in range(files):
+        fmt, seconds = combos[i % len(combos)]
+        subdir = os.path.join(folder, f"disc-{i // 100:04d}")
+        os.makedirs(subdir, exist_ok=True)
+        dest = os.path.join(subdir, f"track-{i:06d}-{seconds:g}s.{fmt}")
+        make_unique_copy(templates[fmt, seconds], dest, i)
+        made.append(dest)
+    return made
@@ -1,11 +1,20 @@
 # auto_tag/main.py
+"""
+Command line entry point. Only lightweight modules are imported up
+front; each mode imports what it needs (tkinter for the GUI, shazamio,
+eyed3, soundfile... for a scan), so --help, --rollback or a GUI launch
+do not pay for the others.
+"""
 
 import argparse
 import asyncio
+import multiprocessing
 import os
 
-from auto_tag.audio_recognize import find_and_recognize_audio_files
-from auto_tag.gui import launch_gui
+from auto_tag.duplicates import DEFAULT_DUPLICATE_MODE, DUPLICATE_MODES
+from auto_tag.metrics import Metrics, set_metrics
+from auto_tag.pipeline import DEFAULT_DECODE_WORKERS, DEFAULT_TAG_WORKERS
+from auto_tag.signatures import DEFAULT_ENGINE, ENGINES
 
 
 def str2bool(v):
@@ -43,8 +52,8 @@ async def main():
         "--delay",
         type=int,
         default=10,
-        help="Delay in seconds between retries if Shazam API call fails"
-        "(default: 10)",
+        help="Base delay in seconds of the exponential backoff before a"
+        " failed file is retried (default: 10)",
     )
     parser.add_argument(
         "-n",
@@ -98,15 +107,208 @@ async def main():
         default=None,
         help="Copy files to this directory instead of moving them",
     )
+    parser.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of Shazam recognitions to run in parallel (default: 1)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not use the on-disk recognition cache",
+    )
+    parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Ignore cached recognitions but store the new results",
+    )
+    parser.add_argument(
+        "-r",
+        "--rate",
+        type=float,
+        default=2.0,
+        help="Maximum Shazam calls per second; lowered automatically while"
+        " Shazam throttles or fails, 0 disables the limit (default: 2)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Process every file again, including those the library"
+        " manifest records as already processed and unchanged",
+    )
+    parser.add_argument(
+        "--sample-offset",
+        type=float,
+        default=None,
+        help="Seconds into each track where the recognition sample starts"
+        " (default: middle of the track)",
+    )
+    parser.add_argument(
+        "--sample-length",
+        type=float,
+        default=12.0,
+        help="Seconds of audio decoded and sent to Shazam, 0 sends the"
+        " whole file (default: 12)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default=DEFAULT_ENGINE,
+        help="How files are sent to Shazam: 'sample' uploads the decoded"
+        " sample, 'signature' computes (and caches) the signature locally"
+        f" and sends only that (default: {DEFAULT_ENGINE})",
+    )
+    parser.add_argument(
+        "--duplicates",
+        choices=DUPLICATE_MODES,
+        default=DEFAULT_DUPLICATE_MODE,
+        help="Copies of the same audio are recognised once; 'share' applies"
+        " the answer to every copy, 'report' also lists the copies, 'skip'"
+        " lists them and leaves them untouched"
+        f" (default: {DEFAULT_DUPLICATE_MODE})",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run from the library's journal,"
+        " without repeating its Shazam calls or file operations",
+    )
+    parser.add_argument(
+        "--rollback",
+        action="store_true",
+        help="Move the files of the last run back to where they were, then"
+        " exit (tags are not restored)",
+    )
+    parser.add_argument(
+        "--plan",
+        metavar="FILE",
+        default=None,
+        help="Recognise without changing anything and write each result and"
+        " its destination to FILE (JSON lines)",
+    )
+    parser.add_argument(
+        "--apply-plan",
+        metavar="FILE",
+        default=None,
+        help="Carry out the moves, copies and tag writes of a plan written"
+        " by --plan, without calling Shazam, then exit",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running after the first pass and process new or changed"
+        " files as they are dropped into the directory",
+    )
+    parser.add_argument(
+        "--queue",
+        metavar="FILE",
+        default=None,
+        help="Work as one of several workers (possibly on other hosts)"
+        " sharing the job queue FILE, an SQLite file on the shared volume",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        default=None,
+        help="Write per-stage timings (histograms and per-file) to FILE as"
+        " JSON at the end of the run",
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        metavar="FILE",
+        default=None,
+        help="Write per-stage timing histograms to FILE in Prometheus text"
+        " format at the end of the run",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes sharing the files, each with its own event loop and"
+        " Shazam client; --rate and --decode-workers are split between"
+        " them (default: 1)",
+    )
+    parser.add_argument(
+        "--decode-workers",
+        type=int,
+        default=DEFAULT_DECODE_WORKERS,
+        help="Processes decoding and hashing audio, 0 uses threads instead"
+        f" (default: {DEFAULT_DECODE_WORKERS})",
+    )
+    parser.add_argument(
+        "--tag-workers",
+        type=int,
+        default=DEFAULT_TAG_WORKERS,
+        help="Threads moving files and writing tags"
+        f" (default: {DEFAULT_TAG_WORKERS})",
+    )
 
     args = parser.parse_args()
+    if args.plan and args.workers > 1:
+        parser.error("--plan cannot be combined with --workers")
+    if args.watch and (args.workers > 1 or args.plan):
+        parser.error("--watch cannot be combined with --workers or --plan")
+    if args.queue and (args.workers > 1 or args.plan or args.watch):
+        parser.error(
+            "--queue cannot be combined with --workers, --plan or --watch"
+        )
+    if args.queue and not args.modify:
+        # a job is only done once its file is moved and tagged
+        parser.error("--queue cannot be combined with --modify false")
+    if args.queue:
+        # a queue worker handles one leased file at a time
+        unsupported = [
+            option
+            for option, dest in (
+                ("--concurrency", "concurrency"),
+                ("--duplicates", "duplicates"),
+                ("--resume", "resume"),
+                ("--decode-workers", "decode_workers"),
+                ("--tag-workers", "tag_workers"),
+            )
+            if getattr(args, dest) != parser.get_default(dest)
+        ]
+        if unsupported:
+            parser.error(
+                f"--queue cannot be combined with {', '.join(unsupported)}"
+            )
+    if (args.metrics or args.metrics_prom) and args.workers > 1:
+        parser.error("--metrics cannot be combined with --workers")
+
+    metrics = None
+    if args.metrics or args.metrics_prom:
+        metrics = Metrics(json_path=args.metrics, prom_path=args.metrics_prom)
+        set_metrics(metrics)
+    try:
+        await run(args)
+    finally:
+        # also written when a --watch run is stopped with Ctrl+C
+        if metrics is not None:
+            metrics.export()
+
+
+async def run(args: argparse.Namespace) -> None:
+    if args.rollback:
+        undo_last_run(args.directory)
+    elif args.apply_plan:
+        from auto_tag.audio_recognize import apply_plan
+
+        await apply_plan(
+            args.apply_plan, trace=args.trace, tag_workers=args.tag_workers
+        )
+    elif args.gui:
+        from auto_tag.gui import launch_gui
 
-    if args.gui:
         launch_gui()
     else:
+        from auto_tag.audio_recognize import (find_and_recognize_audio_files,
+                                              print_summary)
+
         exts = [ext.strip().lower() for ext in args.extensions.split(",")]
-        await find_and_recognize_audio_files(
-            folder_path=args.directory,
+        options = dict(
             modify=args.modify,
             delay=args.delay,
             nbr_retry=args.nbrRetry,
@@ -115,8 +317,91 @@ async def main():
             output_dir=args.output,
             plex_structure=args.plex,
             copy_to=args.copy,
+            concurrency=args.concurrency,
+            use_cache=not args.no_cache,
+            refresh_cache=args.refresh_cache,
+            sample_offset=args.sample_offset,
+            sample_seconds=args.sample_length,
+            rate=args.rate,
+            full_scan=args.full,
+            decode_workers=args.decode_workers,
+            tag_workers=args.tag_workers,
+            engine=args.engine,
+            duplicates=args.duplicates,
+            resume=args.resume,
+            plan=args.plan,
         )
+        if args.queue:
+            from auto_tag.job_queue import run_queue_worker
+
+            await run_queue_worker(
+                args.directory,
+                args.queue,
+                **{
+                    key: options[key]
+                    for key in (
+                        "delay",
+                        "nbr_retry",
+                        "trace",
+                        "extensions",
+                        "output_dir",
+                        "plex_structure",
+                        "copy_to",
+                        "use_cache",
+                        "refresh_cache",
+                        "sample_offset",
+                        "sample_seconds",
+                        "rate",
+                        "engine",
+                        "full_scan",
+                    )
+                },
+            )
+        elif args.watch:
+            from auto_tag.watch import watch_folder
+
+            await watch_folder(args.directory, **options)
+        elif args.workers > 1:
+            from auto_tag.workers import run_workers
+
+            summary = await run_workers(
+                args.directory, args.workers, **options
+            )
+            print_summary(
+                summary,
+                modify=args.modify,
+                folder_path=args.directory,
+                extensions=exts,
+            )
+        else:
+            await find_and_recognize_audio_files(
+                folder_path=args.directory, **options
+            )
+
+
+def undo_last_run(directory: str) -> None:
+    import sqlite3
+
+    from auto_tag.journal import rollback
+    from auto_tag.manifest import ScanManifest
+
+    try:
+        manifest = ScanManifest(directory)
+    except (OSError, sqlite3.Error):
+        manifest = None
+    try:
+        restored, kept = rollback(directory, manifest)
+    finally:
+        if manifest is not None:
+            manifest.close()
+    print(f"Moved {restored} file(s) back.")
+    if kept:
+        print("Left in place, their original path is taken:")
+        for path in kept:
+            print(f"  {path}")
 
 
 if __name__ == "__main__":
+    # the decode process pool must not re-run main() in a frozen build
+    multiprocessing.freeze_support()
     asyncio.run(main())
\ No newline at end of file
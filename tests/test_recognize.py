@@ -1,19 +1,38 @@
+import asyncio
 import os
 import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import eyed3
 import pytest
 
-from auto_tag import audio_recognize
+from auto_tag import audio_recognize, discovery, workers
 from auto_tag.audio_recognize import recognize_and_rename_file
+from auto_tag.cache import RecognitionCache
+from auto_tag.destinations import DestinationIndex, first_free
+from auto_tag.journal import OperationJournal, journal_path, rollback
+from auto_tag.manifest import MANIFEST_NAME
+from auto_tag.utils import audio_hash
 
 
 # -------------------------------------------------
-# Dummy Shazam stub that returns metadata based on extension
+# Dummy Shazam stub that returns metadata based on extension; a decoded
+# sample (bytes) is answered as coming from an `ext` file
 # -------------------------------------------------
 class DummyShazam:
-    async def recognize(self, file_path):
-        ext = os.path.splitext(file_path)[1].lower()
+    def __init__(self, ext="mp3"):
+        self.ext = f".{ext}"
+
+    async def recognize(self, data):
+        if isinstance(data, str):
+            ext = os.path.splitext(data)[1].lower()
+        else:
+            ext = self.ext
         if ext == ".mp3":
             return {
                 "track": {
@@ -46,6 +65,10 @@ class DummyShazam:
 # Extensions to test
 test_extensions = ["mp3", "ogg"]
 
+# Real tag writers, kept before the autouse fixture below stubs them out
+real_update_mp3_tags = audio_recognize.update_mp3_tags
+real_update_ogg_tags = audio_recognize.update_ogg_tags
+
 
 # -------------------------------------------------
 # Disable actual tag-writing so tests don’t depend on real audio
@@ -55,9 +78,6 @@ def patch_tag_functions(monkeypatch):
     monkeypatch.setattr(
         audio_recognize, "update_mp3_tags", lambda *a, **k: None
     )
-    monkeypatch.setattr(
-        audio_recognize, "update_mp3_cover_art", lambda *a, **k: None
-    )
     monkeypatch.setattr(
         audio_recognize, "update_ogg_tags", lambda *a, **k: None
     )
@@ -87,7 +107,7 @@ async def test_recognize_and_rename_file_flat(tmp_path, ext):
 
     result = await recognize_and_rename_file(
         file_path=str(dest),
-        shazam=DummyShazam(),
+        shazam=DummyShazam(ext),
         modify=True,
         delay=0,
         nbr_retry=1,
@@ -123,7 +143,7 @@ async def test_recognize_and_rename_file_with_plex(tmp_path, ext):
 
     result = await recognize_and_rename_file(
         file_path=str(dest),
-        shazam=DummyShazam(),
+        shazam=DummyShazam(ext),
         modify=True,
         delay=0,
         nbr_retry=1,
@@ -160,7 +180,7 @@ async def test_copy_to_directory_flat(tmp_path, ext):
 
     result = await recognize_and_rename_file(
         file_path=str(dest),
-        shazam=DummyShazam(),
+        shazam=DummyShazam(ext),
         modify=True,
         delay=0,
         nbr_retry=1,
@@ -198,7 +218,7 @@ async def test_copy_to_directory_with_plex(tmp_path, ext):
 
     result = await recognize_and_rename_file(
         file_path=str(dest),
-        shazam=DummyShazam(),
+        shazam=DummyShazam(ext),
         modify=True,
         delay=0,
         nbr_retry=1,
@@ -210,4 +230,1350 @@ async def test_copy_to_directory_with_plex(tmp_path, ext):
 
     assert result.get("new_file_path") == str(expected)
     assert expected.exists(), f"Copied file not found at {expected}"
-    assert dest.exists(), "Original file should still exist"
\ No newline at end of file
+    assert dest.exists(), "Original file should still exist"
+
+# -------------------------------------------------
+# Concurrent recognition keeps discovery-order naming
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_concurrent_recognition_is_deterministic(tmp_path, monkeypatch):
+    """
+    Later files finish first, yet ' (n)' suffixes must follow discovery
+    order, and more than one recognition must have been in flight.
+    """
+    library = tmp_path / "library"
+    library.mkdir()
+    src = Path(__file__).parent / "fileToTest.mp3"
+    names = ["a.mp3", "b.mp3", "c.mp3", "d.mp3"]
+    for i, name in enumerate(names):
+        # pad each copy differently so they can be told apart afterwards
+        (library / name).write_bytes(src.read_bytes() + b"\0" * i)
+
+    in_flight = peak = 0
+
+    class SlowShazam(DummyShazam):
+        async def recognize(self, file_path):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            order = names.index(os.path.basename(file_path))
+            await asyncio.sleep(0.05 * (len(names) - order))
+            in_flight -= 1
+            return await super().recognize(file_path)
+
+    monkeypatch.setattr(audio_recognize, "Shazam", SlowShazam)
+    copy_to = tmp_path / "copies"
+
+    await audio_recognize.find_and_recognize_audio_files(
+        str(library),
+        delay=0,
+        nbr_retry=1,
+        copy_to=str(copy_to),
+        concurrency=4,
+        use_cache=False,
+        rate=0,
+        sample_seconds=0,  # send paths, so the stub can tell files apart
+    )
+
+    assert peak > 1
+    base = "Drive My Car - The Beatles - Rubber Soul"
+    expected = [f"{base}.mp3"] + [f"{base} ({i}).mp3" for i in range(1, 4)]
+    for i, name in enumerate(expected):
+        copied = copy_to / name
+        assert copied.stat().st_size == (library / names[i]).stat().st_size
+
+
+# -------------------------------------------------
+# Recognition cache
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_cache_skips_network_on_hit(tmp_path):
+    """
+    A second recognition of the same audio, even under another name,
+    is answered from the cache without calling Shazam.
+    """
+    calls = 0
+
+    class CountingShazam(DummyShazam):
+        async def recognize(self, file_path):
+            nonlocal calls
+            calls += 1
+            return await super().recognize(file_path)
+
+    src = Path(__file__).parent / "fileToTest.mp3"
+    first, second = tmp_path / "first.mp3", tmp_path / "second.mp3"
+    shutil.copy2(src, first)
+    shutil.copy2(src, second)
+    cache = RecognitionCache(str(tmp_path / "cache.sqlite"))
+
+    results, calls_per_file = [], []
+    for path in (first, second):
+        before = calls
+        results.append(
+            await recognize_and_rename_file(
+                file_path=str(path),
+                shazam=CountingShazam(),
+                modify=False,
+                delay=0,
+                nbr_retry=1,
+                trace=False,
+                output_dir=None,
+                plex_structure=False,
+                cache=cache,
+            )
+        )
+        calls_per_file.append(calls - before)
+    cache.close()
+
+    assert calls_per_file[0] > 0 and calls_per_file[1] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert results[0]["title"] == results[1]["title"] == "Drive My Car"
+
+
+def test_cache_refresh_and_eviction(tmp_path):
+    cache = RecognitionCache(str(tmp_path / "cache.sqlite"), max_entries=10)
+    song = tmp_path / "song.mp3"
+    song.write_bytes(b"")
+    cache.remember_hash(str(song), "h0")
+    for i in range(11):
+        cache.put(f"h{i}", {"title": str(i)})
+    assert cache.get("h0") is None  # least recently used, evicted
+    assert cache.known_hash(str(song)) is None  # evicted along with it
+    assert cache.get("h10") == {"title": "10"}
+    cache.close()
+
+    refreshing = RecognitionCache(
+        str(tmp_path / "cache.sqlite"), refresh=True
+    )
+    assert refreshing.get("h10") is None
+    refreshing.close()
+
+
+def test_audio_hash_ignores_tags(tmp_path):
+    import eyed3
+
+    path = tmp_path / "song.mp3"
+    shutil.copy2(Path(__file__).parent / "fileToTest.mp3", path)
+    before = audio_hash(str(path))
+
+    audio = eyed3.load(str(path))
+    if audio.tag is None:
+        audio.initTag()
+    audio.tag.title = "A much longer title than the original one"
+    audio.tag.save()
+
+    assert audio_hash(str(path)) == before
+
+
+def test_audio_hash_ignores_ogg_comments(tmp_path):
+    import numpy as np
+    import soundfile as sf
+    from mutagen.oggvorbis import OggVorbis
+
+    path = tmp_path / "song.ogg"
+    noise = np.random.default_rng(0).uniform(-0.3, 0.3, 44100 * 3)
+    sf.write(str(path), noise, 44100, format="OGG", subtype="VORBIS")
+    before = audio_hash(str(path))
+
+    audio = OggVorbis(str(path))
+    audio["TITLE"] = ["x" * 5000]  # forces the header pages to grow
+    audio.save()
+
+    assert audio_hash(str(path)) == before
+
+
+# -------------------------------------------------
+# Recognition works on a bounded in-memory sample
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_long_ogg_sent_as_bounded_sample(tmp_path):
+    import numpy as np
+    import soundfile as sf
+
+    from auto_tag import sampling
+
+    path = tmp_path / "long.ogg"
+    rate = 22050
+    noise = np.random.default_rng(0).uniform(-0.3, 0.3, rate * 60)
+    sf.write(str(path), noise, rate, format="OGG", subtype="VORBIS")
+    received = []
+
+    class RecordingShazam(DummyShazam):
+        async def recognize(self, data):
+            received.append(data)
+            return await DummyShazam.recognize(self, str(path))
+
+    out = await audio_recognize.recognize_audio(
+        str(path),
+        shazam=RecordingShazam(),
+        delay=0,
+        nbr_retry=1,
+        trace=False,
+    )
+
+    assert out["track"]["title"] == "Bring Me To Life"
+    assert len(received) == 1 and isinstance(received[0], bytes)
+    # mono 16-bit PCM at 16 kHz, plus the WAV header
+    window = int(sampling.SAMPLE_SECONDS * sampling.SAMPLE_RATE) * 2
+    assert window <= len(received[0]) < window + 1024
+
+
+@pytest.mark.asyncio
+async def test_failed_sample_is_not_resent_as_whole_file(tmp_path):
+    path = tmp_path / "a.mp3"
+    shutil.copy2(Path(__file__).parent / "fileToTest.mp3", path)
+    received = []
+
+    class ThrottledShazam:
+        async def recognize(self, data):
+            received.append(data)
+            raise RuntimeError("429 Too Many Requests")
+
+    out = await audio_recognize.recognize_audio(
+        str(path),
+        shazam=ThrottledShazam(),
+        delay=0,
+        nbr_retry=1,
+        trace=False,
+    )
+
+    assert out is None
+    assert len(received) == 1 and isinstance(received[0], bytes)
+
+
+def test_sample_skips_silent_intro(tmp_path):
+    import io
+
+    import numpy as np
+    import soundfile as sf
+
+    from auto_tag.sampling import read_sample
+
+    path = tmp_path / "intro.ogg"
+    rate = 44100
+    audio = np.concatenate(
+        [
+            np.zeros(rate * 8),
+            np.random.default_rng(0).uniform(-0.3, 0.3, rate * 20),
+        ]
+    )
+    sf.write(str(path), audio, rate, format="OGG", subtype="VORBIS")
+
+    pcm, sr = sf.read(io.BytesIO(read_sample(str(path), offset=0)))
+
+    assert sr == 16000 and pcm.ndim == 1
+    assert np.sqrt(np.mean(pcm[:sr] ** 2)) > 0.05
+
+
+# -------------------------------------------------
+# Failed recognitions are retried after the main pass
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_failed_files_do_not_block_healthy_ones(tmp_path, monkeypatch):
+    library = tmp_path / "library"
+    library.mkdir()
+    src = Path(__file__).parent / "fileToTest.mp3"
+    for i, name in enumerate(("a.mp3", "b.mp3", "c.mp3")):
+        # distinct audio, or the copies would share a's recognition
+        (library / name).write_bytes(src.read_bytes() + b"\0" * i)
+
+    calls = []
+
+    class FlakyShazam(DummyShazam):
+        async def recognize(self, data):
+            name = os.path.basename(data)
+            calls.append(name)
+            if name == "a.mp3" and calls.count(name) < 3:
+                raise RuntimeError("throttled")
+            return await super().recognize(data)
+
+    monkeypatch.setattr(audio_recognize, "Shazam", FlakyShazam)
+    copy_to = tmp_path / "copies"
+
+    await audio_recognize.find_and_recognize_audio_files(
+        str(library),
+        delay=0.01,
+        nbr_retry=3,
+        copy_to=str(copy_to),
+        use_cache=False,
+        rate=0,
+        sample_seconds=0,
+    )
+
+    # b and c are handled before a is retried, twice, within its budget
+    assert calls == ["a.mp3", "b.mp3", "c.mp3", "a.mp3", "a.mp3"]
+    assert len(list(copy_to.iterdir())) == 3
+
+
+@pytest.mark.asyncio
+async def test_retry_round_is_bounded_like_the_main_pass(
+    tmp_path, monkeypatch
+):
+    library = tmp_path / "library"
+    library.mkdir()
+    src = Path(__file__).parent / "fileToTest.mp3"
+    for i in range(12):
+        (library / f"{i:02d}.mp3").write_bytes(src.read_bytes() + b"\0" * i)
+    held, peaks, calls = [0], [], []
+    lock = threading.Lock()
+
+    def fake_sample(file_path, **kwargs):
+        with lock:
+            held[0] += 1
+        return b"sample"
+
+    class DownShazam:
+        async def recognize(self, data):
+            with lock:
+                peaks.append(held[0])
+                held[0] -= 1
+            calls.append(data)
+            raise RuntimeError("service unavailable")
+
+    monkeypatch.setattr(audio_recognize, "read_sample", fake_sample)
+    monkeypatch.setattr(audio_recognize, "Shazam", DownShazam)
+
+    await audio_recognize.find_and_recognize_audio_files(
+        str(library),
+        delay=0,
+        nbr_retry=2,
+        use_cache=False,
+        rate=0,
+        decode_workers=0,
+    )
+
+    assert len(calls) == 24  # every file was retried once
+    window = 2 * (1 + 1)  # concurrency 1, decode_workers 0 (threads)
+    # samples decoded but not yet sent, in the retry round as well
+    assert max(peaks) <= window
+
+
+def test_backoff_grows_with_jitter():
+    from auto_tag.retry import backoff_delay
+
+    for attempt in range(1, 6):
+        ceiling = 2 * 2 ** (attempt - 1)
+        delays = {backoff_delay(attempt, 2) for _ in range(20)}
+        assert all(ceiling / 2 <= d <= ceiling for d in delays)
+        assert len(delays) > 1
+    assert backoff_delay(30, 2) <= 300
+    assert backoff_delay(3, 0) == 0
+
+
+# -------------------------------------------------
+# Adaptive rate limiter
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_rate_limiter_spaces_calls():
+    from auto_tag.rate_limit import AdaptiveRateLimiter
+
+    limiter = AdaptiveRateLimiter(20.0)
+    start = asyncio.get_running_loop().time()
+    for _ in range(5):
+        await limiter.acquire()
+    # one token of burst, then one call every 1/20 s
+    assert asyncio.get_running_loop().time() - start >= 4 / 20 * 0.9
+
+
+def test_rate_limiter_backs_off_and_recovers():
+    from auto_tag.rate_limit import AdaptiveRateLimiter
+
+    limiter = AdaptiveRateLimiter(4.0)
+    limiter.record_failure(throttled=True)
+    assert limiter.rate == 2.0
+    assert limiter.state()["backoff_level"] == 1
+
+    for _ in range(200):
+        limiter.record_success()
+    assert limiter.rate == 4.0
+    assert limiter.backoff_level == 0 and limiter.backoffs == 1
+
+
+# -------------------------------------------------
+# Cover fetcher downloads each URL once
+# -------------------------------------------------
+def test_cover_fetcher_caches_and_deduplicates(tmp_path, monkeypatch):
+    import threading
+    import time
+
+    from auto_tag.covers import CoverFetcher
+
+    fetcher = CoverFetcher(max_items=2, cache_dir=str(tmp_path / "covers"))
+    requested = []
+
+    def fake_request(scheme, netloc, path):
+        requested.append(path)
+        time.sleep(0.05)  # keep the first download in flight
+        return 200, None, path.encode()
+
+    monkeypatch.setattr(fetcher, "_request", fake_request)
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                fetcher.fetch("https://img.example/a.jpg")
+            )
+        )
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [b"/a.jpg"] * 8
+    assert requested == ["/a.jpg"]
+
+    # evicted from memory, but still served from the disk store
+    fetcher.fetch("https://img.example/b.jpg")
+    fetcher.fetch("https://img.example/c.jpg")
+    assert fetcher.fetch("https://img.example/a.jpg") == b"/a.jpg"
+    assert requested == ["/a.jpg", "/b.jpg", "/c.jpg"]
+    assert fetcher.downloads == 3
+
+
+# -------------------------------------------------
+# MP3 tags and cover are written in one load and one save
+# -------------------------------------------------
+def test_write_tags_mp3_single_load_and_save(tmp_path, monkeypatch):
+    import eyed3
+    from eyed3.id3.tag import Tag
+
+    monkeypatch.setattr(
+        audio_recognize, "update_mp3_tags", real_update_mp3_tags
+    )
+    monkeypatch.setattr(audio_recognize, "fetch_cover", lambda url: b"JPEG")
+    counts = {"load": 0, "save": 0}
+    real_load, real_save = eyed3.load, Tag.save
+
+    def counting_load(*a, **k):
+        counts["load"] += 1
+        return real_load(*a, **k)
+
+    def counting_save(self, *a, **k):
+        counts["save"] += 1
+        return real_save(self, *a, **k)
+
+    monkeypatch.setattr(audio_recognize.eyed3, "load", counting_load)
+    monkeypatch.setattr(Tag, "save", counting_save)
+
+    path = tmp_path / "song.mp3"
+    shutil.copy2(Path(__file__).parent / "fileToTest.mp3", path)
+    audio_recognize.write_tags(
+        str(path), "Title", "Artist", "Album", "https://x/c.jpg", False
+    )
+
+    assert counts == {"load": 1, "save": 1}
+    tag = real_load(str(path)).tag
+    assert (tag.title, tag.artist, tag.album) == ("Title", "Artist", "Album")
+    assert tag.images[0].image_data == b"JPEG"
+
+
+# -------------------------------------------------
+# Retagging fits in the reserved padding
+# -------------------------------------------------
+@pytest.mark.parametrize("ext", test_extensions)
+def test_retag_is_done_in_place(tmp_path, monkeypatch, ext):
+    import numpy as np
+    import soundfile as sf
+
+    monkeypatch.setattr(
+        audio_recognize, "update_mp3_tags", real_update_mp3_tags
+    )
+    monkeypatch.setattr(
+        audio_recognize, "update_ogg_tags", real_update_ogg_tags
+    )
+    monkeypatch.setattr(
+        audio_recognize, "fetch_cover", lambda url: b"\xff" * 100_000
+    )
+    path = tmp_path / f"song.{ext}"
+    if ext == "mp3":
+        shutil.copy2(Path(__file__).parent / "fileToTest.mp3", path)
+    else:
+        noise = np.random.default_rng(0).uniform(-0.3, 0.3, 44100 * 3)
+        sf.write(str(path), noise, 44100, format="OGG", subtype="VORBIS")
+
+    # the first cover does not fit: one full rewrite, with padding
+    assert audio_recognize.write_tags(
+        str(path), "Title", "Artist", "Album", "https://x/c.jpg", False
+    )
+    size = path.stat().st_size
+    assert not audio_recognize.write_tags(
+        str(path), "Other Title", "Artist", "Album", "https://x/c.jpg", False
+    )
+    assert path.stat().st_size == size
+
+
+# -------------------------------------------------
+# Manifest: unchanged files are skipped on the next run
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_manifest_skips_processed_files(tmp_path, monkeypatch):
+    library = tmp_path / "library"
+    library.mkdir()
+    shutil.copy2(Path(__file__).parent / "fileToTest.mp3", library / "a.mp3")
+    calls = []
+
+    class CountingShazam(DummyShazam):
+        async def recognize(self, data):
+            calls.append(data)
+            return await super().recognize(data)
+
+    monkeypatch.setattr(audio_recognize, "Shazam", CountingShazam)
+
+    async def run(**kwargs):
+        calls.clear()
+        await audio_recognize.find_and_recognize_audio_files(
+            str(library),
+            delay=0,
+            nbr_retry=1,
+            use_cache=False,
+            rate=0,
+            **kwargs,
+        )
+        return len(calls)
+
+    assert await run(modify=False) > 0
+    assert not (library / MANIFEST_NAME).exists()  # a dry run only reads
+    assert await run() > 0
+    renamed = library / "Drive My Car - The Beatles - Rubber Soul.mp3"
+    assert renamed.exists()
+
+    assert await run() == 0  # renamed file is recorded as processed
+    assert await run(full_scan=True) > 0
+
+    shutil.copy2(Path(__file__).parent / "fileToTest.mp3", library / "b.mp3")
+    assert await run() > 0  # only the new file
+    assert all("b.mp3" in c for c in calls if isinstance(c, str))
+
+
+# -------------------------------------------------
+# Discovery: recognition starts while the walk is still running
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_recognition_starts_before_walk_ends(tmp_path, monkeypatch):
+    for name in ("a.mp3", "b.mp3"):
+        shutil.copy2(Path(__file__).parent / "fileToTest.mp3", tmp_path / name)
+    started = threading.Event()
+    seen_during_walk = []
+
+    def slow_walk(folder_path, extensions):
+        yield str(tmp_path / "a.mp3")
+        # a walk that has not finished yet: wait for the first recognition
+        seen_during_walk.append(started.wait(timeout=5))
+        yield str(tmp_path / "b.mp3")
+
+    class SignallingShazam(DummyShazam):
+        async def recognize(self, data):
+            started.set()
+            return await super().recognize(data)
+
+    monkeypatch.setattr(discovery, "iter_audio_files", slow_walk)
+    monkeypatch.setattr(audio_recognize, "Shazam", SignallingShazam)
+    await audio_recognize.find_and_recognize_audio_files(
+        str(tmp_path),
+        delay=0,
+        nbr_retry=1,
+        use_cache=False,
+        rate=0,
+        plex_structure=True,
+    )
+
+    assert seen_during_walk == [True]
+    album = tmp_path / "The Beatles" / "Rubber Soul"
+    assert sorted(p.name for p in album.iterdir()) == [
+        "Drive My Car (1).mp3",
+        "Drive My Car.mp3",
+    ]
+
+
+# -------------------------------------------------
+# Pipeline: tag writes run on the tag thread pool
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_tag_writes_run_off_the_event_loop(tmp_path, monkeypatch):
+    library = tmp_path / "library"
+    library.mkdir()
+    src = Path(__file__).parent / "fileToTest.mp3"
+    for i in range(4):
+        (library / f"{i}.mp3").write_bytes(src.read_bytes() + b"\0" * i)
+    loop_thread = threading.get_ident()
+    writers, in_flight, peak = set(), [0], [0]
+    lock = threading.Lock()
+
+    def slow_tags(file_path, *args, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        writers.add(threading.get_ident())
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+        return False
+
+    announcers = set()
+    real_planned = OperationJournal.planned
+
+    def planned(self, *args, **kwargs):
+        # the synced journal record is written off the loop too
+        announcers.add(threading.get_ident())
+        return real_planned(self, *args, **kwargs)
+
+    monkeypatch.setattr(audio_recognize, "update_mp3_tags", slow_tags)
+    monkeypatch.setattr(audio_recognize, "Shazam", DummyShazam)
+    monkeypatch.setattr(OperationJournal, "planned", planned)
+    copy_to = tmp_path / "copies"
+
+    await audio_recognize.find_and_recognize_audio_files(
+        str(library),
+        delay=0,
+        nbr_retry=1,
+        copy_to=str(copy_to),
+        concurrency=4,
+        use_cache=False,
+        rate=0,
+        decode_workers=2,
+        tag_workers=2,
+    )
+
+    assert loop_thread not in writers
+    assert announcers and loop_thread not in announcers
+    assert peak[0] == 2
+    base = "Drive My Car - The Beatles - Rubber Soul"
+    expected = [f"{base}.mp3"] + [f"{base} ({i}).mp3" for i in range(1, 4)]
+    for i, name in enumerate(expected):
+        copied = copy_to / name
+        assert copied.stat().st_size == (library / f"{i}.mp3").stat().st_size
+
+
+# -------------------------------------------------
+# --workers: shards in separate processes, shared destination claims
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_workers_never_claim_the_same_path(tmp_path, monkeypatch):
+    library = tmp_path / "library"
+    library.mkdir()
+    src = Path(__file__).parent / "fileToTest.mp3"
+    for i in range(6):
+        (library / f"{i}.mp3").write_bytes(src.read_bytes() + b"\0" * i)
+    monkeypatch.setattr(audio_recognize, "Shazam", DummyShazam)
+    copy_to = tmp_path / "copies"
+
+    summary = await workers.run_workers(
+        str(library),
+        3,
+        delay=0,
+        nbr_retry=1,
+        copy_to=str(copy_to),
+        use_cache=False,
+        rate=0,
+    )
+
+    assert summary["processed"] == summary["succeeded"] == 6
+    sizes = sorted(p.stat().st_size for p in copy_to.iterdir())
+    assert sizes == sorted(
+        (library / f"{i}.mp3").stat().st_size for i in range(6)
+    )
+
+
+# -------------------------------------------------
+# Signature engine: only signatures are sent, and they are cached
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_signature_engine_reuses_cached_signature(tmp_path, monkeypatch):
+    sent, signed = [], []
+
+    class SignatureShazam:
+        async def send_recognize_request_v2(self, sig):
+            sent.append(sig)
+            if len(sent) == 1:
+                raise asyncio.TimeoutError  # first attempt fails
+            return await DummyShazam().recognize("x.mp3")
+
+    def counting_signature(*args, **kwargs):
+        signed.append(args)
+        return real_signature(*args, **kwargs)
+
+    real_signature = audio_recognize.generate_signature
+    monkeypatch.setattr(
+        audio_recognize, "generate_signature", counting_signature
+    )
+    path = tmp_path / "a.mp3"
+    shutil.copy2(Path(__file__).parent / "fileToTest.mp3", path)
+    cache = RecognitionCache(str(tmp_path / "cache.sqlite"))
+
+    async def recognise():
+        return await audio_recognize.recognize_audio(
+            str(path),
+            shazam=SignatureShazam(),
+            delay=0,
+            nbr_retry=1,
+            trace=False,
+            cache=cache,
+            engine="signature",
+        )
+
+    assert await recognise() is None
+    out = await recognise()  # a retry: the signature comes from the cache
+    cache.close()
+
+    assert out["track"]["title"] == "Drive My Car"
+    assert len(signed) == 1
+    assert sent[0].uri == sent[1].uri
+    assert sent[1].signature.samples == 12000
+
+
+# -------------------------------------------------
+# Duplicate audio: one recognition per group of identical files
+# -------------------------------------------------
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["share", "skip"])
+async def test_duplicates_are_recognised_once(tmp_path, monkeypatch, mode):
+    library = tmp_path / "library"
+    (library / "copies").mkdir(parents=True)
+    src = Path(__file__).parent / "fileToTest.mp3"
+    shutil.copy2(src, library / "a.mp3")
+    (library / "b.mp3").write_bytes(src.read_bytes() + b"\0")
+    # the same audio as a.mp3 under other tags
+    shutil.copy2(src, library / "copies" / "a copy.mp3")
+    eyed3.load(str(library / "copies" / "a copy.mp3")).tag.save(
+        version=eyed3.id3.ID3_V2_3
+    )
+    calls = []
+
+    class CountingShazam(DummyShazam):
+        async def recognize(self, data):
+            if isinstance(data, str):
+                calls.append(os.path.basename(data))
+            return await super().recognize(data)
+
+    monkeypatch.setattr(audio_recognize, "Shazam", CountingShazam)
+    copy_to = tmp_path / "out"
+
+    summary = await audio_recognize.find_and_recognize_audio_files(
+        str(library),
+        delay=0,
+        nbr_retry=1,
+        copy_to=str(copy_to),
+        use_cache=False,
+        rate=0,
+        sample_seconds=0,
+        duplicates=mode,
+    )
+
+    assert sorted(calls) == ["a.mp3", "b.mp3"]
+    assert summary["duplicates"] == 1
+    copied = len(list(copy_to.iterdir()))
+    assert copied == (3 if mode == "share" else 2)
+    assert summary["succeeded"] == copied
+
+
+# -------------------------------------------------
+# Destination index: unique names without probing the disk
+# -------------------------------------------------
+def test_destination_index_allocates_from_memory(tmp_path, monkeypatch):
+    (tmp_path / "Song.mp3").write_bytes(b"")
+    (tmp_path / "Song (1).mp3").write_bytes(b"")
+    (tmp_path / "Other.mp3").write_bytes(b"")
+    # a one-off name is probed on disk, without listing the folder
+    song = str(tmp_path / "Song.mp3")
+    assert first_free(song) == str(tmp_path / "Song (2).mp3")
+    assert first_free(song, source=song) == song
+
+    index = DestinationIndex()
+    scans = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(
+        os, "scandir", lambda p: scans.append(p) or real_scandir(p)
+    )
+    monkeypatch.setattr(os.path, "exists", None)  # must not be probed
+
+    names = [os.path.basename(index.allocate(song)) for _ in range(3)]
+    assert names == ["Song (2).mp3", "Song (3).mp3", "Song (4).mp3"]
+    other = str(tmp_path / "Other.mp3")
+    assert index.allocate(other, source=other) == other  # already in place
+    assert len(scans) == 1
+
+    index.release(song)
+    assert index.allocate(song) == song
+
+    # threads allocating the same name all get a different one
+    fresh = DestinationIndex()
+    with ThreadPoolExecutor(8) as pool:
+        got = list(pool.map(lambda _: fresh.allocate(song), range(200)))
+    assert len(set(got)) == 200
+
+
+# -------------------------------------------------
+# Journal: resume an interrupted run, then roll its moves back
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_resume_and_rollback_from_journal(tmp_path, monkeypatch):
+    library = tmp_path / "library"
+    library.mkdir()
+    src = Path(__file__).parent / "fileToTest.mp3"
+    for i, name in enumerate(("a.mp3", "b.mp3", "c.mp3")):
+        (library / name).write_bytes(src.read_bytes() + b"\0" * i)
+    c_file = library / "c.mp3"
+    (tmp_path / "c.mp3").write_bytes(c_file.read_bytes())
+    c_file.unlink()  # c only joins the library after the first run
+    calls, tagged = [], []
+
+    class CountingShazam(DummyShazam):
+        async def recognize(self, data):
+            if isinstance(data, str):
+                calls.append(os.path.basename(data))
+            return await super().recognize(data)
+
+    def flaky_tags(file_path, *args, **kwargs):
+        tagged.append(os.path.basename(file_path))
+        if tagged == ["Drive My Car - The Beatles - Rubber Soul.mp3"]:
+            raise OSError("disk gone")  # the run "dies" after this move
+
+    monkeypatch.setattr(audio_recognize, "Shazam", CountingShazam)
+    monkeypatch.setattr(audio_recognize, "update_mp3_tags", flaky_tags)
+    options = dict(
+        delay=0, nbr_retry=1, use_cache=False, rate=0, sample_seconds=0
+    )
+
+    await audio_recognize.find_and_recognize_audio_files(
+        str(library), tag_workers=1, **options
+    )
+    assert sorted(calls) == ["a.mp3", "b.mp3"]
+
+    # c was recognised before the crash, but never moved
+    (tmp_path / "c.mp3").rename(c_file)
+    answer = await DummyShazam().recognize("c.mp3")
+    journal = OperationJournal(journal_path(str(library)))
+    journal.recognized(str(c_file), answer)
+    journal.close()
+
+    calls.clear()
+    summary = await audio_recognize.find_and_recognize_audio_files(
+        str(library), resume=True, **options
+    )
+    assert calls == []  # answers come from the journal
+    assert summary["resumed"] == 1 and summary["processed"] == 1
+    assert tagged.count("Drive My Car - The Beatles - Rubber Soul.mp3") == 2
+
+    restored, kept = rollback(str(library))
+    assert (restored, kept) == (3, [])
+    names = sorted(p.name for p in library.iterdir() if p.suffix == ".mp3")
+    assert names == ["a.mp3", "b.mp3", "c.mp3"]
+
+
+# -------------------------------------------------
+# --plan / --apply-plan: recognise now, apply later
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_plan_then_apply_without_shazam(tmp_path, monkeypatch):
+    library = tmp_path / "library"
+    library.mkdir()
+    src = Path(__file__).parent / "fileToTest.mp3"
+    for i, name in enumerate(("a.mp3", "b.mp3")):
+        (library / name).write_bytes(src.read_bytes() + b"\0" * i)
+    monkeypatch.setattr(audio_recognize, "Shazam", DummyShazam)
+    plan = tmp_path / "plan.jsonl"
+
+    await audio_recognize.find_and_recognize_audio_files(
+        str(library),
+        delay=0,
+        nbr_retry=1,
+        use_cache=False,
+        rate=0,
+        plex_structure=True,
+        plan=str(plan),
+    )
+    # nothing moved yet, and both destinations are planned apart
+    assert (library / "a.mp3").exists() and (library / "b.mp3").exists()
+    lines = plan.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 3  # header + one line per file
+
+    class NoShazam:
+        def __init__(self):
+            raise AssertionError("apply_plan must not call Shazam")
+
+    monkeypatch.setattr(audio_recognize, "Shazam", NoShazam)
+    summary = await audio_recognize.apply_plan(str(plan))
+
+    assert summary["succeeded"] == 2
+    album = library / "The Beatles" / "Rubber Soul"
+    assert sorted(p.name for p in album.iterdir()) == [
+        "Drive My Car (1).mp3",
+        "Drive My Car.mp3",
+    ]
+    assert not (library / "a.mp3").exists()
+
+
+# -------------------------------------------------
+# Startup: --help and the GUI load no recognition stack
+# -------------------------------------------------
+HEAVY_MODULES = (
+    "eyed3",
+    "mutagen",
+    "numpy",
+    "shazamio",
+    "shazamio_core",
+    "soundfile",
+    "tqdm",
+)
+# wall time of a `main.py --help` process, interpreter start included
+STARTUP_BUDGET = 2.0
+
+
+def _loaded_after(code: str) -> list[str]:
+    probe = (
+        f"import sys\n{code}\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules),"
+        " file=sys.stderr)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", probe],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    return [m for m in out.strip().split(",") if m]
+
+
+def test_cli_help_is_fast_and_loads_no_recognition_modules():
+    code = (
+        "import runpy\n"
+        "sys.argv = ['main.py', '--help']\n"
+        "try:\n"
+        "    runpy.run_path('main.py', run_name='__main__')\n"
+        "except SystemExit:\n"
+        "    pass"
+    )
+    start = time.perf_counter()
+    assert _loaded_after(code) == []
+    assert time.perf_counter() - start < STARTUP_BUDGET
+
+
+def test_gui_module_defers_recognition_imports():
+    pytest.importorskip("tkinter")
+    assert _loaded_after("import auto_tag.gui") == []
+
+
+# -------------------------------------------------
+# GUI apply: worker pool, per-file errors, cancellation
+# -------------------------------------------------
+def _gui_rows(library: Path, count: int) -> list[dict]:
+    src = Path(__file__).parent / "fileToTest.mp3"
+    rows = []
+    for i in range(count):
+        path = library / f"track{i}.mp3"
+        shutil.copy(src, path)
+        rows.append(
+            {
+                "file_path": str(path),
+                "new_file_path": str(library / f"Song {i}.mp3"),
+                "title": f"Song {i}",
+                "author": "Artist",
+                "album": "Album",
+                "apply": True,
+            }
+        )
+    return rows
+
+
+def test_gui_apply_collects_errors_per_file(tmp_path, monkeypatch):
+    gui = pytest.importorskip("auto_tag.gui")
+    rows = _gui_rows(tmp_path, 3)
+    real_write_tags = audio_recognize.write_tags
+
+    def flaky_write_tags(path, title, *args, **kwargs):
+        if title == "Song 1":
+            raise OSError("disk full")
+        return real_write_tags(path, title, *args, **kwargs)
+
+    monkeypatch.setattr(audio_recognize, "write_tags", flaky_write_tags)
+    seen = []
+    report = gui.apply_results(
+        rows,
+        plex=False,
+        copy_to=None,
+        directory=str(tmp_path),
+        cancel=threading.Event(),
+        progress=seen.append,
+        workers=2,
+    )
+
+    assert report.done == 3 and not report.cancelled
+    assert len(report.errors) == 1 and "disk full" in report.errors[0]
+    assert seen == [1, 2, 3]
+    assert (tmp_path / "Song 0.mp3").exists()
+    assert (tmp_path / "Song 2.mp3").exists()
+
+
+def test_gui_apply_stops_when_cancelled(tmp_path):
+    gui = pytest.importorskip("auto_tag.gui")
+    rows = _gui_rows(tmp_path, 6)
+    cancel = threading.Event()
+
+    report = gui.apply_results(
+        rows,
+        plex=False,
+        copy_to=None,
+        directory=str(tmp_path),
+        cancel=cancel,
+        progress=lambda done: cancel.set(),
+        workers=1,
+    )
+
+    assert report.cancelled
+    moved = sorted(p.name for p in tmp_path.glob("Song *.mp3"))
+    assert 1 <= len(moved) < len(rows)
+    assert report.done == len(moved)
+
+
+# -------------------------------------------------
+# Results table model: streamed rows, bulk check, sort, window
+# -------------------------------------------------
+def test_results_model_streams_sorts_and_checks_in_bulk():
+    from auto_tag.results import ResultsModel
+
+    model = ResultsModel()
+    model.append({"file_path": "/m/b.mp3", "new_file_path": "/m/Z.mp3"})
+    model.append({"file_path": "/m/a.mp3", "new_file_path": "/m/Y.mp3"})
+    assert len(model) == 0  # queued until the Tk thread drains them
+    assert model.drain() == 2 and len(model) == 2
+
+    rows = [
+        {"file_path": f"/m/{i:06d}.mp3", "new_file_path": f"/m/{i}.mp3"}
+        for i in range(100_000)
+    ]
+    for res in rows:
+        model.append(res)
+    model.drain()
+
+    start = time.perf_counter()
+    model.set_all(True)
+    model.sort("old")
+    assert time.perf_counter() - start < 1.0
+    assert len(model.checked()) == len(model)
+    assert [ResultsModel.values(r)[1] for r in model.window(0, 2)] == [
+        "000000.mp3",
+        "000001.mp3",
+    ]
+
+    model.sort("old")  # again: descending
+    assert ResultsModel.values(model[0])[1] == "b.mp3"
+    assert len(model.window(len(model) - 5, 20)) == 5
+
+    assert model.toggle(0) is False
+    model.rename(0, "Renamed.mp3")
+    assert model[0]["new_file_path"] == os.path.join("/m", "Renamed.mp3")
+
+
+# -------------------------------------------------
+# --watch: debounced processing of dropped files
+# -------------------------------------------------
+def test_debouncer_waits_for_files_to_stop_growing(tmp_path):
+    from auto_tag.watch import Debouncer
+
+    path = tmp_path / "drop.mp3"
+    path.write_bytes(b"x")
+    debouncer = Debouncer(settle=1.0)
+    debouncer.touch(str(path), now=0.0)
+    assert debouncer.ready(now=0.5) == []
+    path.write_bytes(b"xx")  # still being written
+    assert debouncer.ready(now=1.2) == []
+    assert debouncer.ready(now=2.0) == []
+    assert debouncer.ready(now=2.3) == [str(path)]
+    assert len(debouncer) == 0
+
+
+@pytest.mark.asyncio
+async def test_watch_processes_dropped_files(tmp_path, monkeypatch):
+    from auto_tag import watch
+
+    library = tmp_path / "library"
+    library.mkdir()
+    monkeypatch.setattr(audio_recognize, "Shazam", DummyShazam)
+    monkeypatch.setattr(watch, "POLL_INTERVAL", 0.1)
+    calls, sessions = [], set()
+    real_find = watch.find_and_recognize_audio_files
+
+    async def counting_find(folder_path, **options):
+        calls.append(options.get("files"))
+        sessions.add(options.get("session"))
+        return await real_find(folder_path, **options)
+
+    monkeypatch.setattr(watch, "find_and_recognize_audio_files", counting_find)
+    stop = asyncio.Event()
+    task = asyncio.create_task(
+        watch.watch_folder(
+            str(library),
+            poll=True,
+            settle=0.2,
+            stop=stop,
+            delay=0,
+            nbr_retry=1,
+            use_cache=False,
+            rate=0,
+            decode_workers=0,
+        )
+    )
+    await asyncio.sleep(0.3)  # first pass over the empty folder
+    shutil.copy(Path(__file__).parent / "fileToTest.mp3", library / "a.mp3")
+
+    renamed = library / "Drive My Car - The Beatles - Rubber Soul.mp3"
+    for _ in range(100):
+        if renamed.exists():
+            break
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.6)  # the renamed file is not processed again
+    stop.set()
+    await asyncio.wait_for(task, 5)
+
+    assert renamed.exists() and not (library / "a.mp3").exists()
+    assert calls == [None, [str(library / "a.mp3")]]
+    # one session (Shazam client, limiter, pool, journal) for every batch
+    assert len(sessions) == 1 and None not in sessions
+    assert rollback(str(library)) == (1, [])
+    assert (library / "a.mp3").exists()
+
+
+# -------------------------------------------------
+# --queue: leases shared by several workers
+# -------------------------------------------------
+def test_job_queue_leases_expire_and_are_reclaimed(tmp_path):
+    from auto_tag.job_queue import JobQueue
+
+    library = tmp_path / "library"
+    paths = [str(library / f"{name}.mp3") for name in ("a", "b")]
+    first = JobQueue(str(tmp_path / "jobs.sqlite"), str(library))
+    second = JobQueue(
+        str(tmp_path / "jobs.sqlite"), str(library), lease_seconds=0.2
+    )
+    assert first.enqueue(paths) == 2
+    assert second.enqueue(paths) == 0  # every worker seeds; no duplicates
+
+    first.lease_seconds = 0.2
+    assert first.lease("A") == [paths[0]]
+    assert second.lease("B") == [paths[1]]
+    assert second.lease("B") == []  # a is leased by A
+
+    time.sleep(0.3)  # A crashed: its lease expires
+    assert second.heartbeat("B") == 0  # B's lease expired too
+    assert second.lease("B", limit=2) == paths
+    assert not first.complete("A", paths[0], {"file_path": paths[0]})
+    assert second.complete("B", paths[0], {"file_path": paths[0]})
+    assert second.counts() == {"done": 1, "leased": 1}
+
+    assert first.reserve("A", str(library / "Song.mp3"))
+    assert not second.reserve("B", str(library / "Song.mp3"))
+    # files a worker produced are not queued as new work
+    assert first.enqueue([str(library / "Song.mp3")]) == 0
+    first.close()
+    second.close()
+
+
+def test_job_queue_backs_off_failed_jobs(tmp_path):
+    from auto_tag.job_queue import JobQueue
+
+    path = str(tmp_path / "library" / "a.mp3")
+    queue = JobQueue(
+        str(tmp_path / "jobs.sqlite"),
+        str(tmp_path / "library"),
+        retry_delay=0.2,
+    )
+    queue.enqueue([path])
+    assert queue.lease("A") == [path]
+    assert queue.fail("A", path, {"error": "No match"}) == "pending"
+    # the first backoff lasts between 0.1 and 0.2 seconds
+    assert queue.lease("A") == []
+    time.sleep(0.25)
+    assert queue.lease("A") == [path]
+    queue.close()
+
+
+@pytest.mark.asyncio
+async def test_queue_workers_process_each_file_once(tmp_path, monkeypatch):
+    from auto_tag import job_queue
+
+    library = tmp_path / "library"
+    library.mkdir()
+    src = Path(__file__).parent / "fileToTest.mp3"
+    for i in range(4):
+        shutil.copy(src, library / f"track{i}.mp3")
+
+    calls = []
+
+    class CountingShazam(DummyShazam):
+        async def recognize(self, data):
+            calls.append(data)
+            await asyncio.sleep(0.01)
+            return await super().recognize("sample.mp3")
+
+    monkeypatch.setattr(job_queue, "Shazam", CountingShazam)
+    queue = str(tmp_path / "jobs.sqlite")
+    summaries = await asyncio.gather(
+        *(
+            job_queue.run_queue_worker(
+                str(library),
+                queue,
+                owner=owner,
+                delay=0,
+                nbr_retry=1,
+                use_cache=False,
+                rate=0,
+            )
+            for owner in ("host-a", "host-b")
+        )
+    )
+
+    assert sum(s["completed"] for s in summaries) == 4
+    assert len(calls) == 4
+    names = sorted(p.name for p in library.glob("*.mp3"))
+    base = "Drive My Car - The Beatles - Rubber Soul"
+    assert names == sorted(
+        [f"{base}.mp3"] + [f"{base} ({i}).mp3" for i in (1, 2, 3)]
+    )
+
+
+@pytest.mark.asyncio
+async def test_queue_worker_frees_names_of_failed_moves(tmp_path, monkeypatch):
+    import sqlite3
+
+    from auto_tag import job_queue
+
+    library = tmp_path / "library"
+    library.mkdir()
+    shutil.copy(Path(__file__).parent / "fileToTest.mp3", library / "a.mp3")
+    monkeypatch.setattr(job_queue, "Shazam", DummyShazam)
+    monkeypatch.setattr(
+        job_queue,
+        "apply_rename",
+        lambda res, **kw: {"file_path": res["file_path"], "error": "Busy"},
+    )
+    queue = str(tmp_path / "jobs.sqlite")
+    summary = await job_queue.run_queue_worker(
+        str(library), queue, owner="A", delay=0, use_cache=False, rate=0
+    )
+
+    assert summary["failed"] == 1
+    db = sqlite3.connect(queue)
+    assert db.execute("SELECT COUNT(*) FROM names").fetchone() == (0,)
+    db.close()
+    # another worker can take the name
+    jobs = job_queue.JobQueue(queue, str(library))
+    base = "Drive My Car - The Beatles - Rubber Soul.mp3"
+    assert jobs.reserve("B", str(library / base))
+    jobs.close()
+
+
+@pytest.mark.parametrize(
+    "option", [["--concurrency", "4"], ["--modify", "false"]]
+)
+def test_queue_rejects_options_it_does_not_support(tmp_path, option):
+    out = subprocess.run(
+        [
+            sys.executable,
+            "main.py",
+            "--gui",
+            "false",
+            "--queue",
+            str(tmp_path / "jobs.sqlite"),
+            *option,
+        ],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+    )
+    assert out.returncode == 2
+    assert option[0] in out.stderr
+    assert not (tmp_path / "jobs.sqlite").exists()
+
+
+# -------------------------------------------------
+# Per-stage metrics: JSON summary and Prometheus text
+# -------------------------------------------------
+@pytest.mark.asyncio
+async def test_metrics_time_every_stage(tmp_path, monkeypatch):
+    import json
+
+    from auto_tag import metrics
+
+    library = tmp_path / "library"
+    library.mkdir()
+    src = Path(__file__).parent / "fileToTest.mp3"
+    for i, name in enumerate(("a.mp3", "b.mp3")):
+        (library / name).write_bytes(src.read_bytes() + b"\0" * i)
+
+    class SlowShazam(DummyShazam):
+        async def recognize(self, data):
+            await asyncio.sleep(0.05)
+            return await super().recognize(data)
+
+    monkeypatch.setattr(audio_recognize, "Shazam", SlowShazam)
+    collector = metrics.Metrics(
+        json_path=str(tmp_path / "metrics.json"),
+        prom_path=str(tmp_path / "metrics.prom"),
+    )
+    metrics.set_metrics(collector)
+    try:
+        await audio_recognize.find_and_recognize_audio_files(
+            str(library),
+            delay=0,
+            nbr_retry=1,
+            use_cache=False,
+            rate=0,
+            decode_workers=0,
+        )
+    finally:
+        metrics.set_metrics(None)
+    collector.export()
+
+    summary = json.loads((tmp_path / "metrics.json").read_text())
+    assert summary["counters"]["files_ok"] == 2
+    for stage in ("discovery", "hash", "shazam", "move", "tag_write"):
+        assert summary["stages"][stage]["count"] >= 2, stage
+    assert summary["stages"]["total"]["count"] == 2
+    assert len(summary["files"]) == 2
+    assert {"shazam", "move", "total"} <= set(summary["files"][0]["stages"])
+    # with one slot the second file queues for it; that wait is not
+    # counted as Shazam's time
+    assert summary["stages"]["shazam_queue"]["max"] >= 0.04
+    assert summary["stages"]["shazam"]["max"] < 0.09
+    assert summary["stages"]["decode_queue"]["count"] >= 2
+
+    prom = (tmp_path / "metrics.prom").read_text()
+    assert 'auto_tag_stage_seconds_count{stage="total"} 2' in prom
+    assert 'auto_tag_stage_seconds_bucket{stage="move",le="+Inf"}' in prom
+    assert "auto_tag_files_ok_total 2" in prom
+
+
+# -------------------------------------------------
+# Benchmark harness: synthetic library, Shazam stub, JSON result
+# -------------------------------------------------
+def test_benchmark_reports_throughput_and_flags_regressions(tmp_path):
+    from benchmarks.bench_pipeline import compare, run_benchmark
+
+    result = run_benchmark(
+        files=4,
+        formats=("mp3", "ogg"),
+        lengths=(2.0,),
+        failure_rate=0.5,
+        failure="empty",
+        seed=1,
+        work_dir=str(tmp_path / "bench"),
+        nbr_retry=5,
+        decode_workers=0,
+    )
+
+    run = result["runs"][0]
+    assert run["summary"]["succeeded"] == 4
+    # unique copies: no file was recognised as a duplicate of another
+    assert run["summary"]["duplicates"] == 0
+    assert run["shazam_failures"] > 0
+    assert result["files_per_second"] > 0
+    assert {"hash", "decode", "shazam", "tag_write", "move"} <= set(
+        run["stages"]
+    )
+    assert compare(result, result, 0.1) == []
+    slower = dict(result, files_per_second=result["files_per_second"] / 2)
+    assert compare(slower, result, 0.1)